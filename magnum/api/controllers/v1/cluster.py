@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from urllib import parse
 import uuid
 
 from oslo_log import log as logging
@@ -46,6 +47,17 @@ LOG = logging.getLogger(__name__)
 CONF = magnum.conf.CONF
 
 
+def _etag_state(cluster, nodegroups):
+    """Return the version of a cluster and its nodegroups, for its ETag.
+
+    Saves bump the generation of the rows. The health sync writes the
+    health of the clusters without it, so the health is part of the state.
+    """
+    return [cluster.uuid, cluster.updated_at, cluster.generation,
+            cluster.health_status, cluster.health_status_reason,
+            sorted((ng.uuid, ng.generation) for ng in nodegroups)]
+
+
 class ClusterID(wtypes.Base):
     """API representation of a cluster ID
 
@@ -234,8 +246,10 @@ class Cluster(base.APIBase):
         return cluster
 
     @classmethod
-    def convert_with_links(cls, rpc_cluster, expand=True):
-        cluster = Cluster(**rpc_cluster.as_dict())
+    def convert_with_links(cls, rpc_cluster, expand=True, cluster_dict=None):
+        if cluster_dict is None:
+            cluster_dict = rpc_cluster.as_dict()
+        cluster = Cluster(**cluster_dict)
         parent_labels = rpc_cluster.cluster_template.labels
         use_cluster_id = pecan.request.version.minor >= 13
         return cls._convert_with_links(
@@ -283,7 +297,8 @@ class ClusterPatchType(types.JsonPatchType):
         internal_attrs = ['/api_address', '/node_addresses',
                           '/master_addresses', '/stack_id', '/cluster_id',
                           '/ca_cert_ref', '/magnum_cert_ref',
-                          '/etcd_ca_cert_ref', '/front_proxy_ca_cert_ref']
+                          '/etcd_ca_cert_ref', '/front_proxy_ca_cert_ref',
+                          '/generation']
         return types.JsonPatchType.internal_attrs() + internal_attrs
 
 
@@ -317,6 +332,10 @@ class ClusterCollection(collection.Collection):
             tid = rpc_cluster.cluster_template_id
             if tid and tid in template_cache:
                 rpc_cluster.cluster_template = template_cache[tid]
+        # Likewise load the nodegroups of the whole page with one query
+        # rather than one per cluster in Cluster.as_dict().
+        objects.Cluster.prefetch_nodegroups(pecan.request.context,
+                                            rpc_clusters, use_replica=True)
 
         collection.clusters = [Cluster.convert_with_links(p, expand)
                                for p in rpc_clusters]
@@ -356,7 +375,8 @@ class ClustersController(base.Controller):
 
     def _get_clusters_collection(self, marker, limit,
                                  sort_key, sort_dir, expand=False,
-                                 resource_url=None):
+                                 resource_url=None, filters=None,
+                                 filter_args=None):
 
         context = pecan.request.context
         if context.is_admin:
@@ -385,16 +405,55 @@ class ClustersController(base.Controller):
 
         clusters = objects.Cluster.list(pecan.request.context, limit,
                                         marker_obj, sort_key=sort_key,
-                                        sort_dir=sort_dir)
+                                        sort_dir=sort_dir, filters=filters,
+                                        use_replica=True)
 
+        nodegroups = objects.Cluster.prefetch_nodegroups(context, clusters,
+                                                         use_replica=True)
+        if api_utils.etag_matches([_etag_state(c, nodegroups[c.uuid])
+                                   for c in clusters]):
+            return api_utils.not_modified()
+
+        # the next page keeps the filters
         return ClusterCollection.convert_with_links(clusters, limit,
                                                     url=resource_url,
                                                     expand=expand,
                                                     sort_key=sort_key,
-                                                    sort_dir=sort_dir)
+                                                    sort_dir=sort_dir,
+                                                    **(filter_args or {}))
+
+    @staticmethod
+    def _get_filters(status=None, name=None, cluster_template_id=None,
+                     project_id=None, node_count=None, master_count=None,
+                     labels=None):
+        """Return the filters of a listing and their query arguments."""
+        filter_args = {'status': status, 'name': name,
+                       'cluster_template_id': cluster_template_id,
+                       'project_id': project_id, 'node_count': node_count,
+                       'master_count': master_count, 'labels': labels}
+        filter_args = {key: value for key, value in filter_args.items()
+                       if value is not None}
+
+        filters = dict(filter_args)
+        if status is not None:
+            filters['status'] = [s.strip() for s in status.split(',')]
+            for s in filters['status']:
+                if s not in fields.ClusterStatus.ALL:
+                    raise wsme.exc.ClientSideError(
+                        _("Invalid cluster status: %(status)s. Acceptable "
+                          "values are %(values)s") %
+                        {'status': s,
+                         'values': ', '.join(fields.ClusterStatus.ALL)})
+        if labels is not None:
+            filters['labels'] = api_utils.validate_label_selector(labels)
+
+        filter_args = {key: parse.quote(str(value), safe='')
+                       for key, value in filter_args.items()}
+        return filters, filter_args
 
     nodegroups = nodegroup.NodeGroupController()
 
+    @base.Controller.api_version("1.1", "1.14")
     @expose.expose(ClusterCollection, types.uuid, int, wtypes.text,
                    wtypes.text)
     def get_all(self, marker=None, limit=None, sort_key='id',
@@ -406,12 +465,49 @@ class ClustersController(base.Controller):
         :param sort_key: column to sort results by. Default: id.
         :param sort_dir: direction to sort. "asc" or "desc". Default: asc.
         """
+        return self._get_all(marker, limit, sort_key, sort_dir)
+
+    @base.Controller.api_version("1.15")  # noqa
+    @expose.expose(ClusterCollection, types.uuid, int, wtypes.text,
+                   wtypes.text, wtypes.text, wtypes.text, types.uuid,
+                   wtypes.text, int, int, wtypes.text)
+    def get_all(self, marker=None, limit=None, sort_key='id',  # noqa
+                sort_dir='asc', status=None, name=None,
+                cluster_template_id=None, project_id=None, node_count=None,
+                master_count=None, labels=None):
+        """Retrieve a list of clusters.
+
+        :param marker: pagination marker for large data sets.
+        :param limit: maximum number of resources to return in a single result.
+        :param sort_key: column to sort results by. Default: id.
+        :param sort_dir: direction to sort. "asc" or "desc". Default: asc.
+        :param status: list the clusters with one of these statuses,
+                       separated by commas.
+        :param name: list the clusters with this name.
+        :param cluster_template_id: list the clusters of this
+                                    ClusterTemplate.
+        :param project_id: list the clusters of this project.
+        :param node_count: list the clusters with this number of nodes.
+        :param master_count: list the clusters with this number of masters.
+        :param labels: list the clusters with these labels, key=value pairs
+                       separated by commas.
+        """
+        filters, filter_args = self._get_filters(
+            status, name, cluster_template_id, project_id, node_count,
+            master_count, labels)
+        return self._get_all(marker, limit, sort_key, sort_dir, filters,
+                             filter_args)
+
+    def _get_all(self, marker, limit, sort_key, sort_dir, filters=None,
+                 filter_args=None):
         context = pecan.request.context
         policy.enforce(context, 'cluster:get_all',
                        action='cluster:get_all')
         return self._get_clusters_collection(marker, limit, sort_key,
-                                             sort_dir)
+                                             sort_dir, filters=filters,
+                                             filter_args=filter_args)
 
+    @base.Controller.api_version("1.1", "1.14")
     @expose.expose(ClusterCollection, types.uuid, int, wtypes.text,
                    wtypes.text)
     def detail(self, marker=None, limit=None, sort_key='id',
@@ -423,6 +519,41 @@ class ClustersController(base.Controller):
         :param sort_key: column to sort results by. Default: id.
         :param sort_dir: direction to sort. "asc" or "desc". Default: asc.
         """
+        return self._detail(marker, limit, sort_key, sort_dir)
+
+    @base.Controller.api_version("1.15")  # noqa
+    @expose.expose(ClusterCollection, types.uuid, int, wtypes.text,
+                   wtypes.text, wtypes.text, wtypes.text, types.uuid,
+                   wtypes.text, int, int, wtypes.text)
+    def detail(self, marker=None, limit=None, sort_key='id',  # noqa
+               sort_dir='asc', status=None, name=None,
+               cluster_template_id=None, project_id=None, node_count=None,
+               master_count=None, labels=None):
+        """Retrieve a list of clusters with detail.
+
+        :param marker: pagination marker for large data sets.
+        :param limit: maximum number of resources to return in a single result.
+        :param sort_key: column to sort results by. Default: id.
+        :param sort_dir: direction to sort. "asc" or "desc". Default: asc.
+        :param status: list the clusters with one of these statuses,
+                       separated by commas.
+        :param name: list the clusters with this name.
+        :param cluster_template_id: list the clusters of this
+                                    ClusterTemplate.
+        :param project_id: list the clusters of this project.
+        :param node_count: list the clusters with this number of nodes.
+        :param master_count: list the clusters with this number of masters.
+        :param labels: list the clusters with these labels, key=value pairs
+                       separated by commas.
+        """
+        filters, filter_args = self._get_filters(
+            status, name, cluster_template_id, project_id, node_count,
+            master_count, labels)
+        return self._detail(marker, limit, sort_key, sort_dir, filters,
+                            filter_args)
+
+    def _detail(self, marker, limit, sort_key, sort_dir, filters=None,
+                filter_args=None):
         context = pecan.request.context
         policy.enforce(context, 'cluster:detail',
                        action='cluster:detail')
@@ -436,16 +567,16 @@ class ClustersController(base.Controller):
         resource_url = '/'.join(['clusters', 'detail'])
         return self._get_clusters_collection(marker, limit,
                                              sort_key, sort_dir, expand,
-                                             resource_url)
+                                             resource_url, filters=filters,
+                                             filter_args=filter_args)
 
-    def _collect_fault_info(self, context, cluster):
-        """Collect fault info from heat resources of given cluster
+    def _collect_fault_info(self, context, nodegroups):
+        """Collect fault info from the nodegroups of a cluster
 
         and store them into cluster.faults.
         """
-        # Gather fault info from the cluster nodegroups.
         return {
-            ng.name: ng.status_reason for ng in cluster.nodegroups
+            ng.name: ng.status_reason for ng in nodegroups
             if ng.status.endswith('FAILED')
         }
 
@@ -469,36 +600,26 @@ class ClustersController(base.Controller):
             context.all_tenants = True
 
         cluster = api_utils.get_resource('Cluster', cluster_ident)
-        # Compute as_dict() once and reuse it for policy enforcement.
+        nodegroups = objects.Cluster.prefetch_nodegroups(
+            context, [cluster])[cluster.uuid]
+        # Compute as_dict() once and reuse it for policy enforcement and
+        # the response.
         cluster_dict = cluster.as_dict()
         policy.enforce(context, 'cluster:get', cluster_dict,
                        action='cluster:get')
 
-        api_cluster = Cluster.convert_with_links(cluster)
+        # the nodegroups carry the faults of the cluster
+        if api_utils.etag_matches(_etag_state(cluster, nodegroups)):
+            return api_utils.not_modified()
+
+        api_cluster = Cluster.convert_with_links(cluster,
+                                                 cluster_dict=cluster_dict)
 
         if api_cluster.status in fields.ClusterStatus.STATUS_FAILED:
-            api_cluster.faults = self._collect_fault_info(context, cluster)
+            api_cluster.faults = self._collect_fault_info(context, nodegroups)
 
         return api_cluster
 
-    def _check_cluster_quota_limit(self, context):
-        try:
-            # Check if there is any explicit quota limit set in Quotas table
-            quota = objects.Quota.get_quota_by_project_id_resource(
-                context,
-                context.project_id,
-                'Cluster')
-            cluster_limit = quota.hard_limit
-        except exception.QuotaNotFound:
-            # If explicit quota was not set for the project, use default limit
-            cluster_limit = CONF.quotas.max_clusters_per_project
-
-        if objects.Cluster.get_count_all(context) >= cluster_limit:
-            msg = _("You have reached the maximum clusters per project, "
-                    "%d. You may delete a cluster to make room for a new "
-                    "one.") % cluster_limit
-            raise exception.ResourceLimitExceeded(msg=msg)
-
     @base.Controller.api_version("1.1", "1.9")
     @expose.expose(ClusterID, body=Cluster, status_code=202)
     @validation.ct_not_found_to_bad_request()
@@ -527,8 +648,6 @@ class ClustersController(base.Controller):
         policy.enforce(context, 'cluster:create',
                        action='cluster:create')
 
-        self._check_cluster_quota_limit(context)
-
         temp_id = cluster.cluster_template_id
         cluster_template = objects.ClusterTemplate.get(context, temp_id)
         if cluster_template.hidden and not context.is_admin:
@@ -604,9 +723,13 @@ class ClustersController(base.Controller):
         master_count = cluster_dict.pop('master_count')
         new_cluster = objects.Cluster(context, **cluster_dict)
         new_cluster.uuid = uuid.uuid4()
-        pecan.request.rpcapi.cluster_create_async(new_cluster,
-                                                  master_count, node_count,
-                                                  cluster.create_timeout)
+        # released by the conductor once the cluster is created or failed
+        with api_utils.quota_reservation(
+                context, context.project_id, new_cluster.uuid, clusters=1,
+                nodes=master_count + node_count) as reservation_id:
+            pecan.request.rpcapi.cluster_create_async(
+                new_cluster, master_count, node_count,
+                cluster.create_timeout, reservation_id=reservation_id)
 
         return ClusterID(new_cluster.uuid)
 
@@ -625,9 +748,10 @@ class ClustersController(base.Controller):
          health_status_reason) = self._patch(cluster_ident, patch)
         if node_count == 0:
             raise exception.ZeroNodeCountNotSupported()
-        pecan.request.rpcapi.cluster_update_async(cluster, node_count,
-                                                  health_status,
-                                                  health_status_reason)
+        with self._reserve_nodes(cluster, node_count) as reservation_id:
+            pecan.request.rpcapi.cluster_update_async(
+                cluster, node_count, health_status, health_status_reason,
+                reservation_id=reservation_id)
         return ClusterID(cluster.uuid)
 
     @base.Controller.api_version("1.3", "1.9")  # noqa
@@ -646,10 +770,10 @@ class ClustersController(base.Controller):
          health_status_reason) = self._patch(cluster_ident, patch)
         if node_count == 0:
             raise exception.ZeroNodeCountNotSupported()
-        pecan.request.rpcapi.cluster_update_async(cluster, node_count,
-                                                  health_status,
-                                                  health_status_reason,
-                                                  rollback)
+        with self._reserve_nodes(cluster, node_count) as reservation_id:
+            pecan.request.rpcapi.cluster_update_async(
+                cluster, node_count, health_status, health_status_reason,
+                rollback, reservation_id=reservation_id)
         return ClusterID(cluster.uuid)
 
     @base.Controller.api_version("1.10")  # noqa
@@ -666,10 +790,10 @@ class ClustersController(base.Controller):
         (cluster, node_count,
          health_status,
          health_status_reason) = self._patch(cluster_ident, patch)
-        pecan.request.rpcapi.cluster_update_async(cluster, node_count,
-                                                  health_status,
-                                                  health_status_reason,
-                                                  rollback)
+        with self._reserve_nodes(cluster, node_count) as reservation_id:
+            pecan.request.rpcapi.cluster_update_async(
+                cluster, node_count, health_status, health_status_reason,
+                rollback, reservation_id=reservation_id)
         return ClusterID(cluster.uuid)
 
     def _patch(self, cluster_ident, patch):
@@ -715,7 +839,8 @@ class ClustersController(base.Controller):
         # which includes non-default nodegroups. However cluster_update expects
         # node_count to be the size of the default_ng_worker therefore return
         # this value unless the patch object says otherwise.
-        node_count = cluster.default_ng_worker.node_count
+        old_node_count = cluster.default_ng_worker.node_count
+        node_count = old_node_count
         for p in patch:
             if p['path'] == '/node_count':
                 node_count = p.get('value') or new_cluster.node_count
@@ -723,6 +848,12 @@ class ClustersController(base.Controller):
         return (cluster, node_count,
                 new_cluster.health_status, new_cluster.health_status_reason)
 
+    def _reserve_nodes(self, cluster, node_count):
+        # released by the conductor once the update is done or failed
+        return api_utils.quota_reservation(
+            pecan.request.context, cluster.project_id, cluster.uuid,
+            nodes=node_count - cluster.default_ng_worker.node_count)
+
     @expose.expose(None, types.uuid_or_name, status_code=204)
     def delete(self, cluster_ident):
         """Delete a cluster.
@@ -133,11 +133,17 @@ class ActionsController(base.Controller):
             cluster_driver.validate_master_resize(
                 cluster_resize_req.node_count)
 
-        pecan.request.rpcapi.cluster_resize_async(
-            cluster,
-            cluster_resize_req.node_count,
-            cluster_resize_req.nodes_to_remove,
-            nodegroup)
+        # released by the conductor once the resize is done or failed
+        added_nodes = cluster_resize_req.node_count - nodegroup.node_count
+        with api_utils.quota_reservation(
+                context, cluster.project_id, cluster.uuid,
+                nodes=added_nodes) as reservation_id:
+            pecan.request.rpcapi.cluster_resize_async(
+                cluster,
+                cluster_resize_req.node_count,
+                cluster_resize_req.nodes_to_remove,
+                nodegroup,
+                reservation_id=reservation_id)
         return ClusterID(cluster.uuid)
 
     @base.Controller.api_version("1.7", "1.7")
@@ -188,7 +188,11 @@ class ClusterTemplate(base.APIBase):
 
     @classmethod
     def convert_with_links(cls, rpc_cluster_template):
-        cluster_template = ClusterTemplate(**rpc_cluster_template.as_dict())
+        return cls.convert_dict_with_links(rpc_cluster_template.as_dict())
+
+    @classmethod
+    def convert_dict_with_links(cls, cluster_template_dict):
+        cluster_template = ClusterTemplate(**cluster_template_dict)
         return cls._convert_with_links(
             cluster_template, pecan.request.application_url)
 
@@ -245,10 +249,12 @@ class ClusterTemplateCollection(collection.Collection):
         self._type = 'clustertemplates'
 
     @staticmethod
-    def convert_with_links(rpc_cluster_templates, limit, url=None, **kwargs):
+    def convert_with_links(cluster_template_dicts, limit, url=None,
+                           **kwargs):
         collection = ClusterTemplateCollection()
-        collection.clustertemplates = [ClusterTemplate.convert_with_links(p)
-                                       for p in rpc_cluster_templates]
+        collection.clustertemplates = [
+            ClusterTemplate.convert_dict_with_links(p)
+            for p in cluster_template_dicts]
         collection.next = collection.get_next(limit, url=url, **kwargs)
         return collection
 
@@ -310,9 +316,13 @@ class ClusterTemplatesController(base.Controller):
             marker_obj = objects.ClusterTemplate.get_by_uuid(
                 pecan.request.context, marker)
 
-        cluster_templates = objects.ClusterTemplate.list(
+        # the public ClusterTemplates listed by every tenant are cached
+        cluster_templates = objects.ClusterTemplate.list_as_dicts(
             pecan.request.context, limit, marker_obj, sort_key=sort_key,
-            sort_dir=sort_dir)
+            sort_dir=sort_dir, use_replica=True)
+
+        if api_utils.etag_matches(cluster_templates):
+            return api_utils.not_modified()
 
         return ClusterTemplateCollection.convert_with_links(cluster_templates,
                                                             limit,
@@ -396,6 +406,9 @@ class ClusterTemplatesController(base.Controller):
                            cluster_template.as_dict(),
                            action='clustertemplate:get')
 
+        if api_utils.etag_matches(cluster_template.as_dict()):
+            return api_utils.not_modified()
+
         return ClusterTemplate.convert_with_links(cluster_template)
 
     @expose.expose(ClusterTemplate, body=ClusterTemplate, status_code=201)
@@ -97,7 +97,8 @@ class MagnumServiceController(base.Controller):
                                            limit=None,
                                            marker=None,
                                            sort_key='id',
-                                           sort_dir='asc')
+                                           sort_dir='asc',
+                                           use_replica=True)
 
         return MagnumServiceCollection.convert_db_rec_list_to_collection(
             self.servicegroup_api, msvcs)
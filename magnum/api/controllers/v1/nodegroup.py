@@ -329,7 +329,7 @@ class NodeGroupPatchType(types.JsonPatchType):
                           "/docker_volume_size", "/labels", "/flavor_id",
                           "/image_id", "/node_addresses", "/node_count",
                           "/role", "/is_default", "/stack_id", "/status",
-                          "/status_reason", "/version"]
+                          "/status_reason", "/version", "/generation"]
         return types.JsonPatchType.internal_attrs() + internal_attrs
 
 
@@ -378,7 +378,11 @@ class NodeGroupController(base.Controller):
                                             marker=marker_obj,
                                             sort_key=sort_key,
                                             sort_dir=sort_dir,
-                                            filters=filters)
+                                            filters=filters,
+                                            use_replica=True)
+
+        if api_utils.etag_matches([ng.as_dict() for ng in nodegroups]):
+            return api_utils.not_modified()
 
         return NodeGroupCollection.convert(nodegroups,
                                            cluster_id,
@@ -442,6 +446,10 @@ class NodeGroupController(base.Controller):
             context.all_tenants = True
         cluster = api_utils.get_resource('Cluster', cluster_id)
         nodegroup = objects.NodeGroup.get(context, cluster.uuid, nodegroup_id)
+        # the labels of the cluster are compared with the ones of the
+        # nodegroup in its representation
+        if api_utils.etag_matches(nodegroup.as_dict(), cluster.labels):
+            return api_utils.not_modified()
         return NodeGroup.convert(nodegroup)
 
     @base.Controller.api_version("1.9")
@@ -501,7 +509,11 @@ class NodeGroupController(base.Controller):
 
         new_obj = objects.NodeGroup(context, **nodegroup_dict)
         new_obj.uuid = uuid.uuid4()
-        pecan.request.rpcapi.nodegroup_create_async(cluster, new_obj)
+        with api_utils.quota_reservation(
+                context, cluster.project_id, cluster.uuid,
+                nodes=new_obj.node_count) as reservation_id:
+            pecan.request.rpcapi.nodegroup_create_async(
+                cluster, new_obj, reservation_id=reservation_id)
         return NodeGroup.convert(new_obj)
 
     @base.Controller.api_version("1.9")
@@ -68,5 +68,6 @@ class StatsController(base.Controller):
             if project_id != context.project_id:
                 raise exception.NotAuthorized()
 
-        stats = objects.Stats.get_cluster_stats(context, project_id)
+        stats = objects.Stats.get_cluster_stats(context, project_id,
+                                                use_replica=True)
         return Stats.convert(stats)
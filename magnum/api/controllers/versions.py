@@ -37,10 +37,11 @@ REST_API_VERSION_HISTORY = """REST API Version History:
     * 1.12 - Add credential API
     * 1.13 - Add cluster_id field to cluster, deprecate stack_id
     * 1.14 - Add node_labels and node_taints to nodegroup
+    * 1.15 - Add filters and a label selector to the cluster listings
 """
 
 BASE_VER = '1.1'
-CURRENT_MAX_VER = '1.14'
+CURRENT_MAX_VER = '1.15'
 
 
 class Version(object):
@@ -14,10 +14,18 @@
 #    under the License.
 
 import ast
+import contextlib
+import hashlib
+import re
+
 import jsonpatch
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import excutils
 from oslo_utils import uuidutils
 import pecan
 import wsme
+from wsme import api as wsme_api
 
 from magnum.common import exception
 from magnum.common import utils
@@ -26,6 +34,7 @@ from magnum.i18n import _
 from magnum import objects
 
 CONF = magnum.conf.CONF
+LOG = logging.getLogger(__name__)
 
 
 JSONPATCH_EXCEPTIONS = (jsonpatch.JsonPatchException,
@@ -35,6 +44,10 @@ JSONPATCH_EXCEPTIONS = (jsonpatch.JsonPatchException,
 
 DOCKER_MINIMUM_MEMORY = 4 * 1024 * 1024
 
+# the label keys a label selector can match, which need no quoting in the
+# JSON paths of the database
+LABEL_KEY_RE = re.compile(r'^[\w./-]+$')
+
 
 def validate_limit(limit):
     if limit is not None and limit <= 0:
@@ -54,6 +67,24 @@ def validate_sort_dir(sort_dir):
     return sort_dir
 
 
+def validate_label_selector(selector):
+    """Parse a label selector, the key=value pairs separated by commas.
+
+    :returns: a dict of the labels to match.
+    """
+    labels = {}
+    for term in selector.split(','):
+        key, sep, value = term.partition('=')
+        key = key.strip()
+        if not sep or not LABEL_KEY_RE.match(key):
+            raise wsme.exc.ClientSideError(_("Invalid label selector: %s. "
+                                             "Acceptable values are "
+                                             "key=value pairs separated by "
+                                             "commas") % selector)
+        labels[key] = value.strip()
+    return labels
+
+
 def validate_docker_memory(mem_str):
     """Docker require that Minimum memory limit >= 4M."""
     try:
@@ -160,3 +191,63 @@ def get_labels_diff(parent_labels, labels):
         except KeyError:
             labels_added[key] = value
     return labels_overridden, labels_added, labels_skipped
+
+
+def etag_matches(*state):
+    """Set the ETag of the response and check the If-None-Match of the request.
+
+    The ETag is a strong one, a hash of the given state of the resources
+    along with the URL and the API version of the request, which the
+    representation depends on too.
+
+    :param state: the state the representation is built from, e.g. the
+                  as_dict() of the objects.
+    :returns: True if the client already has this representation, in which
+              case the controller returns not_modified() instead of
+              converting the resources.
+    """
+    request = pecan.request
+    digest = hashlib.sha256(jsonutils.dump_as_bytes(
+        [request.url, repr(request.version), state], sort_keys=True))
+    etag = digest.hexdigest()[:40]
+    pecan.response.etag = etag
+    return etag in request.if_none_match
+
+
+def not_modified():
+    """Return an empty 304 Not Modified response."""
+    return wsme_api.Response(None, status_code=304, return_type=None)
+
+
+@contextlib.contextmanager
+def quota_reservation(context, project_id, resource_id, clusters=0, nodes=0):
+    """Reserve quota for an operation handed over to the conductor.
+
+    Yields the id of the reservation, or None when there is nothing to
+    reserve, which is passed along with the operation for the conductor
+    to release the reservation once it ends. If handing the operation
+    over fails, the reservation is released right away.
+
+    :param context: the security context.
+    :param project_id: the project the quota is reserved for.
+    :param resource_id: the uuid of the cluster the operation is for.
+    :param clusters: the number of clusters to reserve.
+    :param nodes: the number of nodes to reserve.
+    :raises: QuotaExceeded
+    """
+    if clusters <= 0 and nodes <= 0:
+        yield None
+        return
+
+    reservation_id = objects.Quota.reserve(context, project_id, resource_id,
+                                           clusters=clusters, nodes=nodes)
+    try:
+        yield reservation_id
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            try:
+                objects.Quota.release_reservation(context, reservation_id)
+            except Exception:
+                LOG.exception('Failed to release the quota reserved for '
+                              'cluster %s, it is released when it expires.',
+                              resource_id)
@@ -21,11 +21,12 @@ from oslo_concurrency import processutils
 from oslo_log import log as logging
 from oslo_reports import guru_meditation_report as gmr
 from oslo_reports import opts as gmr_opts
-from werkzeug import serving
+from oslo_service import service as os_service
 
 from magnum.api import app as api_app
 from magnum.common import profiler
 from magnum.common import service
+from magnum.common import wsgi_service
 import magnum.conf
 from magnum.drivers.common import driver as driver_module
 from magnum.i18n import _
@@ -82,13 +83,21 @@ def main():
     drivers = [ep.name for ep, _ in driver_module.Driver.load_entry_points()]
     LOG.debug('Loaded drivers: %s', drivers)
 
-    LOG.info('Serving on %(proto)s://%(host)s:%(port)s',
-             dict(proto="https" if use_ssl else "http", host=host, port=port))
+    service.preload(load_policy=True)
 
     workers = CONF.api.workers
     if not workers:
         workers = processutils.get_worker_count()
-    LOG.info('Server will handle each request in a new process up to'
-             ' %s concurrent processes', workers)
-    serving.run_simple(host, port, app, processes=workers,
-                       ssl_context=_get_ssl_configs(use_ssl))
+    server = wsgi_service.WSGIService(
+        'magnum-api', app, host, port, CONF.api.threads,
+        client_socket_timeout=CONF.api.client_socket_timeout,
+        keepalive_timeout=CONF.api.keepalive_timeout,
+        backlog=CONF.api.backlog, ssl_context=_get_ssl_configs(use_ssl))
+
+    LOG.info('Serving on %(proto)s://%(host)s:%(port)s with %(workers)s '
+             'processes of %(threads)s threads',
+             dict(proto="https" if use_ssl else "http", host=host,
+                  port=server.port, workers=workers,
+                  threads=CONF.api.threads))
+    launcher = os_service.launch(CONF, server, workers=workers)
+    launcher.wait()
@@ -71,6 +71,7 @@ def main():
     workers = CONF.conductor.workers
     if not workers:
         workers = processutils.get_worker_count()
+    magnum_service.preload()
     launcher = service.launch(CONF, server, workers=workers)
 
     # NOTE(mnaser): We create the periodic tasks here so that they
@@ -13,9 +13,18 @@
 
 """Starter script for magnum-db-manage."""
 
+import collections
+import datetime
+import os
+import sys
+import time
+
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 
+from magnum.db import api as db_api
 from magnum.db import migration
 
 
@@ -39,6 +48,75 @@ def do_revision():
                        autogenerate=CONF.command.autogenerate)
 
 
+def _archiver(archive):
+    """Return a function appending rows to the archive file durably.
+
+    The purge calls it before deleting the rows, so that they are on disk
+    before the deletion is committed.
+    """
+    def write(rows):
+        for row in rows:
+            archive.write(jsonutils.dumps(
+                {'table': row.__tablename__, 'row': row.as_dict()}))
+            archive.write('\n')
+        archive.flush()
+        os.fsync(archive.fileno())
+    return write
+
+
+def _purge(table, purge, older_than, archive=None):
+    """Call purge until it has no more rows to delete.
+
+    Each call deletes at most --batch-size rows of the table in one
+    transaction, and the calls are spaced so that no more than --max-rate
+    rows are deleted per second.
+    """
+    batch_size = CONF.command.batch_size
+    interval = 0
+    if CONF.command.max_rate:
+        interval = batch_size / CONF.command.max_rate
+    if archive is not None:
+        archive = _archiver(archive)
+    counts = collections.Counter()
+    while True:
+        start = time.monotonic()
+        rows = purge(older_than, batch_size, archive=archive)
+        batch = collections.Counter(row.__tablename__ for row in rows)
+        counts.update(batch)
+        if batch[table] < batch_size:
+            return counts
+        time.sleep(max(0, interval - (time.monotonic() - start)))
+
+
+def do_purge():
+    if CONF.command.batch_size < 1:
+        sys.exit('--batch-size must be at least 1')
+    dbapi = db_api.get_instance()
+    older_than = timeutils.utcnow() - datetime.timedelta(
+        days=CONF.command.older_than)
+    purges = []
+    if CONF.command.failed_clusters:
+        # first, so that the key pairs of the clusters go along with them
+        purges.append(('cluster', dbapi.purge_failed_clusters))
+    purges.append(('x509keypair', dbapi.purge_x509keypairs))
+    purges.append(('magnum_service', dbapi.purge_magnum_services))
+
+    archive = None
+    if CONF.command.archive:
+        # the rows include private keys, keep the file private
+        archive = os.fdopen(os.open(CONF.command.archive,
+                                    os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                                    0o600), 'a')
+    try:
+        for table, purge in purges:
+            counts = _purge(table, purge, older_than, archive)
+            for name in sorted(counts):
+                print('Purged %d rows from %s' % (counts[name], name))
+    finally:
+        if archive is not None:
+            archive.close()
+
+
 def add_command_parsers(subparsers):
     parser = subparsers.add_parser('version')
     parser.set_defaults(func=do_version)
@@ -56,6 +134,34 @@ def add_command_parsers(subparsers):
     parser.add_argument('--autogenerate', action='store_true')
     parser.set_defaults(func=do_revision)
 
+    parser = subparsers.add_parser(
+        'purge', help='Delete x509keypairs no cluster refers to, stale '
+                      'service records and optionally failed clusters.')
+    parser.add_argument('--older-than', type=int, default=30,
+                        metavar='DAYS',
+                        help='Only delete rows last updated more than DAYS '
+                             'days ago.')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Maximum number of rows deleted in one '
+                             'transaction.')
+    parser.add_argument('--max-rate', type=float, default=0,
+                        help='Maximum number of rows deleted per second, '
+                             '0 for no limit.')
+    parser.add_argument('--failed-clusters', action='store_true',
+                        help='Also delete clusters in CREATE_FAILED or '
+                             'DELETE_FAILED status, with their nodegroups '
+                             'and certificates. The cloud resources they '
+                             'may have left behind are not deleted. '
+                             'Clusters with certificates stored outside of '
+                             'the database, e.g. in Barbican, are skipped '
+                             'and must be deleted through the API.')
+    parser.add_argument('--archive', metavar='FILE',
+                        help='Append the rows to FILE, one JSON document '
+                             'per line, before deleting them. A batch '
+                             'whose deletion fails may be archived '
+                             'anyway.')
+    parser.set_defaults(func=do_purge)
+
 
 command_opt = cfg.SubCommandOpt('command',
                                 title='Command',
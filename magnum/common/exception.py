@@ -375,6 +375,12 @@ class ResourceLimitExceeded(NotAuthorized):
     message = _('Resource limit exceeded: %(msg)s')
 
 
+class QuotaExceeded(ResourceLimitExceeded):
+    message = _("You have reached the maximum %(resource)s per project, "
+                "%(limit)s. You may delete some of them to make room for "
+                "new ones.")
+
+
 class RegionsListFailed(MagnumException):
     message = _("Failed to list regions.")
 
@@ -410,6 +416,11 @@ class NodeGroupAlreadyExists(Conflict):
                 "cluster %(cluster_id)s.")
 
 
+class ConcurrentUpdate(Conflict):
+    message = _("%(resource)s %(id)s was modified by another request, "
+                "please retry.")
+
+
 class NodeGroupNotFound(ResourceNotFound):
     message = _("Nodegroup %(nodegroup)s could not be found.")
 
@@ -0,0 +1,105 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Consistent hash ring used to share work between conductors."""
+
+import bisect
+import hashlib
+import threading
+
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from magnum.api import servicegroup
+import magnum.conf
+from magnum import objects
+
+CONF = magnum.conf.CONF
+LOG = logging.getLogger(__name__)
+
+# Number of points each host is given on the ring. More points give a more
+# even distribution at the cost of a slightly bigger ring.
+_REPLICAS = 128
+
+
+def _hash(value):
+    digest = hashlib.md5(value.encode('utf-8'),
+                         usedforsecurity=False).hexdigest()
+    return int(digest[:16], 16)
+
+
+class HashRing(object):
+    """Map keys to hosts so that few keys move when hosts come and go."""
+
+    def __init__(self, hosts, replicas=_REPLICAS):
+        self.hosts = frozenset(hosts)
+        ring = sorted((_hash('%s-%d' % (host, i)), host)
+                      for host in self.hosts for i in range(replicas))
+        self._keys = [k for k, _ in ring]
+        self._hosts = [h for _, h in ring]
+
+    def get_host(self, key):
+        """Return the host responsible for key, or None if empty."""
+        if not self._keys:
+            return None
+        idx = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._hosts[idx]
+
+
+class HashRingManager(object):
+    """Keep a hash ring of the live hosts running a given binary.
+
+    Membership is read from the magnum_service heartbeat table and a host
+    is considered alive as long as ServiceGroup.service_is_up reports it
+    so. The ring is rebuilt at most every
+    [conductor]hash_ring_reset_interval seconds, so a host that stops
+    heartbeating drops out of the ring once it is considered down.
+    """
+
+    def __init__(self, host, binary='magnum-conductor'):
+        self.host = host
+        self.binary = binary
+        self._lock = threading.Lock()
+        self._ring = None
+        self._watch = timeutils.StopWatch(
+            duration=CONF.conductor.hash_ring_reset_interval)
+
+    def _live_hosts(self, context):
+        service_group = servicegroup.ServiceGroup()
+        hosts = {srv.host
+                 for srv in objects.MagnumService.list(context)
+                 if srv.binary == self.binary and
+                 service_group.service_is_up(srv)}
+        # we are running, whatever the heartbeat table says so far
+        hosts.add(self.host)
+        return hosts
+
+    def get_ring(self, context):
+        with self._lock:
+            if self._ring is None or self._watch.expired():
+                hosts = self._live_hosts(context)
+                if self._ring is None or self._ring.hosts != hosts:
+                    LOG.info("Hash ring for %(binary)s rebuilt with hosts "
+                             "%(hosts)s",
+                             {'binary': self.binary,
+                              'hosts': sorted(hosts)})
+                    self._ring = HashRing(hosts)
+                self._watch.restart()
+            return self._ring
+
+    def is_local(self, context, key):
+        """Whether this host is responsible for key."""
+        return self.get_ring(context).get_host(key) == self.host
+
+    def reset(self):
+        with self._lock:
+            self._ring = None
@@ -12,10 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import gc
+
 from oslo_log import log as logging
 
 from magnum.common import config
+from magnum.common import policy
 import magnum.conf
+from magnum.drivers.common import driver
 
 CONF = magnum.conf.CONF
 
@@ -28,3 +32,20 @@ def prepare_service(argv=None):
     config.set_config_defaults()
 
     logging.setup(CONF, 'magnum')
+
+
+def preload(load_policy=False):
+    """Load the state shared by the workers before forking them.
+
+    The drivers, their definitions and, with load_policy, the policy rules
+    are loaded once in the parent process, and shared copy-on-write by the
+    workers instead of being loaded again by each of them.
+    """
+    driver.Driver.get_drivers()
+    if load_policy:
+        policy.init().load_rules()
+    # Move the objects loaded so far out of the reach of the garbage
+    # collector, whose bookkeeping would otherwise write to, and so copy,
+    # the pages holding them in every worker.
+    gc.collect()
+    gc.freeze()
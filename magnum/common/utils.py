@@ -19,6 +19,8 @@
 """Utilities and helper functions."""
 
 import contextlib
+import decimal
+import functools
 import os
 import random
 import re
@@ -53,6 +55,29 @@ MEMORY_UNITS = {
     '': 1
 }
 
+K8S_QUANTITY_SUFFIXES = {
+    'n': decimal.Decimal(10) ** -9,
+    'u': decimal.Decimal(10) ** -6,
+    'm': decimal.Decimal(10) ** -3,
+    '': decimal.Decimal(1),
+    'k': decimal.Decimal(10) ** 3,
+    'M': decimal.Decimal(10) ** 6,
+    'G': decimal.Decimal(10) ** 9,
+    'T': decimal.Decimal(10) ** 12,
+    'P': decimal.Decimal(10) ** 15,
+    'E': decimal.Decimal(10) ** 18,
+    'Ki': decimal.Decimal(2) ** 10,
+    'Mi': decimal.Decimal(2) ** 20,
+    'Gi': decimal.Decimal(2) ** 30,
+    'Ti': decimal.Decimal(2) ** 40,
+    'Pi': decimal.Decimal(2) ** 50,
+    'Ei': decimal.Decimal(2) ** 60,
+}
+
+_K8S_QUANTITY_RE = re.compile(
+    r'^([+-]?(?:\d+\.?\d*|\.\d+))'
+    r'(?:(Ki|Mi|Gi|Ti|Pi|Ei|n|u|m|k|M|G|T|P|E)|[eE]([+-]?\d+))?$')
+
 DOCKER_MEMORY_UNITS = {
     'b': 1,
     'k': 2 ** 10,
@@ -239,6 +264,31 @@ def get_k8s_quantity(quantity):
         raise exception.UnsupportedK8sQuantityFormat()
 
 
+@functools.lru_cache(maxsize=4096)
+def parse_k8s_quantity(quantity):
+    """Parse a Kubernetes quantity into an exact decimal value.
+
+    Unlike get_k8s_quantity, the value is computed without any floating
+    point rounding, and parsed quantities are memoized since the same
+    handful of values, such as '100m' or '128Mi', shows up over and over
+    in the resources of a cluster.
+
+    :param quantity: String value of a quantity such as '500m', '1Gi'
+                     or '1.5e3'
+    :returns: decimal.Decimal value of the quantity
+    :raises: exception.UnsupportedK8sQuantityFormat if the quantity string
+             is a unsupported value
+    """
+    match = _K8S_QUANTITY_RE.match(quantity)
+    if match is None:
+        raise exception.UnsupportedK8sQuantityFormat()
+    number, suffix, exponent = match.groups()
+    value = decimal.Decimal(number)
+    if exponent is not None:
+        return value.scaleb(int(exponent))
+    return value * K8S_QUANTITY_SUFFIXES[suffix or '']
+
+
 def generate_password(length, symbolgroups=None):
     """Generate a random password from the supplied symbol groups.
 
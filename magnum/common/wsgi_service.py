@@ -0,0 +1,309 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Pre-forked, threaded WSGI service for the Magnum API."""
+
+from concurrent import futures
+import socket
+import ssl
+import threading
+from wsgiref import simple_server
+
+from oslo_log import log as logging
+from oslo_service import service
+
+LOG = logging.getLogger(__name__)
+
+# size of the reads when discarding the part of a request body the
+# application did not read
+_DRAIN_CHUNK = 65536
+
+# seconds between two checks for shutdown of a worker
+_POLL_INTERVAL = 0.5
+
+
+class _ServerHandler(simple_server.ServerHandler):
+
+    http_version = '1.1'
+    # don't copy the environment of the process in the WSGI environment
+    os_environ = {}
+
+    def log_exception(self, exc_info):
+        LOG.error('Error on request %s', self.environ.get('PATH_INFO'),
+                  exc_info=exc_info)
+
+    def _complete(self):
+        """Whether the client can tell where the response ended."""
+        if self.status is None or not self.headers_sent:
+            return False
+        if self.headers.get('Connection', '').lower() == 'close':
+            return False
+        if (self.environ['REQUEST_METHOD'] == 'HEAD' or
+                self.status[:3] in ('204', '304')):
+            return True
+        length = self.headers.get('Content-Length')
+        return length is not None and length == str(self.bytes_sent)
+
+    def close(self):
+        # called once the response is sent, before its state is reset
+        if not self._complete():
+            self.request_handler.close_connection = True
+        super(_ServerHandler, self).close()
+
+
+class _Input(object):
+    """The body of a request, which must not be read past its length."""
+
+    def __init__(self, rfile, length):
+        self._rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._rfile.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._rfile.readline(size)
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint=-1):
+        return list(iter(self.readline, b''))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self):
+        while self.remaining and self.read(_DRAIN_CHUNK):
+            pass
+
+
+class RequestHandler(simple_server.WSGIRequestHandler):
+    """Serve the requests of a connection, keeping it open between them."""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'magnum-api'
+
+    def setup(self):
+        # a client that stalls in the middle of a request holds a thread of
+        # the pool, give up on it after a while
+        self.timeout = self.server.client_socket_timeout or None
+        if isinstance(self.request, ssl.SSLSocket):
+            # handshake here rather than in the thread accepting connections
+            self.request.settimeout(self.timeout)
+            self.request.do_handshake()
+        super(RequestHandler, self).setup()
+
+    def handle(self):
+        self.close_connection = True
+        try:
+            self.handle_one_request()
+            while not self.close_connection and self._wait_for_request():
+                self.handle_one_request()
+        except (ConnectionError, socket.timeout, ssl.SSLError):
+            pass
+
+    def _wait_for_request(self):
+        """Wait for the next request of a keep-alive connection.
+
+        An idle connection holds a thread of the pool, so it is closed
+        when no request comes within the keep-alive timeout.
+        """
+        keepalive_timeout = self.server.keepalive_timeout
+        if not keepalive_timeout:
+            return False
+        self.connection.settimeout(keepalive_timeout)
+        try:
+            if not self.rfile.peek(1):
+                # closed by the client
+                return False
+        except (OSError, ValueError):
+            return False
+        self.connection.settimeout(self.timeout)
+        return True
+
+    def __getattr__(self, name):
+        # all the methods are handled by the application
+        if name.startswith('do_'):
+            return self.run_wsgi
+        raise AttributeError(name)
+
+    def run_wsgi(self):
+        environ = self.get_environ()
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            # the end of the body is unknown, so is the next request
+            self.close_connection = True
+            stdin = self.rfile
+        else:
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                self.send_error(400, 'Bad Content-Length')
+                return
+            stdin = _Input(self.rfile, length)
+
+        handler = _ServerHandler(stdin, self.wfile, self.get_stderr(),
+                                 environ, multithread=True)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+        if not self.close_connection and isinstance(stdin, _Input):
+            stdin.drain()
+
+    def log_message(self, format, *args):
+        LOG.info('%s %s', self.address_string(), format % args)
+
+
+class ThreadPoolWSGIServer(simple_server.WSGIServer):
+    """A WSGI server handling the connections in a fixed pool of threads."""
+
+    def __init__(self, sock, app, threads, client_socket_timeout=None,
+                 keepalive_timeout=None):
+        super(ThreadPoolWSGIServer, self).__init__(
+            sock.getsockname()[:2], RequestHandler, bind_and_activate=False)
+        # serve on the socket shared by the workers
+        self.socket.close()
+        self.socket = sock
+        host, port = sock.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(app)
+
+        self.client_socket_timeout = client_socket_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self._slots = threading.BoundedSemaphore(threads)
+        self._pool = futures.ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix='wsgi')
+
+    def get_request(self):
+        # Don't accept more connections than there are free threads, the
+        # others stay in the listen backlog where another worker can pick
+        # them up. Without a free thread within the poll interval, return
+        # to serve_forever, which checks for shutdown.
+        if not self._slots.acquire(timeout=_POLL_INTERVAL):
+            raise socket.timeout()
+        try:
+            return super(ThreadPoolWSGIServer, self).get_request()
+        except BaseException:
+            # another worker accepted the connection
+            self._slots.release()
+            raise
+
+    def process_request(self, request, client_address):
+        # the slot was taken by get_request
+        try:
+            self._pool.submit(self._process_request, request, client_address)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def handle_error(self, request, client_address):
+        LOG.exception('Error serving the connection of %s', client_address)
+
+    def serve_forever(self, poll_interval=None):
+        super(ThreadPoolWSGIServer, self).serve_forever(
+            poll_interval or _POLL_INTERVAL)
+
+    def drain(self):
+        """Wait for the connections being served to be closed."""
+        self._pool.shutdown(wait=True)
+
+
+def listen(host, port, backlog):
+    """Bind the listening socket shared by all the workers."""
+    info = socket.getaddrinfo(host, port, socket.AF_UNSPEC,
+                              socket.SOCK_STREAM)[0]
+    sock = socket.socket(info[0], socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(info[4])
+        sock.listen(backlog)
+        # all the workers are woken up by a new connection, those which
+        # don't get it must not block in accept()
+        sock.setblocking(False)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+class WSGIService(service.Service):
+    """Serve a WSGI application in each worker of a process launcher.
+
+    The listening socket is bound once, before the workers are forked, and
+    each worker serves the connections it accepts from a pool of threads.
+    """
+
+    def __init__(self, name, app, host, port, threads,
+                 client_socket_timeout=None, keepalive_timeout=None,
+                 backlog=128, ssl_context=None):
+        super(WSGIService, self).__init__()
+        self.name = name
+        self.app = app
+        self.threads = threads
+        self.client_socket_timeout = client_socket_timeout
+        self.keepalive_timeout = keepalive_timeout
+        # (cert_file, key_file), loaded in the workers
+        self.ssl_context = ssl_context
+        self._socket = listen(host, port, backlog)
+        self.port = self._socket.getsockname()[1]
+        self._server = None
+
+    def _listening_socket(self):
+        # The server closes its socket when it is stopped, give it a copy
+        # so that the shared one stays open for the restarts. Wrapping it
+        # in SSL detaches it as well.
+        sock = self._socket.dup()
+        if not self.ssl_context:
+            return sock
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*self.ssl_context)
+        return context.wrap_socket(sock, server_side=True,
+                                   do_handshake_on_connect=False)
+
+    def start(self):
+        self._server = ThreadPoolWSGIServer(
+            self._listening_socket(), self.app, self.threads,
+            client_socket_timeout=self.client_socket_timeout,
+            keepalive_timeout=self.keepalive_timeout)
+        LOG.info('%(name)s serving with %(threads)d threads',
+                 {'name': self.name, 'threads': self.threads})
+        self.tg.add_thread(self._server.serve_forever)
+
+    def stop(self, graceful=False):
+        if self._server:
+            # stop accepting connections, the ones being served are
+            # finished in wait(). This closes the copy of the listening
+            # socket of the server, the shared one is kept for a restart.
+            self._server.shutdown()
+            self._server.server_close()
+        super(WSGIService, self).stop(graceful)
+
+    def wait(self):
+        super(WSGIService, self).wait()
+        if self._server:
+            self._server.drain()
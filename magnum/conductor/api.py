@@ -37,10 +37,11 @@ class API(rpc_service.API):
                           create_timeout=create_timeout)
 
     def cluster_create_async(self, cluster, master_count, node_count,
-                             create_timeout):
+                             create_timeout, reservation_id=None):
         self._cast('cluster_create', cluster=cluster,
                    master_count=master_count, node_count=node_count,
-                   create_timeout=create_timeout)
+                   create_timeout=create_timeout,
+                   reservation_id=reservation_id)
 
     def cluster_delete(self, uuid):
         return self._call('cluster_delete', uuid=uuid)
@@ -57,12 +58,12 @@ class API(rpc_service.API):
 
     def cluster_update_async(self, cluster, node_count,
                              health_status, health_status_reason,
-                             rollback=False):
+                             rollback=False, reservation_id=None):
         self._cast('cluster_update', cluster=cluster,
                    node_count=node_count,
                    health_status=health_status,
                    health_status_reason=health_status_reason,
-                   rollback=rollback)
+                   rollback=rollback, reservation_id=reservation_id)
 
     def cluster_resize(self, cluster, node_count, nodes_to_remove,
                        nodegroup, rollback=False):
@@ -74,12 +75,13 @@ class API(rpc_service.API):
                           nodegroup=nodegroup)
 
     def cluster_resize_async(self, cluster, node_count, nodes_to_remove,
-                             nodegroup, rollback=False):
+                             nodegroup, rollback=False, reservation_id=None):
         return self._cast('cluster_resize',
                           cluster=cluster,
                           node_count=node_count,
                           nodes_to_remove=nodes_to_remove,
-                          nodegroup=nodegroup)
+                          nodegroup=nodegroup,
+                          reservation_id=reservation_id)
 
     def cluster_upgrade(self, cluster, cluster_template, max_batch_size,
                         nodegroup):
@@ -160,8 +162,9 @@ class API(rpc_service.API):
         return self._call('nodegroup_create', cluster=cluster,
                           nodegroup=nodegroup)
 
-    def nodegroup_create_async(self, cluster, nodegroup):
-        self._cast('nodegroup_create', cluster=cluster, nodegroup=nodegroup)
+    def nodegroup_create_async(self, cluster, nodegroup, reservation_id=None):
+        self._cast('nodegroup_create', cluster=cluster, nodegroup=nodegroup,
+                   reservation_id=reservation_id)
 
     def nodegroup_delete(self, cluster, nodegroup):
         return self._call('nodegroup_delete', cluster=cluster,
@@ -18,8 +18,10 @@ from pycadf import cadftaxonomy as taxonomy
 from magnum.common import exception
 from magnum.common import profiler
 from magnum.conductor.handlers.common import cert_manager
+from magnum.conductor import k8s_api
 from magnum.conductor import utils as conductor_utils
 from magnum.drivers.common import driver
+from magnum.drivers.common import k8s_node_watch
 from magnum.i18n import _
 from magnum import objects
 from magnum.objects import fields
@@ -92,6 +94,9 @@ class Handler(object):
             # re-generate the ca certs
             cert_manager.generate_certificates_to_cluster(cluster,
                                                           context=context)
+            cert_manager.invalidate_client_ssl_context(cluster.uuid)
+            k8s_api.evict_session(cluster.uuid)
+            k8s_node_watch.stop_watcher(cluster.uuid)
             cluster_driver = driver.Driver.get_driver_for_cluster(context,
                                                                   cluster)
             cluster_driver.rotate_ca_certificate(context, cluster)
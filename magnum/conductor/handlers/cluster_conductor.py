@@ -40,6 +40,7 @@ class Handler(object):
 
     # Cluster Operations
 
+    @conductor_utils.release_quota_reservation
     def cluster_create(self, context, cluster, master_count, node_count,
                        create_timeout):
         LOG.debug('cluster_conductor cluster_create')
@@ -86,6 +87,7 @@ class Handler(object):
 
         return cluster
 
+    @conductor_utils.release_quota_reservation
     def cluster_update(self, context, cluster, node_count,
                        health_status, health_status_reason, rollback=False):
         LOG.debug('cluster_conductor cluster_update')
@@ -190,6 +192,7 @@ class Handler(object):
         cluster.save()
         return None
 
+    @conductor_utils.release_quota_reservation
     def cluster_resize(self, context, cluster,
                        node_count, nodes_to_remove, nodegroup):
         LOG.debug('cluster_conductor cluster_resize')
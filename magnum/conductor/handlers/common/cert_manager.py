@@ -14,22 +14,36 @@
 
 from oslo_log import log as logging
 from oslo_utils import encodeutils
+from oslo_utils import timeutils
 
 from magnum.common import cert_manager
+from magnum.common.cert_manager import x509keypair_cert_manager
 from magnum.common import exception
 from magnum.common import short_id
 from magnum.common.x509 import operations as x509
 
+import collections
 import magnum.conf
 import os
 import shutil
+import ssl
 import tempfile
+import threading
 
 CONDUCTOR_CLIENT_NAME = 'Magnum-Conductor'
 
+# the certificates generated for a cluster
+CERT_REFS = ('ca_cert_ref', 'magnum_cert_ref', 'etcd_ca_cert_ref',
+             'front_proxy_ca_cert_ref')
+
 LOG = logging.getLogger(__name__)
 CONF = magnum.conf.CONF
 
+# cluster uuid -> (certificate refs, expiry, ssl.SSLContext)
+_SSL_CONTEXTS = collections.OrderedDict()
+_SSL_CONTEXTS_LOCK = threading.Lock()
+_SSL_CONTEXTS_STATS = {'hits': 0, 'misses': 0}
+
 
 def _generate_ca_cert(issuer_name, context=None):
     """Generate and store ca_cert
@@ -212,6 +226,93 @@ def create_client_files(cluster, context=None):
     return ca_file, key_file, cert_file
 
 
+def _load_client_cert_chain(ssl_context, certificate, private_key):
+    # The ssl module can only load a certificate chain from a file. Use an
+    # anonymous in-memory file when the platform has one so that the
+    # decrypted private key never hits the disk.
+    pem = (encodeutils.safe_encode(certificate) + b'\n' +
+           encodeutils.safe_encode(private_key))
+    if hasattr(os, 'memfd_create'):
+        fd = os.memfd_create('magnum-client-cert', os.MFD_CLOEXEC)
+        try:
+            with os.fdopen(fd, 'wb', closefd=False) as f:
+                f.write(pem)
+            ssl_context.load_cert_chain('/proc/self/fd/%d' % fd)
+        finally:
+            os.close(fd)
+    else:
+        with tempfile.NamedTemporaryFile() as f:
+            os.chmod(f.name, 0o600)
+            f.write(pem)
+            f.flush()
+            ssl_context.load_cert_chain(f.name)
+
+
+def _create_client_ssl_context(cluster, context=None):
+    ca_cert = get_cluster_ca_certificate(cluster, context)
+    magnum_cert = get_cluster_magnum_cert(cluster, context)
+
+    ssl_context = ssl.create_default_context(
+        cadata=encodeutils.safe_decode(ca_cert.get_certificate()))
+    _load_client_cert_chain(ssl_context,
+                            magnum_cert.get_certificate(),
+                            magnum_cert.get_decrypted_private_key())
+    return ssl_context
+
+
+def get_client_ssl_context(cluster, context=None):
+    """Return a TLS client context for talking to the cluster API.
+
+    Contexts are kept in a process-wide TTL and LRU bounded cache so that
+    the certificate backend is not queried, and the client key not
+    decrypted, every time the conductor talks to a cluster.
+    """
+    refs = (cluster.ca_cert_ref, cluster.magnum_cert_ref)
+    now = timeutils.utcnow_ts()
+    with _SSL_CONTEXTS_LOCK:
+        entry = _SSL_CONTEXTS.get(cluster.uuid)
+        if entry is not None and entry[0] == refs and entry[1] > now:
+            _SSL_CONTEXTS.move_to_end(cluster.uuid)
+            _SSL_CONTEXTS_STATS['hits'] += 1
+            return entry[2]
+        _SSL_CONTEXTS_STATS['misses'] += 1
+
+    ssl_context = _create_client_ssl_context(cluster, context)
+    with _SSL_CONTEXTS_LOCK:
+        _SSL_CONTEXTS[cluster.uuid] = (
+            refs, now + CONF.cluster.client_cert_cache_ttl, ssl_context)
+        _SSL_CONTEXTS.move_to_end(cluster.uuid)
+        while len(_SSL_CONTEXTS) > CONF.cluster.client_cert_cache_size:
+            _SSL_CONTEXTS.popitem(last=False)
+    return ssl_context
+
+
+def invalidate_client_ssl_context(cluster_uuid):
+    """Drop the cached TLS client context of a cluster.
+
+    Must be called when a cluster is deleted or its CA is rotated.
+    """
+    invalidate_client_ssl_contexts([cluster_uuid])
+
+
+def invalidate_client_ssl_contexts(cluster_uuids):
+    """Drop the cached TLS client contexts of several clusters."""
+    with _SSL_CONTEXTS_LOCK:
+        for cluster_uuid in cluster_uuids:
+            _SSL_CONTEXTS.pop(cluster_uuid, None)
+
+
+def clear_client_ssl_context_cache():
+    with _SSL_CONTEXTS_LOCK:
+        _SSL_CONTEXTS.clear()
+        _SSL_CONTEXTS_STATS.update(hits=0, misses=0)
+
+
+def get_client_ssl_context_stats():
+    with _SSL_CONTEXTS_LOCK:
+        return dict(_SSL_CONTEXTS_STATS, size=len(_SSL_CONTEXTS))
+
+
 def sign_node_certificate(cluster, csr, ca_cert_type=None, context=None):
     ref = cluster.ca_cert_ref
     if ca_cert_type == "etcd":
@@ -233,11 +334,11 @@ def sign_node_certificate(cluster, csr, ca_cert_type=None, context=None):
 
 
 def delete_certificates_from_cluster(cluster, context=None):
-    """Delete ca cert and magnum client cert from cluster
+    """Delete the ca certs and magnum client cert from cluster
 
     :param cluster: The cluster which has certs
     """
-    for cert_ref in ['ca_cert_ref', 'magnum_cert_ref']:
+    for cert_ref in CERT_REFS:
         try:
             cert_ref = getattr(cluster, cert_ref, None)
             if cert_ref:
@@ -248,6 +349,26 @@ def delete_certificates_from_cluster(cluster, context=None):
                         cluster.uuid)
 
 
+def delete_certificates_from_clusters(clusters, context=None):
+    """Delete the ca certs and magnum client cert from several clusters
+
+    When the certificates are stored in the magnum database, they are not
+    deleted here: their uuids are returned so that they can be deleted
+    along with the clusters, see Cluster.destroy_clusters.
+
+    :param clusters: The clusters which have certs
+    :returns: the uuids of the x509keypairs left to delete
+    """
+    if (cert_manager.get_backend().CertManager is
+            x509keypair_cert_manager.CertManager):
+        return [getattr(cluster, cert_ref) for cluster in clusters
+                for cert_ref in CERT_REFS
+                if getattr(cluster, cert_ref, None)]
+    for cluster in clusters:
+        delete_certificates_from_cluster(cluster, context=context)
+    return []
+
+
 def delete_client_files(cluster, context=None):
     cached_cert_dir = os.path.join(CONF.cluster.temp_cache_dir,
                                    cluster.uuid)
@@ -20,6 +20,7 @@ from oslo_log import log as logging
 
 from magnum.common import exception
 from magnum.common import profiler
+from magnum.conductor import utils as conductor_utils
 import magnum.conf
 from magnum.drivers.common import driver
 from magnum.i18n import _
@@ -69,6 +70,7 @@ def allowed_operation(func):
 @profiler.trace_cls("rpc")
 class Handler(object):
 
+    @conductor_utils.release_quota_reservation
     @allowed_operation
     def nodegroup_create(self, context, cluster, nodegroup):
         LOG.debug("nodegroup_conductor nodegroup_create")
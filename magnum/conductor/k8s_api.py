@@ -12,9 +12,260 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import codecs
+import collections
+import contextlib
+import json
+import threading
+
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
 import requests
+from requests import adapters
+
+from magnum.conductor.handlers.common import cert_manager
+import magnum.conf
+
+CONF = magnum.conf.CONF
+LOG = logging.getLogger(__name__)
+
+_SESSIONS = collections.OrderedDict()
+_SESSIONS_LOCK = threading.Lock()
+
+
+class _SSLContextAdapter(adapters.HTTPAdapter):
+    """HTTP adapter that authenticates with a prebuilt SSL context.
+
+    The context already trusts the cluster CA and carries the client
+    certificate, so the CA bundle and certificate files that requests
+    would otherwise apply to every connection are left out.
+    """
+
+    def __init__(self, ssl_context, **kwargs):
+        self._ssl_context = ssl_context
+        super(_SSLContextAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self._ssl_context
+        return super(_SSLContextAdapter, self).init_poolmanager(
+            *args, **kwargs)
+
+    def cert_verify(self, conn, url, verify, cert):
+        pass
+
+
+class _ClusterSession(object):
+    """A keep-alive session bound to the client certificates of a cluster."""
+
+    def __init__(self, context, cluster):
+        self.session = requests.Session()
+        # The SSL context is all the session authenticates with. Keep the
+        # proxies and CA bundle of the environment out of it: a bundle
+        # path in verify would be loaded into the shared context.
+        self.session.trust_env = False
+        self.session.verify = True
+        adapter = _SSLContextAdapter(
+            cert_manager.get_client_ssl_context(cluster, context),
+            pool_connections=1,
+            pool_maxsize=CONF.kubernetes.api_session_pool_size)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+
+class _ListDecoder(object):
+    """Incrementally decode a Kubernetes list response.
+
+    The items of the list are decoded and handed out one at a time while
+    the body is read in chunks, so that at most one item and one chunk of
+    the response are held in memory. The other top-level members, such as
+    the list ``metadata``, are decoded as a whole.
+    """
+
+    _WHITESPACE = ' \t\n\r'
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self.members = {}
+
+    def _fill(self):
+        if self._eof:
+            return False
+        # drop what has been consumed already
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk)
+            if text:
+                self._buf += text
+                return True
+        self._buf += self._utf8.decode(b'', final=True)
+        self._eof = True
+        return False
+
+    def _peek(self):
+        while True:
+            while (self._pos < len(self._buf) and
+                   self._buf[self._pos] in self._WHITESPACE):
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of Kubernetes list')
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError('Expected %r in Kubernetes list at %d' %
+                             (char, self._pos))
+        self._pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+            # a number or literal at the end of the buffer may go on in
+            # the next chunk
+            if end < len(self._buf) or self._eof or not self._fill():
+                self._pos = end
+                return value
+
+    def _separator(self, close):
+        """Skip a comma and return False, or consume close and return True."""
+        char = self._peek()
+        if char == close:
+            self._pos += 1
+            return True
+        self._expect(',')
+        return False
+
+    def items(self):
+        self._expect('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == 'items' and self._peek() == '[':
+                self._pos += 1
+                if self._peek() == ']':
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._separator(']'):
+                            break
+            else:
+                self.members[key] = self._value()
+            if self._separator('}'):
+                return
+
 
-from magnum.conductor.handlers.common.cert_manager import create_client_files
+def _project(obj, fields):
+    """Keep only the given fields of a decoded Kubernetes object.
+
+    :param fields: A dict whose keys are the names of the fields to keep.
+                   A value of None keeps the field as is, a dict projects
+                   the field, or every element of it for lists, further.
+    """
+    if isinstance(obj, list):
+        return [_project(o, fields) for o in obj]
+    if not isinstance(obj, dict):
+        return obj
+    projected = {}
+    for name, sub_fields in fields.items():
+        if name in obj:
+            value = obj[name]
+            if sub_fields is not None:
+                value = _project(value, sub_fields)
+            projected[name] = value
+    return projected
+
+
+# The parts of nodes and pods the conductor actually looks at.
+NODE_FIELDS = {
+    'metadata': {'name': None},
+    'status': {'capacity': None, 'allocatable': None, 'conditions': None},
+}
+POD_FIELDS = {
+    'metadata': {'name': None, 'namespace': None},
+    'spec': {
+        'nodeName': None,
+        'containers': {'name': None, 'resources': None},
+    },
+    'status': {'phase': None},
+}
+
+
+def _session_key(cluster):
+    # A new CA or client certificate means a new session.
+    return (cluster.uuid, cluster.ca_cert_ref, cluster.magnum_cert_ref)
+
+
+def _get_session(context, cluster):
+    key = _session_key(cluster)
+    with _SESSIONS_LOCK:
+        entry = _SESSIONS.get(key)
+        if entry is not None:
+            _SESSIONS.move_to_end(key)
+            return entry.session
+
+    entry = _ClusterSession(context, cluster)
+    evicted = []
+    with _SESSIONS_LOCK:
+        if key in _SESSIONS:
+            # another thread got there first
+            evicted.append(entry)
+            entry = _SESSIONS[key]
+            _SESSIONS.move_to_end(key)
+        else:
+            # sessions created for older certificates are of no use
+            for old_key in [k for k in _SESSIONS if k[0] == cluster.uuid]:
+                evicted.append(_SESSIONS.pop(old_key))
+            _SESSIONS[key] = entry
+            while len(_SESSIONS) > CONF.kubernetes.api_session_cache_size:
+                evicted.append(_SESSIONS.popitem(last=False)[1])
+    for old in evicted:
+        old.close()
+    return entry.session
+
+
+def evict_session(cluster_uuid):
+    """Close and forget the cached sessions of a cluster.
+
+    Must be called when a cluster is deleted or its CA is rotated.
+    """
+    evict_sessions([cluster_uuid])
+
+
+def evict_sessions(cluster_uuids):
+    """Close and forget the cached sessions of several clusters."""
+    cluster_uuids = set(cluster_uuids)
+    with _SESSIONS_LOCK:
+        evicted = [(k[0], _SESSIONS.pop(k)) for k in list(_SESSIONS)
+                   if k[0] in cluster_uuids]
+    for cluster_uuid, entry in evicted:
+        entry.close()
+        LOG.debug("Evicted Kubernetes API session of cluster %s",
+                  cluster_uuid)
+
+
+def clear_session_cache():
+    with _SESSIONS_LOCK:
+        evicted = list(_SESSIONS.values())
+        _SESSIONS.clear()
+    for entry in evicted:
+        entry.close()
 
 
 class KubernetesAPI:
@@ -25,28 +276,19 @@ class KubernetesAPI:
     reason behind it is that the native `kubernetes` library does not
     seem to be quite thread-safe at the moment.
 
-    Also, our interactions with the Kubernetes API are happening inside
-    Greenthreads so we don't need to use connection pooling on top of it,
-    in addition to pools not being something that you can disable with
-    the native Kubernetes API.
+    Requests go through a process-wide, bounded LRU of per-cluster
+    sessions so that connections to the API server, and the TLS sessions
+    on them, are kept alive and reused across health polls instead of
+    paying for a new mutual TLS handshake on every call.
     """
 
     def __init__(self, context, cluster):
         self.context = context
         self.cluster = cluster
-
-        # Load certificates for cluster
-        (self.ca_file, self.key_file, self.cert_file) = create_client_files(
-            self.cluster, self.context
-        )
+        self.session = _get_session(context, cluster)
 
     def _request(self, method, url, json=True):
-        response = requests.request(
-            method,
-            url,
-            verify=self.ca_file.name,
-            cert=(self.cert_file.name, self.key_file.name)
-        )
+        response = self.session.request(method, url)
         response.raise_for_status()
         if json:
             return response.json()
@@ -71,6 +313,110 @@ class KubernetesAPI:
             f"{self.cluster.api_address}/api/v1/nodes"
         )
 
+    def _iter_list(self, url, fields, limit=None, resource_version=None,
+                   metadata=None):
+        limit = limit or CONF.kubernetes.api_list_page_size
+        if resource_version is None:
+            params = {'limit': limit}
+        else:
+            # lists served from the watch cache are never paginated
+            params = {'resourceVersion': resource_version}
+        while True:
+            response = self.session.request('GET', url, params=params,
+                                            stream=True)
+            response.raise_for_status()
+            with contextlib.closing(response):
+                decoder = _ListDecoder(response.iter_content(64 * 1024))
+                for item in decoder.items():
+                    yield _project(item, fields)
+            list_metadata = decoder.members.get('metadata') or {}
+            if metadata is not None:
+                metadata.update(list_metadata)
+            token = list_metadata.get('continue')
+            if not token:
+                return
+            # the resource version is pinned by the continue token
+            params = {'limit': limit, 'continue': token}
+
+    def iter_node(self, limit=None, resource_version=None, metadata=None):
+        """Iterate over the nodes in the cluster, one page at a time.
+
+        Only the fields in NODE_FIELDS are kept on each node.
+
+        :param limit: Number of nodes per page, defaults to
+                      [kubernetes]api_list_page_size.
+        :param resource_version: Passing '0' lets the API server answer
+                                 from its watch cache, in a single page.
+        :param metadata: If given, a dict updated with the list metadata,
+                         e.g. its resourceVersion, once iteration is over.
+        :return: Iterator over the nodes.
+        """
+        return self._iter_list(f"{self.cluster.api_address}/api/v1/nodes",
+                               NODE_FIELDS, limit=limit,
+                               resource_version=resource_version,
+                               metadata=metadata)
+
+    def iter_namespaced_pod(self, namespace, limit=None,
+                            resource_version=None):
+        """Iterate over the pods in the given namespace, one page at a time.
+
+        Only the fields in POD_FIELDS are kept on each pod.
+
+        :param namespace: Namespace to list pods from.
+        :param limit: Number of pods per page, defaults to
+                      [kubernetes]api_list_page_size.
+        :param resource_version: Passing '0' lets the API server answer
+                                 from its watch cache, in a single page.
+        :return: Iterator over the pods.
+        """
+        return self._iter_list(
+            f"{self.cluster.api_address}/api/v1/namespaces/{namespace}/pods",
+            POD_FIELDS, limit=limit, resource_version=resource_version)
+
+    def iter_pod(self, limit=None, resource_version=None):
+        """Iterate over the pods in all namespaces, one page at a time.
+
+        Only the fields in POD_FIELDS are kept on each pod.
+
+        :param limit: Number of pods per page, defaults to
+                      [kubernetes]api_list_page_size.
+        :param resource_version: Passing '0' lets the API server answer
+                                 from its watch cache, in a single page.
+        :return: Iterator over the pods.
+        """
+        return self._iter_list(f"{self.cluster.api_address}/api/v1/pods",
+                               POD_FIELDS, limit=limit,
+                               resource_version=resource_version)
+
+    def watch_node(self, resource_version, timeout_seconds):
+        """Watch node changes in the cluster.
+
+        :param resource_version: Resource version to start watching from,
+                                 usually the one of a previous list_node.
+        :param timeout_seconds: How long the API server keeps the watch
+                                open before ending it.
+        :return: Iterator over the watch events, each one a dict with the
+                 event ``type`` and the affected ``object``.
+        """
+        response = self.session.request(
+            'GET',
+            f"{self.cluster.api_address}/api/v1/nodes",
+            params={
+                'watch': 'true',
+                'resourceVersion': resource_version,
+                'allowWatchBookmarks': 'true',
+                'timeoutSeconds': timeout_seconds,
+            },
+            stream=True,
+            # give the server some slack to close the watch on its own
+            timeout=(30, timeout_seconds + 30),
+        )
+        response.raise_for_status()
+        with contextlib.closing(response):
+            for line in response.iter_lines():
+                if line:
+                    yield jsonutils.loads(line)
+
     def list_namespaced_pod(self, namespace):
         """List all pods in the given namespace.
 
@@ -81,17 +427,3 @@ class KubernetesAPI:
             'GET',
             f"{self.cluster.api_address}/api/v1/namespaces/{namespace}/pods"
         )
-
-    def __del__(self):
-        """Close all of the file descriptions for the certificates
-
-        They are left open by `create_client_files`.
-
-        TODO(mnaser): Use a context manager and avoid having these here.
-        """
-        if hasattr(self, 'ca_file'):
-            self.ca_file.close()
-        if hasattr(self, 'cert_file'):
-            self.cert_file.close()
-        if hasattr(self, 'key_file'):
-            self.key_file.close()
@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+
+from oslo_log import log as logging
 from oslo_utils import uuidutils
 from pycadf import attachment
 from pycadf import cadftaxonomy as taxonomy
@@ -25,6 +28,9 @@ from magnum.objects import cluster
 from magnum.objects import cluster_template
 from magnum.objects import fields
 from magnum.objects import nodegroup
+from magnum.objects import quota
+
+LOG = logging.getLogger(__name__)
 
 
 def retrieve_cluster(context, cluster_ident):
@@ -181,3 +187,28 @@ def _get_nodegroup_object(context, cluster, node_count, is_master=False):
     ng.is_default = True
     ng.status = fields.ClusterStatus.CREATE_IN_PROGRESS
     return ng
+
+
+def release_quota_reservation(func):
+    """Release the quota the API reserved for a cluster operation.
+
+    The API passes the id of its reservation as the reservation_id
+    argument. Once the operation ends, successfully or not, the clusters
+    and nodes it created are counted in the usage of the project, so the
+    reservation is released in both cases.
+    """
+    @functools.wraps(func)
+    def wrapper(self, context, cluster, *args, **kwargs):
+        reservation_id = kwargs.pop('reservation_id', None)
+        try:
+            return func(self, context, cluster, *args, **kwargs)
+        finally:
+            if reservation_id is not None:
+                try:
+                    quota.Quota.release_reservation(context, reservation_id)
+                except Exception:
+                    LOG.exception('Failed to release the quota reserved '
+                                  'for cluster %s, it is released when it '
+                                  'expires.', cluster.uuid)
+
+    return wrapper
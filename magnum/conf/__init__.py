@@ -17,6 +17,7 @@ from oslo_config import cfg
 
 from magnum.conf import api
 from magnum.conf import barbican
+from magnum.conf import cache
 from magnum.conf import certificates
 from magnum.conf import cinder
 from magnum.conf import cluster
@@ -45,6 +46,7 @@ CONF = cfg.CONF
 
 api.register_opts(CONF)
 barbican.register_opts(CONF)
+cache.register_opts(CONF)
 cluster.register_opts(CONF)
 cluster_templates.register_opts(CONF)
 certificates.register_opts(CONF)
@@ -41,8 +41,33 @@ api_service_opts = [
                 default=False,
                 help='Enable SSL Magnum API service'),
     cfg.IntOpt('workers',
-               help='The maximum number of magnum-api processes to '
-                    'fork and run. Default to number of CPUs on the host.')
+               help='The number of magnum-api worker processes to fork '
+                    'and run. Default to number of CPUs on the host.'),
+    cfg.IntOpt('threads',
+               default=16,
+               min=1,
+               help='The number of threads of each magnum-api worker '
+                    'process, that is the number of connections a worker '
+                    'serves at the same time.'),
+    cfg.IntOpt('client_socket_timeout',
+               default=60,
+               min=0,
+               help='Timeout in seconds of the reads and writes of the '
+                    'client connections while a request is served. 0 means '
+                    'wait forever.'),
+    cfg.IntOpt('keepalive_timeout',
+               default=5,
+               min=0,
+               help='Number of seconds a keep-alive connection is kept '
+                    'open waiting for its next request. An idle '
+                    'connection holds a thread of the worker, so this is '
+                    'kept short. 0 closes the connections after each '
+                    'response.'),
+    cfg.IntOpt('backlog',
+               default=128,
+               min=1,
+               help='Number of connections waiting to be accepted by a '
+                    'magnum-api worker.'),
 ]
 
 
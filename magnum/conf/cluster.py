@@ -32,6 +32,17 @@ cluster_def_opts = [
                default="/var/lib/magnum/certificate-cache",
                help='Explicitly specify the temporary directory to hold '
                     'cached TLS certs.'),
+    cfg.IntOpt('client_cert_cache_ttl',
+               default=3600,
+               min=0,
+               help=_('Time in seconds the conductor keeps the client TLS '
+                      'context of a cluster in memory before loading its '
+                      'certificates from the certificate backend again.')),
+    cfg.IntOpt('client_cert_cache_size',
+               default=1024,
+               min=1,
+               help=_('Maximum number of clusters whose client TLS context '
+                      'is kept in memory by the conductor.')),
     cfg.IntOpt('pre_delete_lb_timeout',
                default=60,
                help=_('The timeout in seconds to wait for the load balancers '
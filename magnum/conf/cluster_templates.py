@@ -27,6 +27,31 @@ cluster_template_opts = [
                help=_("Default network driver for kubernetes "
                       "cluster-templates."),
                ),
+    cfg.IntOpt('cache_ttl',
+               default=30,
+               min=0,
+               help=_("Number of seconds a ClusterTemplate looked up by an "
+                      "admin context of all tenants, as the periodic tasks "
+                      "of the conductor do, is cached in the process. "
+                      "Changes made through another process become visible "
+                      "after at most this delay. 0 disables the cache.")),
+    cfg.IntOpt('cache_size',
+               default=1024,
+               min=1,
+               help=_("Maximum number of ClusterTemplates cached in the "
+                      "process. The least recently used one is dropped "
+                      "when the limit is reached.")),
+    cfg.IntOpt('public_list_cache_ttl',
+               default=30,
+               min=0,
+               help=_("Number of seconds the public ClusterTemplates which "
+                      "are not hidden, which every tenant lists, are cached "
+                      "for the listings of the API. They are cached in the "
+                      "process, or in the backend of the [cache] section "
+                      "when it is enabled, which is shared by all the API "
+                      "workers. Changes made through another process "
+                      "sharing no cache backend become visible after at "
+                      "most this delay. 0 disables the cache.")),
 ]
 
 
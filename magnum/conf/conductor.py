@@ -22,7 +22,33 @@ conductor_service_opts = [
                help='The queue to add conductor tasks to.'),
     cfg.IntOpt('workers',
                help='Number of magnum-conductor processes to fork and run. '
-                    'Default to number of CPUs on the host.')
+                    'Default to number of CPUs on the host.'),
+    cfg.IntOpt('periodic_sync_workers',
+               default=16,
+               min=1,
+               help='Maximum number of per-cluster status and health '
+                    'synchronization jobs the periodic tasks run '
+                    'concurrently. Clusters whose previous job is still '
+                    'running are skipped until it finishes.'),
+    cfg.BoolOpt('periodic_shard_clusters',
+                default=True,
+                help='Partition the clusters polled by the periodic status '
+                     'and health synchronization tasks across the live '
+                     'magnum-conductor hosts using a consistent hash ring. '
+                     'When disabled every conductor polls every cluster.'),
+    cfg.IntOpt('hash_ring_reset_interval',
+               default=30,
+               min=0,
+               help='Interval in seconds after which the conductor hash '
+                    'ring is rebuilt from the magnum_service heartbeat '
+                    'table.'),
+    cfg.IntOpt('stats_reconcile_interval',
+               default=3600,
+               min=60,
+               help='Interval in seconds between two recounts of the '
+                    'clusters and nodes of every project. The counts '
+                    'returned by the stats API are otherwise maintained '
+                    'as clusters and nodegroups change.'),
 ]
 
 
@@ -24,7 +24,24 @@ database_group = cfg.OptGroup(name='database',
 sql_opts = [
     cfg.StrOpt('mysql_engine',
                default='InnoDB',
-               help='MySQL engine to use.')
+               help='MySQL engine to use.'),
+    cfg.BoolOpt('enable_replica_reads',
+                default=False,
+                help='Send the reads that tolerate slightly stale data, '
+                     'like the listings of the API and the health scan '
+                     'of the conductor, to the replica database set with '
+                     'slave_connection.'),
+    cfg.IntOpt('replica_max_lag',
+               default=30,
+               min=0,
+               help='Maximum number of seconds the replica database may be '
+                    'behind the primary. Beyond that, or when the lag can '
+                    'not be measured, all reads go to the primary.'),
+    cfg.IntOpt('replica_lag_check_interval',
+               default=10,
+               min=1,
+               help='Interval in seconds between two measurements of the '
+                    'lag of the replica database.'),
 ]
 
 
@@ -33,6 +33,78 @@ kubernetes_opts = [
                help=('The default polling interval for Kubernetes cluster '
                      'health. If this number is negative the periodic task '
                      'will be disabled.')),
+    cfg.IntOpt('health_polling_max_interval',
+               default=300,
+               min=0,
+               help=('Upper bound in seconds for the polling interval of a '
+                     'cluster that keeps reporting HEALTHY. The interval of '
+                     'such a cluster doubles after every healthy poll, '
+                     'starting from health_polling_interval, until it '
+                     'reaches this value. Set it to health_polling_interval '
+                     'or lower to poll every cluster at a fixed interval.')),
+    cfg.IntOpt('health_polling_unhealthy_interval',
+               default=20,
+               min=1,
+               help=('Polling interval in seconds for clusters whose health '
+                     'is UNHEALTHY or UNKNOWN, or whose status or health '
+                     'changed since the previous poll.')),
+    cfg.FloatOpt('health_polling_jitter',
+                 default=0.2,
+                 min=0.0,
+                 max=1.0,
+                 help=('Fraction of the polling interval by which the next '
+                       'health poll of a cluster is randomly moved earlier '
+                       'or later, so that polls are spread out over time.')),
+    cfg.IntOpt('health_status_flush_interval',
+               default=5,
+               min=1,
+               help=('Interval, in seconds, at which the changed health '
+                     'status of the polled clusters is written to the '
+                     'database. Health polls that do not change the health '
+                     'status of a cluster are not written at all.')),
+    cfg.IntOpt('api_session_cache_size',
+               default=1024,
+               min=1,
+               help=('Maximum number of clusters for which the conductor '
+                     'keeps an open, keep-alive session to the Kubernetes '
+                     'API. The least recently used session is closed when '
+                     'the limit is reached.')),
+    cfg.IntOpt('api_session_pool_size',
+               default=2,
+               min=1,
+               help=('Maximum number of idle connections kept open to the '
+                     'Kubernetes API of each cluster.')),
+    cfg.IntOpt('api_list_page_size',
+               default=500,
+               min=1,
+               help=('Maximum number of nodes or pods the conductor asks '
+                     'the Kubernetes API for in a single page when listing '
+                     'them.')),
+    cfg.BoolOpt('api_list_from_watch_cache',
+                default=False,
+                help=('List the nodes and pods of the monitoring and health '
+                      'polls with resourceVersion=0, so that the API server '
+                      'answers from its watch cache instead of reading '
+                      'etcd. The API server ignores the page size for such '
+                      'lists and returns them whole, so this trades a '
+                      'lighter load on etcd for a larger response, and '
+                      'possibly slightly stale data.')),
+    cfg.BoolOpt('monitor_all_namespaces',
+                default=False,
+                help=('Account for the pods of all namespaces, instead of '
+                      'only the default namespace, when computing the '
+                      'memory and CPU utilization of a cluster.')),
+    cfg.BoolOpt('health_node_watch',
+                default=False,
+                help=('Track the Ready condition of the nodes of each '
+                      'cluster with a long-lived watch on the Kubernetes '
+                      'API instead of listing all the nodes on every '
+                      'health poll.')),
+    cfg.IntOpt('health_node_watch_relist_interval',
+               default=600,
+               min=60,
+               help=('Interval in seconds after which a node watch lists '
+                     'all the nodes again to recover from missed events.')),
 ]
 
 
@@ -24,6 +24,20 @@ quotas_def_opts = [
                       'override this default quota for a project by setting '
                       'explicit limit in quotas DB table (using /quotas REST '
                       'API endpoint).')),
+    cfg.IntOpt('max_nodes_per_project',
+               default=-1,
+               min=-1,
+               help=_('Max number of nodes, masters included, allowed per '
+                      'project. -1 means unlimited. Admin can override this '
+                      'default quota for a project by setting an explicit '
+                      'limit for the Node resource in quotas DB table.')),
+    cfg.IntOpt('reservation_expire',
+               default=3600,
+               min=60,
+               help=_('Number of seconds after which the quota reserved for '
+                      'a cluster operation is released if the conductor did '
+                      'not handle the operation. Expired reservations are '
+                      'released when the project stats are reconciled.')),
 ]
 
 
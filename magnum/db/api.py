@@ -43,14 +43,17 @@ class Connection(object, metaclass=abc.ABCMeta):
 
     @abc.abstractmethod
     def get_cluster_list(self, context, filters=None, limit=None,
-                         marker=None, sort_key=None, sort_dir=None):
+                         marker=None, sort_key=None, sort_dir=None,
+                         use_replica=False):
         """Get matching clusters.
 
         Return a list of the specified columns for all clusters that match the
         specified filters.
 
         :param context: The security context
-        :param filters: Filters to apply. Defaults to None.
+        :param filters: Filters to apply. Defaults to None. The labels
+                        filter is a dict of the labels the clusters must
+                        have, with these values.
 
         :param limit: Maximum number of clusters to return.
         :param marker: the last item of the previous page; we return the next
@@ -58,6 +61,8 @@ class Connection(object, metaclass=abc.ABCMeta):
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
+        :param use_replica: Whether the query may be served by the database
+                            replica, if one is configured and in sync.
         :returns: A list of tuples of the specified columns.
         """
 
@@ -108,14 +113,27 @@ class Connection(object, metaclass=abc.ABCMeta):
         """
 
     @abc.abstractmethod
-    def get_cluster_stats(self, context, project_id):
+    def get_cluster_stats(self, context, project_id, use_replica=False):
         """Return clusters stats for the given project.
 
         :param context: The security context
         :param project_id: The project id.
+        :param use_replica: Whether the query may be served by the database
+                            replica, if one is configured and in sync.
         :returns: clusters, nodes count.
         """
 
+    @abc.abstractmethod
+    def reconcile_project_stats(self):
+        """Recount the clusters and nodes of every project.
+
+        The counts returned by get_cluster_stats are maintained as clusters
+        and nodegroups change; this corrects any drift. Expired quota
+        reservations are dropped as well.
+
+        :returns: The number of projects whose counts were corrected.
+        """
+
     @abc.abstractmethod
     def get_cluster_count_all(self, context, filters=None):
         """Get count of matching clusters.
@@ -133,18 +151,42 @@ class Connection(object, metaclass=abc.ABCMeta):
         """
 
     @abc.abstractmethod
-    def update_cluster(self, cluster_id, values):
+    def destroy_clusters(self, cluster_ids, cert_refs=None):
+        """Destroy several clusters along with their nodegroups.
+
+        Everything is deleted in a single transaction.
+
+        :param cluster_ids: The uuids of the clusters.
+        :param cert_refs: The uuids of x509keypairs to delete as well,
+                          typically the certificates of the clusters.
+        :returns: The number of clusters deleted.
+        """
+
+    @abc.abstractmethod
+    def update_cluster(self, cluster_id, values, generation=None):
         """Update properties of a cluster.
 
         :param cluster_id: The id or uuid of a cluster.
+        :param generation: The generation of the cluster the changes are
+                           based on. If given, the update is only applied
+                           if the cluster has not been modified since.
         :returns: A cluster.
-        :raises: ClusterNotFound
+        :raises: ClusterNotFound, ConcurrentUpdate
+        """
+
+    @abc.abstractmethod
+    def update_clusters_health_status(self, updates):
+        """Update the health status of several clusters at once.
+
+        :param updates: A dict mapping the uuid of each cluster to a
+                        (health_status, health_status_reason) tuple.
+        :returns: The number of clusters updated.
         """
 
     @abc.abstractmethod
     def get_cluster_template_list(self, context, filters=None,
                                   limit=None, marker=None, sort_key=None,
-                                  sort_dir=None):
+                                  sort_dir=None, use_replica=False):
         """Get matching ClusterTemplates.
 
         Return a list of the specified columns for all ClusterTemplates that
@@ -159,9 +201,35 @@ class Connection(object, metaclass=abc.ABCMeta):
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
+        :param use_replica: Whether the query may be served by the database
+                            replica, if one is configured and in sync.
         :returns: A list of tuples of the specified columns.
         """
 
+    @abc.abstractmethod
+    def get_public_cluster_template_list(self, use_replica=False):
+        """Get the public ClusterTemplates which are not hidden.
+
+        These are the ClusterTemplates visible to every tenant.
+
+        :param use_replica: Whether the query may be served by the database
+                            replica, if one is configured and in sync.
+        :returns: A list of ClusterTemplates, sorted by id.
+        """
+
+    @abc.abstractmethod
+    def get_project_cluster_template_list(self, context, use_replica=False):
+        """Get the ClusterTemplates owned by the tenant of a context.
+
+        These are the ClusterTemplates of its project, or of its user when
+        it has no project, whether they are public or not.
+
+        :param context: The security context
+        :param use_replica: Whether the query may be served by the database
+                            replica, if one is configured and in sync.
+        :returns: A list of ClusterTemplates, sorted by id.
+        """
+
     @abc.abstractmethod
     def create_cluster_template(self, values):
         """Create a new ClusterTemplate.
@@ -333,7 +401,8 @@ class Connection(object, metaclass=abc.ABCMeta):
 
     @abc.abstractmethod
     def get_magnum_service_list(self, disabled=None, limit=None,
-                                marker=None, sort_key=None, sort_dir=None):
+                                marker=None, sort_key=None, sort_dir=None,
+                                use_replica=False):
         """Get matching magnum_service records.
 
         Return a list of the specified columns for all magnum_services
@@ -346,6 +415,8 @@ class Connection(object, metaclass=abc.ABCMeta):
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
+        :param use_replica: Whether the query may be served by the database
+                            replica, if one is configured and in sync.
         :returns: A list of tuples of the specified columns.
         """
 
@@ -443,6 +514,35 @@ class Connection(object, metaclass=abc.ABCMeta):
         :returns: Quota record.
         """
 
+    @abc.abstractmethod
+    def reserve_quota(self, project_id, resource_id, expires_at, clusters=0,
+                      nodes=0, cluster_limit=None, node_limit=None):
+        """Reserve quota for clusters and nodes about to be created.
+
+        The usage of the project, reservations included, is checked against
+        the limits and the reservation is added to it atomically.
+
+        :param project_id: The project the quota is reserved for.
+        :param resource_id: The uuid of the cluster the operation is for.
+        :param expires_at: When the reservation is dropped if it has not
+                           been released by then.
+        :param clusters: The number of clusters to reserve.
+        :param nodes: The number of nodes to reserve.
+        :param cluster_limit: The cluster limit of the project, None for
+                              no limit.
+        :param node_limit: The node limit of the project, None for no limit.
+        :returns: A quota reservation record.
+        :raises: QuotaExceeded
+        """
+
+    @abc.abstractmethod
+    def release_quota_reservation(self, reservation_id):
+        """Release a quota reservation.
+
+        :param reservation_id: The id of the reservation.
+        :returns: Whether a reservation was released.
+        """
+
     @abc.abstractmethod
     def get_federation_by_id(self, context, federation_id):
         """Return a federation for a given federation id.
@@ -567,7 +667,8 @@ class Connection(object, metaclass=abc.ABCMeta):
         """
 
     @abc.abstractmethod
-    def update_nodegroup(self, cluster_id, nodegroup_id, values):
+    def update_nodegroup(self, cluster_id, nodegroup_id, values,
+                         generation=None):
         """Update properties of a nodegroup.
 
         :param cluster_id: The uuid of the cluster where the nodegroup
@@ -584,8 +685,11 @@ class Connection(object, metaclass=abc.ABCMeta):
                       ...
                     }
 
+        :param generation: The generation of the nodegroup the changes are
+                           based on. If given, the update is only applied
+                           if the nodegroup has not been modified since.
         :returns: A nodegroup record.
-        :raises: NodeGroupNotFound
+        :raises: NodeGroupNotFound, ConcurrentUpdate
         """
 
     @abc.abstractmethod
@@ -624,10 +728,22 @@ class Connection(object, metaclass=abc.ABCMeta):
         :raises: NodeGroupNotFound
         """
 
+    @abc.abstractmethod
+    def list_nodegroups_for_clusters(self, context, cluster_ids,
+                                     use_replica=False):
+        """Get the nodegroups of several clusters in one query.
+
+        :param context: The security context
+        :param cluster_ids: The uuids of the clusters.
+        :param use_replica: Whether the query may be served by the database
+                            replica, if one is configured and in sync.
+        :returns: A list of nodegroups, ordered by id.
+        """
+
     @abc.abstractmethod
     def list_cluster_nodegroups(self, context, cluster_id, filters=None,
                                 limit=None, marker=None, sort_key=None,
-                                sort_dir=None):
+                                sort_dir=None, use_replica=False):
         """Get matching nodegroups in a given cluster.
 
         :param context: The security context
@@ -641,6 +757,8 @@ class Connection(object, metaclass=abc.ABCMeta):
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
+        :param use_replica: Whether the query may be served by the database
+                            replica, if one is configured and in sync.
 
         :returns: A list of nodegroup records.
         """
@@ -653,3 +771,50 @@ class Connection(object, metaclass=abc.ABCMeta):
                              belongs to.
         :returns: Count of matching clusters.
         """
+
+    @abc.abstractmethod
+    def purge_x509keypairs(self, older_than, limit, archive=None):
+        """Delete x509keypairs no cluster refers to any more.
+
+        :param older_than: Only key pairs last updated before this datetime
+                           are deleted, so that the certificates of clusters
+                           being created are kept.
+        :param limit: Maximum number of key pairs to delete.
+        :param archive: If given, called with the records to delete before
+                        they are deleted, in the same transaction. Nothing
+                        is deleted if it raises.
+        :returns: A list of the deleted x509keypair records.
+        """
+
+    @abc.abstractmethod
+    def purge_magnum_services(self, older_than, limit, archive=None):
+        """Delete the records of services not seen for a long time.
+
+        :param older_than: Only services which last reported before this
+                           datetime are deleted.
+        :param limit: Maximum number of services to delete.
+        :param archive: If given, called with the records to delete before
+                        they are deleted, in the same transaction. Nothing
+                        is deleted if it raises.
+        :returns: A list of the deleted magnum service records.
+        """
+
+    @abc.abstractmethod
+    def purge_failed_clusters(self, older_than, limit, archive=None):
+        """Delete clusters whose creation or deletion failed long ago.
+
+        The nodegroups and the x509keypairs of the clusters are deleted
+        along with them, in a single transaction. Clusters with
+        certificates stored outside of the x509keypair table, e.g. in
+        Barbican, are kept: only deleting them through the API deletes
+        their certificates too.
+
+        :param older_than: Only clusters last updated before this datetime
+                           are deleted.
+        :param limit: Maximum number of clusters to delete.
+        :param archive: If given, called with the records to delete before
+                        they are deleted, in the same transaction. Nothing
+                        is deleted if it raises.
+        :returns: A list of the deleted cluster, nodegroup and x509keypair
+                  records.
+        """
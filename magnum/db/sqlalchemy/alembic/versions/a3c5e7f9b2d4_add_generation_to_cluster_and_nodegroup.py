@@ -0,0 +1,31 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""add generation to cluster and nodegroup
+
+Revision ID: a3c5e7f9b2d4
+Revises: f2b9d6c4a8e1
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a3c5e7f9b2d4'
+down_revision = 'f2b9d6c4a8e1'
+
+from alembic import op  # noqa: E402
+import sqlalchemy as sa  # noqa: E402
+
+
+def upgrade():
+    for table in ('cluster', 'nodegroup'):
+        op.add_column(table, sa.Column('generation', sa.Integer(),
+                                       nullable=False, server_default='1'))
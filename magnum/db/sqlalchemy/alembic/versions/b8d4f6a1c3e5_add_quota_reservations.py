@@ -0,0 +1,52 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""add quota reservations
+
+Revision ID: b8d4f6a1c3e5
+Revises: a3c5e7f9b2d4
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b8d4f6a1c3e5'
+down_revision = 'a3c5e7f9b2d4'
+
+from alembic import op  # noqa: E402
+import sqlalchemy as sa  # noqa: E402
+
+
+def upgrade():
+    for column in ('reserved_clusters', 'reserved_nodes'):
+        op.add_column('project_stats',
+                      sa.Column(column, sa.Integer(), nullable=False,
+                                server_default='0'))
+    op.create_table(
+        'quota_reservations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('project_id', sa.String(length=255), nullable=True),
+        sa.Column('resource_id', sa.String(length=36), nullable=True),
+        sa.Column('clusters', sa.Integer(), nullable=False,
+                  server_default='0'),
+        sa.Column('nodes', sa.Integer(), nullable=False,
+                  server_default='0'),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        mysql_ENGINE='InnoDB',
+        mysql_DEFAULT_CHARSET='UTF8'
+    )
+    op.create_index('ix_quota_reservations_resource_id',
+                    'quota_reservations', ['resource_id'])
+    op.create_index('ix_quota_reservations_expires_at',
+                    'quota_reservations', ['expires_at'])
@@ -0,0 +1,54 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""add node_count and master_count to cluster
+
+Revision ID: c4a7e2f9b1d3
+Revises: b3e1cf4a2d5e
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c4a7e2f9b1d3'
+down_revision = 'b3e1cf4a2d5e'
+
+from alembic import op  # noqa: E402
+import sqlalchemy as sa  # noqa: E402
+
+
+def upgrade():
+    for name in ('node_count', 'master_count'):
+        op.add_column('cluster', sa.Column(name, sa.Integer(),
+                                           nullable=False,
+                                           server_default='0'))
+        op.create_index('ix_cluster_%s' % name, 'cluster', [name])
+
+    cluster = sa.sql.table('cluster',
+                           sa.sql.column('uuid', sa.String),
+                           sa.sql.column('node_count', sa.Integer),
+                           sa.sql.column('master_count', sa.Integer))
+    nodegroup = sa.sql.table('nodegroup',
+                             sa.sql.column('cluster_id', sa.String),
+                             sa.sql.column('role', sa.String),
+                             sa.sql.column('node_count', sa.Integer))
+
+    def node_count_sum(*criteria):
+        return sa.select(
+            sa.func.coalesce(sa.func.sum(nodegroup.c.node_count), 0)
+        ).where(nodegroup.c.cluster_id == cluster.c.uuid,
+                *criteria).scalar_subquery()
+
+    is_master = nodegroup.c.role == 'master'
+    op.execute(cluster.update().values(
+        node_count=node_count_sum(sa.or_(sa.not_(is_master),
+                                         nodegroup.c.role.is_(None))),
+        master_count=node_count_sum(is_master)))
@@ -0,0 +1,35 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""add indexes for cluster and nodegroup lookups
+
+Revision ID: e8f3b6a2d4c1
+Revises: c4a7e2f9b1d3
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e8f3b6a2d4c1'
+down_revision = 'c4a7e2f9b1d3'
+
+from alembic import op  # noqa: E402
+
+
+def upgrade():
+    # periodic status and health syncs list clusters by status
+    op.create_index('ix_cluster_status', 'cluster', ['status'])
+    # get_cluster_by_name and the tenant-scoped cluster lists
+    op.create_index('ix_cluster_project_id_name', 'cluster',
+                    ['project_id', 'name'])
+    # list_cluster_nodegroups, default_ng_master and default_ng_worker
+    op.create_index('ix_nodegroup_cluster_id_role_is_default', 'nodegroup',
+                    ['cluster_id', 'role', 'is_default'])
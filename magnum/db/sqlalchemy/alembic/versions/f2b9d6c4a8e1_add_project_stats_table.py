@@ -0,0 +1,65 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""add project_stats table
+
+Revision ID: f2b9d6c4a8e1
+Revises: e8f3b6a2d4c1
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f2b9d6c4a8e1'
+down_revision = 'e8f3b6a2d4c1'
+
+from alembic import op  # noqa: E402
+import sqlalchemy as sa  # noqa: E402
+
+
+def upgrade():
+    project_stats = op.create_table(
+        'project_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('project_id', sa.String(length=255), nullable=True),
+        sa.Column('clusters', sa.Integer(), nullable=False,
+                  server_default='0'),
+        sa.Column('nodes', sa.Integer(), nullable=False,
+                  server_default='0'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('project_id',
+                            name='uniq_project_stats0project_id'),
+        mysql_ENGINE='InnoDB',
+        mysql_DEFAULT_CHARSET='UTF8'
+    )
+
+    cluster = sa.sql.table('cluster',
+                           sa.sql.column('project_id', sa.String))
+    nodegroup = sa.sql.table('nodegroup',
+                             sa.sql.column('project_id', sa.String),
+                             sa.sql.column('node_count', sa.Integer))
+    conn = op.get_bind()
+    stats = {}
+    for project_id, count in conn.execute(
+            sa.select(cluster.c.project_id, sa.func.count())
+            .group_by(cluster.c.project_id)):
+        stats[project_id] = {'project_id': project_id, 'clusters': count,
+                             'nodes': 0}
+    for project_id, nodes in conn.execute(
+            sa.select(nodegroup.c.project_id,
+                      sa.func.sum(nodegroup.c.node_count))
+            .group_by(nodegroup.c.project_id)):
+        stats.setdefault(project_id, {'project_id': project_id,
+                                      'clusters': 0})['nodes'] = nodes or 0
+    if stats:
+        op.bulk_insert(project_stats, list(stats.values()))
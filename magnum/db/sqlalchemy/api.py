@@ -14,6 +14,7 @@
 
 """SQLAlchemy storage backend."""
 
+import collections
 import threading
 
 from oslo_db import api as oslo_db_api
@@ -28,6 +29,7 @@ from oslo_utils import uuidutils
 import sqlalchemy as sa
 from sqlalchemy.orm.exc import MultipleResultsFound
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.sql import func
 
 from magnum.common import exception
@@ -44,13 +46,34 @@ LOG = log.getLogger(__name__)
 
 _CONTEXT = threading.local()
 
+# Number of clusters updated by each statement of a bulk update
+HEALTH_STATUS_BATCH_SIZE = 100
+
+# Columns of the cluster table holding the uuid of an x509keypair.
+CLUSTER_CERT_REFS = ('ca_cert_ref', 'magnum_cert_ref', 'etcd_ca_cert_ref',
+                     'front_proxy_ca_cert_ref')
+
+# Clusters which never came up, or could not be deleted. Purging them only
+# removes their records, not the resources they may have left behind.
+PURGEABLE_CLUSTER_STATUSES = ('CREATE_FAILED', 'DELETE_FAILED')
+
 
 def get_backend():
     """The backend is this module itself."""
     return Connection()
 
 
-def _session_for_read():
+def _session_for_read(use_replica=False):
+    """Start a read transaction.
+
+    With use_replica, the transaction goes to the database replica
+    configured with [database]slave_connection, when replica reads are
+    enabled and the replica is not lagging behind. Only reads that can
+    tolerate slightly stale data should set it.
+    """
+    if (use_replica and CONF.database.enable_replica_reads and
+            CONF.database.slave_connection and _REPLICA.in_sync()):
+        return _wrap_session(enginefacade.reader.async_.using(_CONTEXT))
     return _wrap_session(enginefacade.reader.using(_CONTEXT))
 
 
@@ -68,6 +91,83 @@ def _wrap_session(session):
     return session
 
 
+def _replica_lag(engine):
+    """Return how many seconds the replica is behind, None if unknown."""
+    with engine.connect() as conn:
+        if engine.dialect.name == 'mysql':
+            try:
+                status = conn.exec_driver_sql(
+                    'SHOW REPLICA STATUS').mappings().first()
+            except db_exc.DBError:
+                # MySQL before 8.0.22
+                status = conn.exec_driver_sql(
+                    'SHOW SLAVE STATUS').mappings().first()
+            if status is None:
+                # not a replica, e.g. a node of a synchronous cluster
+                return 0
+            if 'Seconds_Behind_Source' in status:
+                return status['Seconds_Behind_Source']
+            return status['Seconds_Behind_Master']
+        if engine.dialect.name == 'postgresql':
+            return conn.exec_driver_sql(
+                'SELECT CASE WHEN NOT pg_is_in_recovery() OR '
+                'pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+                'THEN 0 ELSE EXTRACT(EPOCH FROM '
+                'now() - pg_last_xact_replay_timestamp()) END').scalar()
+    # the lag of other databases can not be measured
+    return 0
+
+
+class _ReplicaMonitor(object):
+    """Tracks whether the replica is close enough to the primary.
+
+    The lag of the replica is measured at most once every
+    [database]replica_lag_check_interval seconds. Until the first
+    measurement, and whenever the lag is over [database]replica_max_lag
+    or can not be measured, reads go to the primary.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._in_sync = False
+
+    def in_sync(self):
+        now = timeutils.utcnow_ts(microsecond=True)
+        with self._lock:
+            if (self._checked_at is not None and
+                    now - self._checked_at <
+                    CONF.database.replica_lag_check_interval):
+                return self._in_sync
+            # the other threads keep the last result during the check
+            self._checked_at = now
+
+        try:
+            lag = _replica_lag(enginefacade.reader.get_engine())
+        except Exception as e:
+            LOG.warning("Unable to measure the lag of the database "
+                        "replica, reading from the primary: %s", e)
+            lag = None
+        in_sync = lag is not None and lag <= CONF.database.replica_max_lag
+        if in_sync != self._in_sync:
+            if in_sync:
+                LOG.info("Database replica is in sync, serving reads "
+                         "from it")
+            elif lag is not None:
+                LOG.warning("Database replica is %s seconds behind, "
+                            "reading from the primary", lag)
+        self._in_sync = in_sync
+        return in_sync
+
+    def reset(self):
+        with self._lock:
+            self._checked_at = None
+            self._in_sync = False
+
+
+_REPLICA = _ReplicaMonitor()
+
+
 def add_identity_filter(query, value):
     """Adds an identity filter to a query.
 
@@ -101,6 +201,170 @@ def _paginate_query(model, limit=None, marker=None, sort_key=None,
     return query.all()
 
 
+# Updates without an expected generation are blind writes: when they lose
+# the compare-and-swap against a concurrent writer they are simply re-read
+# and re-applied.
+_retry_on_conflict = oslo_db_api.wrap_db_retry(
+    max_retries=5, retry_interval=0.05, max_retry_interval=1, jitter=True,
+    retry_on_deadlock=True)
+
+
+def _compare_and_swap(session, ref, values, generation, resource, ident):
+    """Write values to ref if nobody else updated it since it was read.
+
+    The models are mapped with generation as their version_id_col, so the
+    flush issues UPDATE ... WHERE generation = <generation read> and bumps
+    it, instead of relying on a SELECT ... FOR UPDATE row lock.
+
+    :param generation: the generation the caller based its changes on, or
+                       None to only guard against writes racing this one.
+    :raises: ConcurrentUpdate if the row was modified by another writer.
+    """
+    if generation is not None and ref.generation != generation:
+        raise exception.ConcurrentUpdate(resource=resource, id=ident)
+    ref.update(values)
+    try:
+        session.flush()
+    except StaleDataError:
+        conflict = exception.ConcurrentUpdate(resource=resource, id=ident)
+        if generation is None:
+            raise db_exc.RetryRequest(conflict)
+        raise conflict
+
+
+def _node_count_column(role):
+    if role == 'master':
+        return models.Cluster.master_count
+    return models.Cluster.node_count
+
+
+def _update_cluster_node_counts(session, cluster_id, role, delta):
+    """Apply the node count change of a nodegroup to its cluster.
+
+    The change is applied as an increment so that concurrent nodegroup
+    writes of the same cluster do not overwrite each other.
+    """
+    if not delta:
+        return
+    column = _node_count_column(role)
+    session.query(models.Cluster).filter_by(uuid=cluster_id).update(
+        {column: column + delta}, synchronize_session=False)
+
+
+def _update_project_stats(session, project_id, clusters=0, nodes=0):
+    """Apply a change of the cluster or node count of a project.
+
+    Like the node counts of the clusters, the change is applied as an
+    increment. The row of the project is created on its first change.
+    """
+    if not clusters and not nodes:
+        return
+    stats = models.ProjectStats
+    values = {stats.clusters: stats.clusters + clusters,
+              stats.nodes: stats.nodes + nodes}
+    query = session.query(stats).filter_by(project_id=project_id)
+    if query.update(values, synchronize_session=False):
+        return
+    try:
+        with session.begin_nested():
+            session.add(stats(project_id=project_id, clusters=clusters,
+                              nodes=nodes))
+    except db_exc.DBDuplicateEntry:
+        # created by a concurrent transaction in the meantime
+        query.update(values, synchronize_session=False)
+
+
+def _release_quota_reservations(session, refs):
+    """Delete reservations and take them off the usage of their project."""
+    released = False
+    for ref in refs:
+        # released by a concurrent transaction in the meantime
+        if not session.query(models.QuotaReservation).filter_by(
+                id=ref.id).delete(synchronize_session=False):
+            continue
+        stats = models.ProjectStats
+        session.query(stats).filter_by(project_id=ref.project_id).update(
+            {stats.reserved_clusters: stats.reserved_clusters - ref.clusters,
+             stats.reserved_nodes: stats.reserved_nodes - ref.nodes},
+            synchronize_session=False)
+        released = True
+    return released
+
+
+def _destroy_clusters(session, cluster_ids, cert_refs=None):
+    """Delete clusters, their nodegroups and key pairs, and update stats."""
+    cluster, nodegroup = models.Cluster, models.NodeGroup
+    nodegroups = session.query(nodegroup).filter(
+        nodegroup.cluster_id.in_(cluster_ids))
+    clusters = session.query(cluster).filter(cluster.uuid.in_(cluster_ids))
+    nodes = nodegroups.with_entities(
+        nodegroup.project_id, func.sum(nodegroup.node_count)
+    ).group_by(nodegroup.project_id).all()
+    counts = clusters.with_entities(
+        cluster.project_id, func.count()
+    ).group_by(cluster.project_id).all()
+
+    nodegroups.delete(synchronize_session=False)
+    if cert_refs:
+        session.query(models.X509KeyPair).filter(
+            models.X509KeyPair.uuid.in_(cert_refs)).delete(
+                synchronize_session=False)
+    count = clusters.delete(synchronize_session=False)
+
+    for project_id, node_count in nodes:
+        _update_project_stats(session, project_id,
+                              nodes=-int(node_count or 0))
+    for project_id, cluster_count in counts:
+        _update_project_stats(session, project_id, clusters=-cluster_count)
+    return count
+
+
+def _count_project_stats(session):
+    """Count the clusters, nodes and reservations of every project.
+
+    :returns: A dict mapping project ids to their clusters, nodes,
+              reserved clusters and reserved nodes.
+    """
+    counts = collections.defaultdict(lambda: [0, 0, 0, 0])
+    query = session.query(models.Cluster.project_id, func.count())
+    for project_id, clusters in query.group_by(models.Cluster.project_id):
+        counts[project_id][0] = clusters
+    query = session.query(models.NodeGroup.project_id,
+                          func.sum(models.NodeGroup.node_count))
+    for project_id, nodes in query.group_by(models.NodeGroup.project_id):
+        counts[project_id][1] = int(nodes or 0)
+    reservation = models.QuotaReservation
+    query = session.query(reservation.project_id,
+                          func.sum(reservation.clusters),
+                          func.sum(reservation.nodes))
+    for project_id, clusters, nodes in query.group_by(
+            reservation.project_id):
+        counts[project_id][2:] = [int(clusters or 0), int(nodes or 0)]
+    return counts
+
+
+def _sum_cluster_node_counts(session, cluster_id):
+    """Return the (node_count, master_count) of the nodegroups of a cluster."""
+    is_master = models.NodeGroup.role == 'master'
+    node_count = func.coalesce(models.NodeGroup.node_count, 0)
+    query = session.query(
+        func.sum(sa.case((is_master, 0), else_=node_count)),
+        func.sum(sa.case((is_master, node_count), else_=0)))
+    query = query.filter(models.NodeGroup.cluster_id == cluster_id)
+    node_count, master_count = query.one()
+    return node_count or 0, master_count or 0
+
+
+def _json_value(query, column, key):
+    """Return the string value of key in the JSON document of column."""
+    if query.session.get_bind().dialect.name == 'postgresql':
+        document = sa.cast(column, sa.JSON)
+    else:
+        # MySQL and SQLite read JSON from the text column as it is
+        document = sa.type_coerce(column, sa.JSON)
+    return document[key].as_string()
+
+
 class Connection(api.Connection):
     """SqlAlchemy connection."""
 
@@ -135,32 +399,26 @@ class Connection(api.Connection):
         if 'status' in filters:
             query = query.filter(models.Cluster.status.in_(filters['status']))
 
-        # Helper to filter based on node_count field from nodegroups
-        def filter_node_count(query, node_count, is_master=False):
-            nfunc = func.sum(models.NodeGroup.node_count)
-            with _session_for_read() as session:
-                nquery = session.query(models.NodeGroup)
-                if is_master:
-                    nquery = nquery.filter(models.NodeGroup.role == 'master')
-                else:
-                    nquery = nquery.filter(models.NodeGroup.role != 'master')
-                nquery = nquery.group_by(models.NodeGroup.cluster_id)
-                nquery = nquery.having(nfunc == node_count)
-                uuids = [ng.cluster_id for ng in nquery.all()]
-                return query.filter(models.Cluster.uuid.in_(uuids))
-
+        # node_count and master_count are kept in sync with the nodegroups
+        # of each cluster, see _update_cluster_node_counts
         if 'node_count' in filters:
-            query = filter_node_count(
-                query, filters['node_count'], is_master=False)
+            query = query.filter(
+                models.Cluster.node_count == filters['node_count'])
         if 'master_count' in filters:
-            query = filter_node_count(
-                query, filters['master_count'], is_master=True)
+            query = query.filter(
+                models.Cluster.master_count == filters['master_count'])
+
+        # a label selector, matched in the database rather than on the
+        # clusters loaded
+        for key, value in filters.get('labels', {}).items():
+            query = query.filter(
+                _json_value(query, models.Cluster.labels, key) == value)
 
         return query
 
     def get_cluster_list(self, context, filters=None, limit=None, marker=None,
-                         sort_key=None, sort_dir=None):
-        with _session_for_read() as session:
+                         sort_key=None, sort_dir=None, use_replica=False):
+        with _session_for_read(use_replica=use_replica) as session:
             query = session.query(models.Cluster)
             query = self._add_tenant_filters(context, query)
             query = self._add_clusters_filters(query, filters)
@@ -173,15 +431,23 @@ class Connection(api.Connection):
         if not values.get('uuid'):
             values['uuid'] = uuidutils.generate_uuid()
 
+        # the node counts are derived from the nodegroups of the cluster
+        values.pop('node_count', None)
+        values.pop('master_count', None)
+
         cluster = models.Cluster()
         cluster.update(values)
 
         with _session_for_write() as session:
+            # nodegroups may have been created before their cluster
+            cluster.node_count, cluster.master_count = (
+                _sum_cluster_node_counts(session, values['uuid']))
             try:
                 session.add(cluster)
                 session.flush()
             except db_exc.DBDuplicateEntry:
                 raise exception.ClusterAlreadyExists(uuid=values['uuid'])
+            _update_project_stats(session, cluster.project_id, clusters=1)
             return cluster
 
     def get_cluster_by_id(self, context, cluster_id):
@@ -218,22 +484,48 @@ class Connection(api.Connection):
             except NoResultFound:
                 raise exception.ClusterNotFound(cluster=cluster_uuid)
 
-    def get_cluster_stats(self, context, project_id=None):
-        with _session_for_read() as session:
-            query = session.query(models.Cluster)
-            node_count_col = models.NodeGroup.node_count
-            ncfunc = func.sum(node_count_col)
-
+    def get_cluster_stats(self, context, project_id=None, use_replica=False):
+        stats = models.ProjectStats
+        with _session_for_read(use_replica=use_replica) as session:
+            query = session.query(func.sum(stats.clusters),
+                                  func.sum(stats.nodes))
             if project_id:
-                query = query.filter_by(project_id=project_id)
-                nquery = query.session.query(ncfunc.label("nodes")).filter_by(
-                    project_id=project_id)
-            else:
-                nquery = query.session.query(ncfunc.label("nodes"))
+                query = query.filter(stats.project_id == project_id)
+            clusters, nodes = query.one()
+        return int(clusters or 0), int(nodes or 0)
 
-        clusters = query.count()
-        nodes = int(nquery.one()[0]) if nquery.one()[0] else 0
-        return clusters, nodes
+    @oslo_db_api.retry_on_deadlock
+    def reconcile_project_stats(self):
+        stats = models.ProjectStats
+        with _session_for_write() as session:
+            # concurrent writers wait for the reconciliation to commit
+            # before applying their own changes
+            rows = {row.project_id: row for row in
+                    session.query(stats).with_for_update()}
+            # reservations of operations which never reached the conductor
+            reservation = models.QuotaReservation
+            session.query(reservation).filter(
+                reservation.expires_at < timeutils.utcnow()).delete(
+                    synchronize_session=False)
+            counts = _count_project_stats(session)
+            columns = ('clusters', 'nodes', 'reserved_clusters',
+                       'reserved_nodes')
+            fixed = 0
+            for project_id, values in counts.items():
+                values = dict(zip(columns, values))
+                row = rows.pop(project_id, None)
+                if row is None:
+                    session.add(stats(project_id=project_id, **values))
+                elif any(row[c] != values[c] for c in columns):
+                    row.update(values)
+                else:
+                    continue
+                fixed += 1
+            for row in rows.values():
+                if any(row[c] for c in columns):
+                    fixed += 1
+                session.delete(row)
+        return fixed
 
     def get_cluster_count_all(self, context, filters=None):
         with _session_for_read() as session:
@@ -248,34 +540,90 @@ class Connection(api.Connection):
             query = session.query(models.Cluster)
             query = add_identity_filter(query, cluster_id)
 
-            try:
-                query.one()
-            except NoResultFound:
+            stats = models.ProjectStats
+            project_id = query.with_entities(
+                models.Cluster.project_id).scalar_subquery()
+            session.query(stats).filter(
+                stats.project_id == project_id).update(
+                    {stats.clusters: stats.clusters - 1},
+                    synchronize_session=False)
+            # the transaction, stats included, is rolled back on error
+            if not query.delete(synchronize_session=False):
                 raise exception.ClusterNotFound(cluster=cluster_id)
 
-            query.delete()
+    @oslo_db_api.retry_on_deadlock
+    def destroy_clusters(self, cluster_ids, cert_refs=None):
+        if not cluster_ids:
+            return 0
+        with _session_for_write() as session:
+            return _destroy_clusters(session, cluster_ids, cert_refs)
 
-    def update_cluster(self, cluster_id, values):
+    def update_cluster(self, cluster_id, values, generation=None):
         # NOTE(dtantsur): this can lead to very strange errors
         if 'uuid' in values:
             msg = _("Cannot overwrite UUID for an existing Cluster.")
             raise exception.InvalidParameterValue(err=msg)
 
-        return self._do_update_cluster(cluster_id, values)
+        return self._do_update_cluster(cluster_id, values, generation)
 
-    @oslo_db_api.retry_on_deadlock
-    def _do_update_cluster(self, cluster_id, values):
+    @_retry_on_conflict
+    def _do_update_cluster(self, cluster_id, values, generation=None):
         with _session_for_write() as session:
             query = session.query(models.Cluster)
             query = add_identity_filter(query, cluster_id)
             try:
-                ref = query.with_for_update().one()
+                ref = query.one()
             except NoResultFound:
                 raise exception.ClusterNotFound(cluster=cluster_id)
 
-            ref.update(values)
+            _compare_and_swap(session, ref, values, generation, 'Cluster',
+                              cluster_id)
         return ref
 
+    @oslo_db_api.retry_on_deadlock
+    def update_clusters_health_status(self, updates):
+        uuids = list(updates)
+        reason_type = models.Cluster.health_status_reason.type
+        count = 0
+        with _session_for_write() as session:
+            for start in range(0, len(uuids), HEALTH_STATUS_BATCH_SIZE):
+                batch = uuids[start:start + HEALTH_STATUS_BATCH_SIZE]
+                health_status = sa.case(
+                    {uuid: updates[uuid][0] for uuid in batch},
+                    value=models.Cluster.uuid)
+                health_status_reason = sa.case(
+                    {uuid: sa.literal(updates[uuid][1], reason_type)
+                     for uuid in batch},
+                    value=models.Cluster.uuid)
+                query = session.query(models.Cluster).filter(
+                    models.Cluster.uuid.in_(batch))
+                count += query.update(
+                    {'health_status': health_status,
+                     'health_status_reason': health_status_reason},
+                    synchronize_session=False)
+        return count
+
+    def _add_cluster_template_visibility(self, context, query):
+        """Restrict query to the ClusterTemplates visible in context.
+
+        These are the ClusterTemplates of the tenant, the public ones that
+        are not hidden, and for admins the hidden public ones as well.
+        """
+        if context.is_admin and context.all_tenants:
+            return query
+
+        template = models.ClusterTemplate
+        if context.project_id:
+            visible = [template.project_id == context.project_id]
+        else:
+            visible = [template.user_id == context.user_id]
+        if context.is_admin:
+            visible.append(template.public == sa.true())
+        else:
+            visible.append(sa.and_(template.public == sa.true(),
+                                   template.hidden == sa.false()))
+        return query.filter(sa.or_(*visible))
+
     def _add_cluster_template_filters(self, query, filters):
         if filters is None:
             filters = {}
@@ -292,24 +640,33 @@ class Connection(api.Connection):
         return query.filter_by(**filter_dict)
 
     def get_cluster_template_list(self, context, filters=None, limit=None,
-                                  marker=None, sort_key=None, sort_dir=None):
-        with _session_for_read() as session:
+                                  marker=None, sort_key=None, sort_dir=None,
+                                  use_replica=False):
+        with _session_for_read(use_replica=use_replica) as session:
             query = session.query(models.ClusterTemplate)
-            query = self._add_tenant_filters(context, query)
+            query = self._add_cluster_template_visibility(context, query)
             query = self._add_cluster_template_filters(query, filters)
-            # include public (and not hidden)  ClusterTemplates
-            public_q = session.query(models.ClusterTemplate).filter_by(
-                public=True, hidden=False)
-            query = query.union(public_q)
-            # include hidden and public ClusterTemplate if admin
-            if context.is_admin:
-                hidden_q = session.query(models.ClusterTemplate).filter_by(
-                    public=True, hidden=True)
-                query = query.union(hidden_q)
 
         return _paginate_query(models.ClusterTemplate, limit, marker,
                                sort_key, sort_dir, query)
 
+    def get_public_cluster_template_list(self, use_replica=False):
+        template = models.ClusterTemplate
+        with _session_for_read(use_replica=use_replica) as session:
+            query = session.query(template).filter(
+                template.public == sa.true(), template.hidden == sa.false())
+            return query.order_by(template.id).all()
+
+    def get_project_cluster_template_list(self, context, use_replica=False):
+        template = models.ClusterTemplate
+        with _session_for_read(use_replica=use_replica) as session:
+            query = session.query(template)
+            if context.project_id:
+                query = query.filter(template.project_id == context.project_id)
+            else:
+                query = query.filter(template.user_id == context.user_id)
+            return query.order_by(template.id).all()
+
     @oslo_db_api.retry_on_deadlock
     def create_cluster_template(self, values):
         # ensure defaults are present for new ClusterTemplates
@@ -331,14 +688,7 @@ class Connection(api.Connection):
     def get_cluster_template_by_id(self, context, cluster_template_id):
         with _session_for_read() as session:
             query = session.query(models.ClusterTemplate)
-            query = self._add_tenant_filters(context, query)
-            public_q = session.query(models.ClusterTemplate).filter_by(
-                public=True, hidden=False)
-            query = query.union(public_q)
-            if context.is_admin:
-                hidden_q = session.query(models.ClusterTemplate).filter_by(
-                    public=True, hidden=True)
-                query = query.union(hidden_q)
+            query = self._add_cluster_template_visibility(context, query)
             query = query.filter(
                 models.ClusterTemplate.id == cluster_template_id)
             try:
@@ -350,14 +700,7 @@ class Connection(api.Connection):
     def get_cluster_template_by_uuid(self, context, cluster_template_uuid):
         with _session_for_read() as session:
             query = session.query(models.ClusterTemplate)
-            query = self._add_tenant_filters(context, query)
-            public_q = session.query(models.ClusterTemplate).filter_by(
-                public=True, hidden=False)
-            query = query.union(public_q)
-            if context.is_admin:
-                hidden_q = session.query(models.ClusterTemplate).filter_by(
-                    public=True, hidden=True)
-                query = query.union(hidden_q)
+            query = self._add_cluster_template_visibility(context, query)
             query = query.filter(
                 models.ClusterTemplate.uuid == cluster_template_uuid)
             try:
@@ -369,14 +712,7 @@ class Connection(api.Connection):
     def get_cluster_template_by_name(self, context, cluster_template_name):
         with _session_for_read() as session:
             query = session.query(models.ClusterTemplate)
-            query = self._add_tenant_filters(context, query)
-            public_q = session.query(models.ClusterTemplate).filter_by(
-                public=True, hidden=False)
-            query = query.union(public_q)
-            if context.is_admin:
-                hidden_q = session.query(models.ClusterTemplate).filter_by(
-                    public=True, hidden=True)
-                query = query.union(hidden_q)
+            query = self._add_cluster_template_visibility(context, query)
             query = query.filter(
                 models.ClusterTemplate.name == cluster_template_name)
             try:
@@ -438,7 +774,7 @@ class Connection(api.Connection):
             query = session.query(models.ClusterTemplate)
             query = add_identity_filter(query, cluster_template_id)
             try:
-                ref = query.with_for_update().one()
+                ref = query.one()
             except NoResultFound:
                 raise exception.ClusterTemplateNotFound(
                     clustertemplate=cluster_template_id)
@@ -602,9 +938,9 @@ class Connection(api.Connection):
             return magnum_service
 
     def get_magnum_service_list(self, disabled=None, limit=None,
-                                marker=None, sort_key=None, sort_dir=None
-                                ):
-        with _session_for_read() as session:
+                                marker=None, sort_key=None, sort_dir=None,
+                                use_replica=False):
+        with _session_for_read(use_replica=use_replica) as session:
             query = session.query(models.MagnumService)
             if disabled:
                 query = query.filter_by(disabled=disabled)
@@ -656,7 +992,7 @@ class Connection(api.Connection):
             try:
                 query = query.filter_by(project_id=project_id).filter_by(
                     resource=resource)
-                ref = query.with_for_update().one()
+                ref = query.one()
             except NoResultFound:
                 msg = (_('project_id %(project_id)s resource %(resource)s.') %
                        {'project_id': project_id, 'resource': resource})
@@ -712,6 +1048,73 @@ class Connection(api.Connection):
                        {'project_id': project_id, 'resource': resource})
                 raise exception.QuotaNotFound(msg=msg)
 
+    @oslo_db_api.retry_on_deadlock
+    def reserve_quota(self, project_id, resource_id, expires_at, clusters=0,
+                      nodes=0, cluster_limit=None, node_limit=None):
+        stats = models.ProjectStats
+        checks = []
+        if clusters > 0 and cluster_limit is not None:
+            checks.append(('clusters', cluster_limit, clusters,
+                           stats.clusters + stats.reserved_clusters))
+        if nodes > 0 and node_limit is not None:
+            checks.append(('nodes', node_limit, nodes,
+                           stats.nodes + stats.reserved_nodes))
+        values = {stats.reserved_clusters: stats.reserved_clusters + clusters,
+                  stats.reserved_nodes: stats.reserved_nodes + nodes}
+
+        def reserve(session):
+            # check and reserve in one statement, so that concurrent
+            # reservations can't exceed the limits together
+            query = session.query(stats).filter_by(project_id=project_id)
+            query = query.filter(*[usage + delta <= limit
+                                   for _r, limit, delta, usage in checks])
+            return query.update(values, synchronize_session=False)
+
+        def exceeded(session):
+            row = session.query(stats).filter_by(
+                project_id=project_id).first()
+            usage = {'clusters': 0, 'nodes': 0}
+            if row is not None:
+                usage = {'clusters': row.clusters + row.reserved_clusters,
+                         'nodes': row.nodes + row.reserved_nodes}
+            for resource, limit, delta, _usage in checks:
+                if usage[resource] + delta > limit:
+                    return exception.QuotaExceeded(resource=resource,
+                                                   limit=limit)
+
+        with _session_for_write() as session:
+            if not reserve(session):
+                error = exceeded(session)
+                if error:
+                    raise error
+                # first reservation of the project
+                try:
+                    with session.begin_nested():
+                        session.add(stats(project_id=project_id,
+                                          reserved_clusters=clusters,
+                                          reserved_nodes=nodes))
+                except db_exc.DBDuplicateEntry:
+                    # created by a concurrent transaction in the meantime
+                    if not reserve(session):
+                        raise (exceeded(session) or exception.QuotaExceeded(
+                            resource=checks[0][0], limit=checks[0][1]))
+
+            reservation = models.QuotaReservation(
+                project_id=project_id, resource_id=resource_id,
+                clusters=clusters, nodes=nodes, expires_at=expires_at)
+            session.add(reservation)
+            session.flush()
+        return reservation
+
+    @oslo_db_api.retry_on_deadlock
+    def release_quota_reservation(self, reservation_id):
+        with _session_for_write() as session:
+            ref = session.query(models.QuotaReservation).filter_by(
+                id=reservation_id).first()
+            if ref is None:
+                return False
+            return _release_quota_reservations(session, [ref])
+
     def _add_federation_filters(self, query, filters):
         if filters is None:
             filters = {}
@@ -864,6 +1267,10 @@ class Connection(api.Connection):
             except db_exc.DBDuplicateEntry:
                 raise exception.NodeGroupAlreadyExists(
                     cluster_id=values['cluster_id'], name=values['name'])
+            _update_cluster_node_counts(session, nodegroup.cluster_id,
+                                        nodegroup.role, nodegroup.node_count)
+            _update_project_stats(session, nodegroup.project_id,
+                                  nodes=nodegroup.node_count or 0)
             return nodegroup
 
     @oslo_db_api.retry_on_deadlock
@@ -873,26 +1280,49 @@ class Connection(api.Connection):
             query = add_identity_filter(query, nodegroup_id)
             query = query.filter_by(cluster_id=cluster_id)
             try:
-                query.one()
+                ref = query.one()
             except NoResultFound:
                 raise exception.NodeGroupNotFound(nodegroup=nodegroup_id)
             query.delete()
-
-    def update_nodegroup(self, cluster_id, nodegroup_id, values):
-        return self._do_update_nodegroup(cluster_id, nodegroup_id, values)
-
-    @oslo_db_api.retry_on_deadlock
-    def _do_update_nodegroup(self, cluster_id, nodegroup_id, values):
+            _update_cluster_node_counts(session, ref.cluster_id, ref.role,
+                                        -(ref.node_count or 0))
+            _update_project_stats(session, ref.project_id,
+                                  nodes=-(ref.node_count or 0))
+
+    def update_nodegroup(self, cluster_id, nodegroup_id, values,
+                         generation=None):
+        return self._do_update_nodegroup(cluster_id, nodegroup_id, values,
+                                         generation)
+
+    @_retry_on_conflict
+    def _do_update_nodegroup(self, cluster_id, nodegroup_id, values,
+                             generation=None):
         with _session_for_write() as session:
             query = session.query(models.NodeGroup)
             query = add_identity_filter(query, nodegroup_id)
             query = query.filter_by(cluster_id=cluster_id)
             try:
-                ref = query.with_for_update().one()
+                ref = query.one()
             except NoResultFound:
                 raise exception.NodeGroupNotFound(nodegroup=nodegroup_id)
 
-            ref.update(values)
+            old_role, old_count = ref.role, ref.node_count
+            old_project_id = ref.project_id
+            # The swap only succeeds if the row still holds the values read
+            # above, so the node count deltas below are exact.
+            _compare_and_swap(session, ref, values, generation, 'NodeGroup',
+                              nodegroup_id)
+            if (ref.role, ref.node_count) != (old_role, old_count):
+                _update_cluster_node_counts(session, ref.cluster_id,
+                                            old_role, -(old_count or 0))
+                _update_cluster_node_counts(session, ref.cluster_id,
+                                            ref.role, ref.node_count)
+            if (ref.project_id, ref.node_count) != (old_project_id,
+                                                    old_count):
+                _update_project_stats(session, old_project_id,
+                                      nodes=-(old_count or 0))
+                _update_project_stats(session, ref.project_id,
+                                      nodes=ref.node_count or 0)
         return ref
 
     def get_nodegroup_by_id(self, context, cluster_id, nodegroup_id):
@@ -938,8 +1368,8 @@ class Connection(api.Connection):
 
     def list_cluster_nodegroups(self, context, cluster_id, filters=None,
                                 limit=None, marker=None, sort_key=None,
-                                sort_dir=None):
-        with _session_for_read() as session:
+                                sort_dir=None, use_replica=False):
+        with _session_for_read(use_replica=use_replica) as session:
             query = session.query(models.NodeGroup)
             if not context.is_admin:
                 query = query.filter_by(project_id=context.project_id)
@@ -948,6 +1378,15 @@ class Connection(api.Connection):
             return _paginate_query(
                 models.NodeGroup, limit, marker, sort_key, sort_dir, query)
 
+    def list_nodegroups_for_clusters(self, context, cluster_ids,
+                                     use_replica=False):
+        with _session_for_read(use_replica=use_replica) as session:
+            query = session.query(models.NodeGroup)
+            if not context.is_admin:
+                query = query.filter_by(project_id=context.project_id)
+            query = query.filter(models.NodeGroup.cluster_id.in_(cluster_ids))
+            return query.order_by(models.NodeGroup.id).all()
+
     def get_cluster_nodegroup_count(self, context, cluster_id):
         with _session_for_read() as session:
             query = session.query(models.NodeGroup)
@@ -955,3 +1394,67 @@ class Connection(api.Connection):
                 query = query.filter_by(project_id=context.project_id)
             query = query.filter_by(cluster_id=cluster_id)
             return query.count()
+
+    def purge_x509keypairs(self, older_than, limit, archive=None):
+        keypair, cluster = models.X509KeyPair, models.Cluster
+        referenced = sa.exists().where(sa.or_(
+            *[getattr(cluster, ref) == keypair.uuid
+              for ref in CLUSTER_CERT_REFS]))
+        with _session_for_write() as session:
+            query = session.query(keypair).filter(~referenced)
+            query = query.filter(func.coalesce(
+                keypair.updated_at, keypair.created_at) < older_than)
+            refs = query.order_by(keypair.id).limit(limit).all()
+            if refs:
+                if archive is not None:
+                    archive(refs)
+                session.query(keypair).filter(
+                    keypair.id.in_([ref.id for ref in refs])).delete(
+                        synchronize_session=False)
+        return refs
+
+    def purge_magnum_services(self, older_than, limit, archive=None):
+        service = models.MagnumService
+        with _session_for_write() as session:
+            query = session.query(service).filter(func.coalesce(
+                service.last_seen_up, service.updated_at,
+                service.created_at) < older_than)
+            refs = query.order_by(service.id).limit(limit).all()
+            if refs:
+                if archive is not None:
+                    archive(refs)
+                session.query(service).filter(
+                    service.id.in_([ref.id for ref in refs])).delete(
+                        synchronize_session=False)
+        return refs
+
+    def purge_failed_clusters(self, older_than, limit, archive=None):
+        cluster, keypair = models.Cluster, models.X509KeyPair
+        with _session_for_write() as session:
+            query = session.query(cluster).filter(
+                cluster.status.in_(PURGEABLE_CLUSTER_STATUSES))
+            query = query.filter(func.coalesce(
+                cluster.updated_at, cluster.created_at) < older_than)
+            # leave the clusters with certificates stored elsewhere, e.g.
+            # in Barbican, to a delete through the API which cleans them up
+            for ref in CLUSTER_CERT_REFS:
+                query = query.filter(sa.or_(
+                    getattr(cluster, ref).is_(None),
+                    getattr(cluster, ref).in_(
+                        session.query(keypair.uuid).scalar_subquery())))
+            clusters = query.order_by(cluster.id).limit(limit).all()
+            if not clusters:
+                return []
+            cluster_ids = [ref.uuid for ref in clusters]
+            cert_refs = [getattr(ref, cert_ref) for ref in clusters
+                         for cert_ref in CLUSTER_CERT_REFS
+                         if getattr(ref, cert_ref)]
+            nodegroups = session.query(models.NodeGroup).filter(
+                models.NodeGroup.cluster_id.in_(cluster_ids)).all()
+            keypairs = session.query(keypair).filter(
+                keypair.uuid.in_(cert_refs)).all()
+            rows = clusters + nodegroups + keypairs
+            if archive is not None:
+                archive(rows)
+            _destroy_clusters(session, cluster_ids, cert_refs)
+        return rows
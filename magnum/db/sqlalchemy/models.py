@@ -97,6 +97,8 @@ class Cluster(Base):
     __tablename__ = 'cluster'
     __table_args__ = (
         schema.UniqueConstraint('uuid'),
+        schema.Index('ix_cluster_status', 'status'),
+        schema.Index('ix_cluster_project_id_name', 'project_id', 'name'),
         table_args()
     )
     id = Column(Integer, primary_key=True)
@@ -134,6 +136,17 @@ class Cluster(Base):
     fixed_subnet = Column(String(255))
     floating_ip_enabled = Column(Boolean, default=True)
     master_lb_enabled = Column(Boolean, default=False)
+    # Sums of the node_count of the nodegroups of the cluster, maintained
+    # by the nodegroup DB API calls.
+    node_count = Column(Integer(), nullable=False, default=0,
+                        server_default='0', index=True)
+    master_count = Column(Integer(), nullable=False, default=0,
+                          server_default='0', index=True)
+    # Bumped by every ORM update of the row; updates are applied with
+    # UPDATE ... WHERE generation = :generation instead of a row lock.
+    generation = Column(Integer(), nullable=False, server_default='1')
+
+    __mapper_args__ = {'version_id_col': generation}
 
 
 class ClusterTemplate(Base):
@@ -232,6 +245,50 @@ class Quota(Base):
     hard_limit = Column(Integer())
 
 
+class ProjectStats(Base):
+    """Represents the number of clusters and nodes of a project.
+
+    The counts are kept up to date as clusters and nodegroups are created,
+    resized and deleted, and reconciled periodically.
+    """
+    __tablename__ = 'project_stats'
+    __table_args__ = (
+        schema.UniqueConstraint(
+            "project_id", name='uniq_project_stats0project_id'),
+        table_args()
+    )
+    id = Column(Integer, primary_key=True)
+    project_id = Column(String(255))
+    clusters = Column(Integer, nullable=False, default=0, server_default='0')
+    nodes = Column(Integer, nullable=False, default=0, server_default='0')
+    # Sums of the outstanding quota reservations of the project.
+    reserved_clusters = Column(Integer, nullable=False, default=0,
+                               server_default='0')
+    reserved_nodes = Column(Integer, nullable=False, default=0,
+                            server_default='0')
+
+
+class QuotaReservation(Base):
+    """Represents quota reserved for a cluster operation in progress.
+
+    Reservations are taken by the API when it accepts an operation which
+    adds clusters or nodes, and released by the conductor when the
+    operation ends.
+    """
+    __tablename__ = 'quota_reservations'
+    __table_args__ = (
+        schema.Index('ix_quota_reservations_resource_id', 'resource_id'),
+        schema.Index('ix_quota_reservations_expires_at', 'expires_at'),
+        table_args()
+    )
+    id = Column(Integer, primary_key=True)
+    project_id = Column(String(255))
+    resource_id = Column(String(36))
+    clusters = Column(Integer, nullable=False, default=0, server_default='0')
+    nodes = Column(Integer, nullable=False, default=0, server_default='0')
+    expires_at = Column(DateTime)
+
+
 class Federation(Base):
     """Represents a Federation."""
     __tablename__ = 'federation'
@@ -259,6 +316,8 @@ class NodeGroup(Base):
         schema.UniqueConstraint(
             'cluster_id', 'name',
             name='uniq_nodegroup0cluster_id0name'),
+        schema.Index('ix_nodegroup_cluster_id_role_is_default',
+                     'cluster_id', 'role', 'is_default'),
         table_args()
     )
     id = Column(Integer, primary_key=True)
@@ -284,3 +343,6 @@ class NodeGroup(Base):
     version = Column(String(20))
     node_labels = Column(JSONEncodedDict, nullable=True)
     node_taints = Column(JSONEncodedList, nullable=True)
+    generation = Column(Integer(), nullable=False, server_default='1')
+
+    __mapper_args__ = {'version_id_col': generation}
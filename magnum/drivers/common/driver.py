@@ -72,7 +72,7 @@ class Driver(object, metaclass=abc.ABCMeta):
         :return: dict
         """
 
-        if not cls.definitions:
+        if cls.definitions is None:
             cls.definitions = dict()
             for entry_point, def_class in cls.load_entry_points():
                 for cluster_type in def_class().provides:
@@ -200,6 +200,22 @@ class Driver(object, metaclass=abc.ABCMeta):
         """
         return
 
+    def update_clusters_status(self, context, clusters):
+        """Update the status of several clusters at once
+
+           This is an optional method. The periodic status sync passes every
+           in-progress cluster of this driver in a single call when it is
+           implemented, so that the driver can fetch the state of all of
+           them from the orchestration with as few requests as possible.
+           The status of each cluster must be updated the same way
+           update_cluster_status does it.
+
+           Drivers that do not implement it get one update_cluster_status
+           call per cluster instead.
+        """
+        for cluster in clusters:
+            self.update_cluster_status(context, cluster)
+
     @property
     @abc.abstractmethod
     def provides(self):
@@ -10,13 +10,21 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+import decimal
+
 from oslo_utils import strutils
 
 from magnum.common import utils
 from magnum.conductor import k8s_api as k8s
 from magnum.conductor import monitors
+import magnum.conf
+from magnum.drivers.common import k8s_node_watch
 from magnum.objects import fields as m_fields
 
+CONF = magnum.conf.CONF
+
+_TERMINATED_PHASES = ('Succeeded', 'Failed')
+
 
 class K8sMonitor(monitors.MonitorBase):
 
@@ -39,11 +47,24 @@ class K8sMonitor(monitors.MonitorBase):
             },
         }
 
+    @staticmethod
+    def _list_resource_version():
+        # resourceVersion 0 lets the API server answer from its watch cache,
+        # but in one unpaginated response
+        if CONF.kubernetes.api_list_from_watch_cache:
+            return '0'
+        return None
+
     def pull_data(self):
         k8s_api = k8s.KubernetesAPI(self.context, self.cluster)
-        nodes = k8s_api.list_node()
+        resource_version = self._list_resource_version()
+        nodes = k8s_api.iter_node(resource_version=resource_version)
         self.data['nodes'] = self._parse_node_info(nodes)
-        pods = k8s_api.list_namespaced_pod('default')
+        if CONF.kubernetes.monitor_all_namespaces:
+            pods = k8s_api.iter_pod(resource_version=resource_version)
+        else:
+            pods = k8s_api.iter_namespaced_pod(
+                'default', resource_version=resource_version)
         self.data['pods'] = self._parse_pod_info(pods)
 
     def poll_health_status(self):
@@ -96,97 +117,92 @@ class K8sMonitor(monitors.MonitorBase):
         return self._compute_res_util('Cpu')
 
     def _parse_pod_info(self, pods):
-        """Parse pods and retrieve memory and cpu details about each pod
+        """Sum up the memory and cpu of the pods scheduled on each node
 
-        :param pods: The output of k8s_api.list_namespaced_pod()
-        For example:
-        {
-            'items': [{
-                'status': {
-                    'container_statuses': None,
-                    'pod_ip': None,
-                    'phase': 'Pending',
-                    'message': None,
-                    'conditions': None,
-                },
-                'spec': {
-                    'containers': [{
-                        'image': 'nginx',
-                        'resources': {'requests': None,
-                              'limits': "{u'cpu': u'500m',
-                                          u'memory': u'1280e3'}"},
-                    }],
-                },
-                'api_version': None,
-            }],
-            'kind': 'PodList',
-        }
+        The pods are consumed in a single pass and only the running totals
+        of each node are kept, so this works on a stream of any length.
+        Pods that already terminated are not accounted for.
 
-        The above output is the dict form of:
-        k8sclient.client.models.v1_pod_list.
-        V1PodList object
+        :param pods: The pods yielded by k8s_api.iter_namespaced_pod()
+                     or k8s_api.iter_pod()
+        For example:
+        [{
+            'status': {
+                'phase': 'Running',
+            },
+            'spec': {
+                'nodeName': 'node-0',
+                'containers': [{
+                    'resources': {'requests': {'cpu': '250m'},
+                                  'limits': {'cpu': '500m',
+                                             'memory': '1280e3'}},
+                }],
+            },
+        }]
 
-        :return: Memory size of each pod. Example:
-            [{'Memory': 1280000.0, cpu: 0.5},
-             {'Memory': 1280000.0, cpu: 0.5}]
+        :return: Resource limits (Memory and Cpu) and requests
+            (MemoryRequests and CpuRequests) of the pods of each node.
+            Example:
+            [{'Node': 'node-0', 'Memory': 1280000.0, 'Cpu': 0.5,
+              'MemoryRequests': 0.0, 'CpuRequests': 0.25}]
         """
-        pods = pods['items']
-        parsed_containers = []
+        zero = decimal.Decimal(0)
+        totals = {}
         for pod in pods:
-            containers = pod['spec']['containers']
-            for container in containers:
-                memory = 0
-                cpu = 0
-                resources = container['resources']
-                limits = resources['limits']
-                if limits is not None:
-                    if limits.get('memory', ''):
-                        memory = utils.get_k8s_quantity(limits['memory'])
-                    if limits.get('cpu', ''):
-                        cpu = utils.get_k8s_quantity(limits['cpu'])
-                container_dict = {
-                    'Memory': memory,
-                    'Cpu': cpu,
-                }
-                parsed_containers.append(container_dict)
-        return parsed_containers
+            if pod.get('status', {}).get('phase') in _TERMINATED_PHASES:
+                continue
+            spec = pod['spec']
+            node = spec.get('nodeName')
+            node_totals = totals.get(node)
+            if node_totals is None:
+                node_totals = totals[node] = [zero, zero, zero, zero]
+            for container in spec['containers']:
+                resources = container.get('resources') or {}
+                limits = resources.get('limits') or {}
+                requests = resources.get('requests') or {}
+                if limits.get('memory'):
+                    node_totals[0] += utils.parse_k8s_quantity(
+                        limits['memory'])
+                if limits.get('cpu'):
+                    node_totals[1] += utils.parse_k8s_quantity(limits['cpu'])
+                if requests.get('memory'):
+                    node_totals[2] += utils.parse_k8s_quantity(
+                        requests['memory'])
+                if requests.get('cpu'):
+                    node_totals[3] += utils.parse_k8s_quantity(
+                        requests['cpu'])
+        return [{'Node': node,
+                 'Memory': float(memory), 'Cpu': float(cpu),
+                 'MemoryRequests': float(memory_requests),
+                 'CpuRequests': float(cpu_requests)}
+                for node, (memory, cpu, memory_requests, cpu_requests)
+                in totals.items()]
 
     def _parse_node_info(self, nodes):
         """Parse nodes to retrieve memory and cpu of each node
 
-        :param nodes: The output of k8s_api.list_namespaced_node()
+        :param nodes: The nodes yielded by k8s_api.iter_node()
         For example:
-        {
-            'items': [{
-                'status': {
-                    'phase': None,
-                    'capacity': "{u'cpu': u'1',
-                                  u'memory': u'2049852Ki'}",
-                },
-            }],
-            'api_version': None,
-            'kind': 'NodeList',
-            'api_version': 'v1',
-        }
-
-        The above output is the dict form of:
-        k8sclient.client.models.v1_node_list.
-        V1NodeList object
+        [{
+            'status': {
+                'capacity': "{u'cpu': u'1',
+                              u'memory': u'2049852Ki'}",
+            },
+        }]
 
         :return: CPU core number and Memory size of each node. Example:
             [{'cpu': 1, 'Memory': 1024.0},
              {'cpu': 1, 'Memory': 1024.0}]
 
         """
-        nodes = nodes['items']
         parsed_nodes = []
         for node in nodes:
             # Output of node.status.capacity is strong
             # for example:
             # capacity = "{'cpu': '1', 'memory': '1000Ki'}"
             capacity = node['status']['capacity']
-            memory = utils.get_k8s_quantity(capacity['memory'])
-            cpu = int(capacity['cpu'])
+            memory = float(utils.parse_k8s_quantity(capacity['memory']))
+            cpu = int(utils.parse_k8s_quantity(capacity['cpu']))
             parsed_nodes.append({'Memory': memory, 'Cpu': cpu})
 
         return parsed_nodes
@@ -206,8 +222,9 @@ class K8sMonitor(monitors.MonitorBase):
 
         3.  How to get the health_status and health_status_reason?
             3.1 Call /healthz to get the API health status
-            3.2 Call list_node (using API /api/v1/nodes) to get the nodes
-                health status
+            3.2 Call iter_node (using API /api/v1/nodes) to get the nodes
+                health status, or read it from the node watcher of the
+                cluster when [kubernetes]health_node_watch is enabled
 
         :param k8s_api: The api client to the cluster
         :return: Tumple including status and reason. Example:
@@ -230,15 +247,19 @@ class K8sMonitor(monitors.MonitorBase):
         try:
             api_status = k8s_api.get_healthz()
 
-            for node in k8s_api.list_node()['items']:
-                node_key = node['metadata']['name'] + ".Ready"
-                ready = False
-                for condition in node['status']['conditions']:
-                    if condition['type'] == 'Ready':
-                        ready = strutils.bool_from_string(condition['status'])
-                        break
-
-                health_status_reason[node_key] = ready
+            node_ready = None
+            if CONF.kubernetes.health_node_watch:
+                node_ready = k8s_node_watch.get_watcher(
+                    self.context, self.cluster).get_node_ready()
+            if node_ready is None:
+                node_ready = {
+                    node['metadata']['name']:
+                        k8s_node_watch.is_node_ready(node)
+                    for node in k8s_api.iter_node(
+                        resource_version=self._list_resource_version())}
+
+            for name, ready in node_ready.items():
+                health_status_reason[name + ".Ready"] = ready
 
             if (api_status == 'ok' and
                     all(n for n in health_status_reason.values())):
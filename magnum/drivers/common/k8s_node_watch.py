@@ -0,0 +1,188 @@
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""Track the readiness of Kubernetes nodes with a long-lived watch."""
+
+import threading
+
+from oslo_log import log as logging
+from oslo_utils import strutils
+from oslo_utils import timeutils
+
+from magnum.conductor import k8s_api as k8s
+import magnum.conf
+
+CONF = magnum.conf.CONF
+LOG = logging.getLogger(__name__)
+
+# How long the API server keeps a single watch request open.
+WATCH_TIMEOUT = 300
+# Longest pause between two attempts to restart a failed watch.
+MAX_RETRY_INTERVAL = 60
+
+_WATCHERS = {}
+_WATCHERS_LOCK = threading.Lock()
+
+
+def is_node_ready(node):
+    """Whether the Ready condition of a node object is true."""
+    for condition in node['status'].get('conditions') or []:
+        if condition['type'] == 'Ready':
+            return strutils.bool_from_string(condition['status'])
+    return False
+
+
+class NodeWatcher(object):
+    """Keep the Ready condition of the nodes of a cluster up to date.
+
+    The watcher lists the nodes once, then follows a watch from the
+    resource version of that list and applies the node events to an
+    in-memory map. The nodes are listed again every
+    [kubernetes]health_node_watch_relist_interval seconds, and whenever
+    the watch fails, to recover from missed events.
+    """
+
+    def __init__(self, context, cluster):
+        self.context = context
+        self.cluster = cluster
+        self._lock = threading.Lock()
+        self._ready = {}
+        self._resource_version = None
+        self._synced = False
+        self._stopped = threading.Event()
+        self._relist_watch = timeutils.StopWatch(
+            duration=CONF.kubernetes.health_node_watch_relist_interval)
+        # a watcher nobody reads from anymore, e.g. because the cluster
+        # moved to another conductor, ends on its own
+        self._idle_watch = timeutils.StopWatch(
+            duration=3 * max(CONF.kubernetes.health_polling_interval,
+                             CONF.kubernetes.health_polling_max_interval,
+                             WATCH_TIMEOUT))
+        self._idle_watch.start()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='node-watch-%s' % self.cluster.uuid,
+            daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def get_node_ready(self):
+        """Return a copy of the node name to Ready map.
+
+        :return: The map, or None while the watcher is not in sync with
+                 the cluster.
+        """
+        with self._lock:
+            self._idle_watch.restart()
+            if not self._synced:
+                return None
+            return dict(self._ready)
+
+    def relist(self, k8s_api):
+        metadata = {}
+        ready = {node['metadata']['name']: is_node_ready(node)
+                 for node in k8s_api.iter_node(metadata=metadata)}
+        with self._lock:
+            self._ready = ready
+            self._resource_version = metadata['resourceVersion']
+            self._synced = True
+        self._relist_watch.restart()
+
+    def handle_event(self, event):
+        event_type = event.get('type')
+        node = event.get('object') or {}
+        if event_type == 'ERROR':
+            # most likely 410 Gone: our resource version is too old
+            raise RuntimeError(node.get('message', 'watch error'))
+        metadata = node.get('metadata', {})
+        with self._lock:
+            if event_type in ('ADDED', 'MODIFIED'):
+                self._ready[metadata['name']] = is_node_ready(node)
+            elif event_type == 'DELETED':
+                self._ready.pop(metadata['name'], None)
+            if metadata.get('resourceVersion'):
+                self._resource_version = metadata['resourceVersion']
+
+    def watch_once(self, k8s_api):
+        """List the nodes if needed, then follow a single watch request."""
+        if not self._synced or self._relist_watch.expired():
+            self.relist(k8s_api)
+        for event in k8s_api.watch_node(self._resource_version,
+                                        WATCH_TIMEOUT):
+            self.handle_event(event)
+            if self.stopped or self._relist_watch.expired():
+                break
+
+    def _reload_cluster(self):
+        # the CA of the cluster may have been rotated, possibly by another
+        # conductor, reconnect with its current certificates
+        try:
+            self.cluster.refresh()
+        except Exception as e:
+            LOG.debug("Failed to reload cluster %(cluster)s: %(e)s",
+                      {'cluster': self.cluster.uuid, 'e': e})
+
+    def _run(self):
+        retry_interval = 1
+        while not self.stopped and not self._idle_watch.expired():
+            try:
+                self.watch_once(k8s.KubernetesAPI(self.context, self.cluster))
+                retry_interval = 1
+            except Exception as e:
+                with self._lock:
+                    self._synced = False
+                LOG.debug("Node watch of cluster %(cluster)s failed, "
+                          "retrying in %(retry)ds: %(e)s",
+                          {'cluster': self.cluster.uuid,
+                           'retry': retry_interval, 'e': e})
+                self._stopped.wait(retry_interval)
+                retry_interval = min(retry_interval * 2, MAX_RETRY_INTERVAL)
+                self._reload_cluster()
+        self.stop()
+        with _WATCHERS_LOCK:
+            if _WATCHERS.get(self.cluster.uuid) is self:
+                del _WATCHERS[self.cluster.uuid]
+        LOG.debug("Node watch of cluster %s ended", self.cluster.uuid)
+
+
+def get_watcher(context, cluster):
+    """Return the running node watcher of a cluster, starting it if needed."""
+    with _WATCHERS_LOCK:
+        watcher = _WATCHERS.get(cluster.uuid)
+        if watcher is None or watcher.stopped:
+            watcher = NodeWatcher(context, cluster)
+            _WATCHERS[cluster.uuid] = watcher
+            watcher.start()
+    return watcher
+
+
+def stop_watcher(cluster_uuid):
+    with _WATCHERS_LOCK:
+        watcher = _WATCHERS.pop(cluster_uuid, None)
+    if watcher is not None:
+        watcher.stop()
+
+
+def stop_all_watchers():
+    with _WATCHERS_LOCK:
+        watchers = list(_WATCHERS.values())
+        _WATCHERS.clear()
+    for watcher in watchers:
+        watcher.stop()
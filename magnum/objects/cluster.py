@@ -59,8 +59,12 @@ class Cluster(base.MagnumPersistentObject, base.MagnumObject,
     # Version 1.23  Added etcd_ca_cert_ref and front_proxy_ca_cert_ref
     # Version 1.24  Removed trust_id, trustee_username, trustee_password,
     #               trustee_user_id
+    # Version 1.25  Added update_health_status method
+    # Version 1.26  Added use_replica to list
+    # Version 1.27  Added destroy_clusters method
+    # Version 1.28  Added generation field
 
-    VERSION = '1.24'
+    VERSION = '1.28'
 
     dbapi = dbapi.get_instance()
 
@@ -95,6 +99,7 @@ class Cluster(base.MagnumPersistentObject, base.MagnumObject,
         'fixed_subnet': fields.StringField(nullable=True),
         'floating_ip_enabled': fields.BooleanField(default=True),
         'master_lb_enabled': fields.BooleanField(default=False),
+        'generation': fields.IntegerField(nullable=True),
     }
 
     @staticmethod
@@ -115,6 +120,9 @@ class Cluster(base.MagnumPersistentObject, base.MagnumObject,
     # goes directly to the DB, so nodegroup mutations (create/delete) in
     # conductor code and tests are always visible.
     _nodegroups_cache = None
+    # Nodegroups loaded by prefetch_nodegroups(), used by the next as_dict()
+    # call instead of querying them again.
+    _prefetched_nodegroups = None
 
     def _get_nodegroups(self):
         """Fetch nodegroups, using a call-scoped cache when active.
@@ -139,6 +147,29 @@ class Cluster(base.MagnumPersistentObject, base.MagnumObject,
         """Clear the call-scoped nodegroups cache."""
         self._nodegroups_cache = None
 
+    @classmethod
+    def prefetch_nodegroups(cls, context, clusters, use_replica=False):
+        """Load the nodegroups of several clusters with a single query.
+
+        The nodegroups are only used by the next as_dict() call of each
+        cluster, which would otherwise list them once per cluster. The
+        clusters whose nodegroups are already prefetched are not queried
+        again.
+
+        :returns: a dict of the nodegroups of each cluster, by cluster uuid.
+        """
+        nodegroups = {cluster.uuid: cluster._prefetched_nodegroups
+                      for cluster in clusters}
+        missing = [uuid for uuid, ngs in nodegroups.items() if ngs is None]
+        if missing:
+            nodegroups.update((uuid, []) for uuid in missing)
+            for ng in NodeGroup.list_for_clusters(context, missing,
+                                                  use_replica=use_replica):
+                nodegroups[ng.cluster_id].append(ng)
+        for cluster in clusters:
+            cluster._prefetched_nodegroups = nodegroups[cluster.uuid]
+        return nodegroups
+
     @property
     def nodegroups(self):
         # Returns all nodegroups that belong to the cluster.
@@ -242,7 +273,8 @@ class Cluster(base.MagnumPersistentObject, base.MagnumObject,
         :param filters: filter dict, can includes 'cluster_template_id',
                         'name', 'node_count', 'stack_id', 'api_address',
                         'node_addresses', 'project_id', 'user_id',
-                        'status'(should be a status list), 'master_count'.
+                        'status'(should be a status list), 'master_count',
+                        'labels'(a dict of the labels to match).
         :returns: Count of matching clusters.
         """
         return cls.dbapi.get_cluster_count_all(context, filters=filters)
@@ -263,7 +295,7 @@ class Cluster(base.MagnumPersistentObject, base.MagnumObject,
     @classmethod
     @base.remotable
     def list(cls, context, limit=None, marker=None,
-             sort_key=None, sort_dir=None, filters=None):
+             sort_key=None, sort_dir=None, filters=None, use_replica=False):
         """Return a list of Cluster objects.
 
         :param context: Security context.
@@ -275,6 +307,8 @@ class Cluster(base.MagnumPersistentObject, base.MagnumObject,
                         'name', 'node_count', 'stack_id', 'api_address',
                         'node_addresses', 'project_id', 'user_id',
                         'status'(should be a status list), 'master_count'.
+        :param use_replica: whether the query may be served by the database
+                            replica.
         :returns: a list of :class:`Cluster` object.
 
         """
@@ -282,7 +316,8 @@ class Cluster(base.MagnumPersistentObject, base.MagnumObject,
                                                  marker=marker,
                                                  sort_key=sort_key,
                                                  sort_dir=sort_dir,
-                                                 filters=filters)
+                                                 filters=filters,
+                                                 use_replica=use_replica)
         return Cluster._from_db_object_list(db_clusters, cls, context)
 
     @classmethod
@@ -295,6 +330,18 @@ class Cluster(base.MagnumPersistentObject, base.MagnumObject,
         """
         return cls.dbapi.get_cluster_stats(project_id)
 
+    @classmethod
+    @base.remotable
+    def update_health_status(cls, context, updates):
+        """Update the health status of several clusters in one go.
+
+        :param context: Security context.
+        :param updates: dict mapping the uuid of each cluster to a
+                        (health_status, health_status_reason) tuple.
+        :returns: the number of clusters updated.
+        """
+        return cls.dbapi.update_clusters_health_status(updates)
+
     @base.remotable
     def create(self, context=None):
         """Create a Cluster record in the DB.
@@ -325,6 +372,19 @@ class Cluster(base.MagnumPersistentObject, base.MagnumObject,
         self.dbapi.destroy_cluster(self.uuid)
         self.obj_reset_changes()
 
+    @classmethod
+    @base.remotable
+    def destroy_clusters(cls, context, cluster_ids, cert_refs=None):
+        """Delete several clusters and their nodegroups from the DB.
+
+        :param context: The security context
+        :param cluster_ids: The uuids of the clusters.
+        :param cert_refs: The uuids of x509keypairs to delete along with
+                          the clusters.
+        :returns: the number of clusters deleted.
+        """
+        return cls.dbapi.destroy_clusters(cluster_ids, cert_refs=cert_refs)
+
     @base.remotable
     def save(self, context=None):
         """Save updates to this Cluster.
@@ -338,9 +398,17 @@ class Cluster(base.MagnumPersistentObject, base.MagnumObject,
                         argument, even though we don't use it.
                         A context should be set when instantiating the
                         object, e.g.: Cluster(context)
+        :raises: ConcurrentUpdate if the cluster was modified since it
+                 was loaded, refresh() it and apply the changes again.
         """
         updates = self.obj_get_changes()
-        self.dbapi.update_cluster(self.uuid, updates)
+        updates.pop('generation', None)
+        generation = None
+        if updates and self.obj_attr_is_set('generation'):
+            generation = self.generation
+        db_cluster = self.dbapi.update_cluster(self.uuid, updates,
+                                               generation=generation)
+        self.generation = db_cluster['generation']
 
         self.obj_reset_changes()
 
@@ -383,7 +451,11 @@ class Cluster(base.MagnumPersistentObject, base.MagnumObject,
         # of each issuing their own RPC call.  The cache is cleared on exit
         # so that any subsequent access (e.g. from conductor code that has
         # mutated nodegroups) sees a fresh DB result.
-        self._nodegroups_cache = NodeGroup.list(self._context, self.uuid)
+        nodegroups = self._prefetched_nodegroups
+        self._prefetched_nodegroups = None
+        if nodegroups is None:
+            nodegroups = NodeGroup.list(self._context, self.uuid)
+        self._nodegroups_cache = nodegroups
         try:
             dict_.update({
                 'node_count': self.node_count,
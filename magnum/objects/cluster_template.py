@@ -10,14 +10,126 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import threading
+
+from oslo_cache import core as cache
 from oslo_utils import strutils
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
 from oslo_versionedobjects import fields
 
+import magnum.conf
 from magnum.db import api as dbapi
 from magnum.objects import base
 from magnum.objects import fields as m_fields
 
+CONF = magnum.conf.CONF
+
+# ClusterTemplates looked up by admin contexts of all tenants, which see
+# every template, keyed by uuid. Values are (expiry, template).
+_CACHE = collections.OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def _request_cache(context):
+    """Return the ClusterTemplates already looked up in this request."""
+    cache = getattr(context, '_cluster_template_cache', None)
+    if not isinstance(cache, dict):
+        cache = {}
+        context._cluster_template_cache = cache
+    return cache
+
+
+def _use_process_cache(context):
+    return (CONF.cluster_template.cache_ttl > 0 and
+            context.is_admin and context.all_tenants)
+
+
+def _get_cached(context, uuid):
+    cluster_template = _request_cache(context).get(uuid)
+    if cluster_template is None and _use_process_cache(context):
+        with _CACHE_LOCK:
+            entry = _CACHE.get(uuid)
+            if entry is not None:
+                if entry[0] > timeutils.utcnow_ts(microsecond=True):
+                    _CACHE.move_to_end(uuid)
+                    cluster_template = entry[1]
+                else:
+                    del _CACHE[uuid]
+    if cluster_template is None:
+        return None
+    # callers may modify the template they get
+    cluster_template = cluster_template.obj_clone()
+    cluster_template._context = context
+    return cluster_template
+
+
+def _set_cached(context, cluster_template):
+    cached = cluster_template.obj_clone()
+    _request_cache(context)[cluster_template.uuid] = cached
+    if _use_process_cache(context):
+        expiry = (timeutils.utcnow_ts(microsecond=True) +
+                  CONF.cluster_template.cache_ttl)
+        with _CACHE_LOCK:
+            _CACHE[cluster_template.uuid] = (expiry, cached)
+            _CACHE.move_to_end(cluster_template.uuid)
+            while len(_CACHE) > CONF.cluster_template.cache_size:
+                _CACHE.popitem(last=False)
+
+
+def evict_cache(context, uuid):
+    """Forget the cached copies of a ClusterTemplate.
+
+    Must be called when a ClusterTemplate is updated or deleted.
+    """
+    _request_cache(context).pop(uuid, None)
+    with _CACHE_LOCK:
+        _CACHE.pop(uuid, None)
+
+
+def clear_cache():
+    with _CACHE_LOCK:
+        _CACHE.clear()
+    if _PUBLIC_REGION.is_configured:
+        _PUBLIC_REGION.delete(_PUBLIC_KEY)
+
+
+# The public ClusterTemplates which are not hidden, which every tenant sees,
+# as the list of their as_dict(). Kept in the process, or in the backend of
+# the [cache] section when it is enabled.
+_PUBLIC_REGION = cache.create_region()
+_PUBLIC_REGION_LOCK = threading.Lock()
+_PUBLIC_KEY = 'magnum-public-cluster-templates'
+# bumped by the evictions, so that a list read from the database before
+# one is not cached after it
+_public_generation = 0
+
+# the sort keys for which python and the databases agree on the order
+_CACHED_LIST_SORT_KEYS = ('id', 'uuid')
+
+
+def _public_region():
+    if not _PUBLIC_REGION.is_configured:
+        with _PUBLIC_REGION_LOCK:
+            if not _PUBLIC_REGION.is_configured:
+                if CONF.cache.enabled:
+                    cache.configure_cache_region(CONF, _PUBLIC_REGION)
+                else:
+                    _PUBLIC_REGION.configure('dogpile.cache.memory')
+    return _PUBLIC_REGION
+
+
+def evict_public_cache():
+    """Forget the cached public ClusterTemplates.
+
+    Must be called when a ClusterTemplate is created, updated or deleted.
+    """
+    global _public_generation
+    _public_generation += 1
+    if CONF.cluster_template.public_list_cache_ttl:
+        _public_region().delete(_PUBLIC_KEY)
+
 
 @base.MagnumObjectRegistry.register
 class ClusterTemplate(base.MagnumPersistentObject, base.MagnumObject,
@@ -44,7 +156,8 @@ class ClusterTemplate(base.MagnumPersistentObject, base.MagnumObject,
     # Version 1.19: Added 'hidden' field
     # Version 1.20: Added 'tags' field
     # Version 1.21: Added 'driver' field
-    VERSION = '1.21'
+    # Version 1.22: Added use_replica to list
+    VERSION = '1.22'
 
     dbapi = dbapi.get_instance()
 
@@ -136,14 +249,22 @@ class ClusterTemplate(base.MagnumPersistentObject, base.MagnumObject,
     def get_by_uuid(cls, context, uuid):
         """Find and return ClusterTemplate object based on uuid.
 
+        The result is cached for the rest of the request, and for admin
+        contexts of all tenants in the process for
+        ``[cluster_template]cache_ttl`` seconds.
+
         :param uuid: the uuid of a ClusterTemplate.
         :param context: Security context
         :returns: a :class:`ClusterTemplate` object.
         """
+        cluster_template = _get_cached(context, uuid)
+        if cluster_template is not None:
+            return cluster_template
         db_cluster_template = cls.dbapi.get_cluster_template_by_uuid(
             context, uuid)
         cluster_template = ClusterTemplate._from_db_object(cls(context),
                                                            db_cluster_template)
+        _set_cached(context, cluster_template)
         return cluster_template
 
     @classmethod
@@ -164,7 +285,7 @@ class ClusterTemplate(base.MagnumPersistentObject, base.MagnumObject,
     @classmethod
     @base.remotable
     def list(cls, context, limit=None, marker=None,
-             sort_key=None, sort_dir=None):
+             sort_key=None, sort_dir=None, use_replica=False):
         """Return a list of ClusterTemplate objects.
 
         :param context: Security context.
@@ -172,15 +293,89 @@ class ClusterTemplate(base.MagnumPersistentObject, base.MagnumObject,
         :param marker: pagination marker for large data sets.
         :param sort_key: column to sort results by.
         :param sort_dir: direction to sort. "asc" or "desc".
+        :param use_replica: whether the query may be served by the database
+                            replica.
         :returns: a list of :class:`ClusterTemplate` object.
 
         """
         db_cluster_templates = cls.dbapi.get_cluster_template_list(
             context, limit=limit, marker=marker, sort_key=sort_key,
-            sort_dir=sort_dir)
+            sort_dir=sort_dir, use_replica=use_replica)
         return ClusterTemplate._from_db_object_list(db_cluster_templates,
                                                     cls, context)
 
+    @classmethod
+    def list_as_dicts(cls, context, limit=None, marker=None,
+                      sort_key=None, sort_dir=None, use_replica=False):
+        """Return the as_dict() of the ClusterTemplates listed by a context.
+
+        Like :meth:`list`, except that for the contexts of a tenant the
+        public ClusterTemplates which are not hidden, the same for every
+        tenant, are cached for ``[cluster_template]public_list_cache_ttl``
+        seconds, and only the ones of the tenant are read from the
+        database. The dicts returned must not be modified.
+
+        :param context: Security context.
+        :param limit: maximum number of resources to return in a single result.
+        :param marker: pagination marker for large data sets.
+        :param sort_key: column to sort results by.
+        :param sort_dir: direction to sort. "asc" or "desc".
+        :param use_replica: whether the query may be served by the database
+                            replica.
+        :returns: a list of dicts.
+        """
+        sort_key = sort_key or 'id'
+        if (context.is_admin or sort_key not in _CACHED_LIST_SORT_KEYS or
+                not CONF.cluster_template.public_list_cache_ttl):
+            return [cluster_template.as_dict() for cluster_template in
+                    cls.list(context, limit, marker, sort_key=sort_key,
+                             sort_dir=sort_dir, use_replica=use_replica)]
+
+        # the tenant's own copy of a public ClusterTemplate is the freshest
+        cluster_templates = {cluster_template['uuid']: cluster_template
+                             for cluster_template in cls._list_public(context)}
+        for db_cluster_template in cls.dbapi.get_project_cluster_template_list(
+                context, use_replica=use_replica):
+            cluster_template = cls._from_db_object(cls(context),
+                                                   db_cluster_template)
+            cluster_templates[cluster_template.uuid] = (
+                cluster_template.as_dict())
+
+        def position(cluster_template):
+            return cluster_template[sort_key], cluster_template['id']
+
+        descending = sort_dir == 'desc'
+        cluster_templates = sorted(cluster_templates.values(), key=position,
+                                   reverse=descending)
+        if marker is not None:
+            after = position(marker)
+            cluster_templates = [
+                cluster_template for cluster_template in cluster_templates
+                if (position(cluster_template) < after if descending
+                    else position(cluster_template) > after)]
+        return cluster_templates[:limit] if limit else cluster_templates
+
+    @classmethod
+    def _list_public(cls, context):
+        """Return the as_dict() of the public, not hidden ClusterTemplates."""
+        region = _public_region()
+        cluster_templates = region.get(
+            _PUBLIC_KEY,
+            expiration_time=CONF.cluster_template.public_list_cache_ttl)
+        if cluster_templates is not cache.NO_VALUE:
+            return cluster_templates
+
+        # read from the primary, the cached list outlives the lag of a
+        # replica
+        generation = _public_generation
+        cluster_templates = [
+            cls._from_db_object(cls(context), db_cluster_template).as_dict()
+            for db_cluster_template in
+            cls.dbapi.get_public_cluster_template_list()]
+        if generation == _public_generation:
+            region.set(_PUBLIC_KEY, cluster_templates)
+        return cluster_templates
+
     @base.remotable
     def create(self, context=None):
         """Create a ClusterTemplate record in the DB.
@@ -196,6 +391,8 @@ class ClusterTemplate(base.MagnumPersistentObject, base.MagnumObject,
         values = self.obj_get_changes()
         db_cluster_template = self.dbapi.create_cluster_template(values)
         self._from_db_object(self, db_cluster_template)
+        if self.public and not self.hidden:
+            evict_public_cache()
 
     @base.remotable
     def destroy(self, context=None):
@@ -209,6 +406,8 @@ class ClusterTemplate(base.MagnumPersistentObject, base.MagnumObject,
                         object, e.g.: ClusterTemplate(context)
         """
         self.dbapi.destroy_cluster_template(self.uuid)
+        evict_cache(self._context, self.uuid)
+        evict_public_cache()
         self.obj_reset_changes()
 
     @base.remotable
@@ -227,6 +426,8 @@ class ClusterTemplate(base.MagnumPersistentObject, base.MagnumObject,
         """
         updates = self.obj_get_changes()
         self.dbapi.update_cluster_template(self.uuid, updates)
+        evict_cache(self._context, self.uuid)
+        evict_public_cache()
 
         self.obj_reset_changes()
 
@@ -245,6 +446,7 @@ class ClusterTemplate(base.MagnumPersistentObject, base.MagnumObject,
                         A context should be set when instantiating the
                         object, e.g.: ClusterTemplate(context)
         """
+        evict_cache(self._context, self.uuid)
         current = self.__class__.get_by_uuid(self._context, uuid=self.uuid)
         for field in self.fields:
             if self.obj_attr_is_set(field) and self[field] != current[field]:
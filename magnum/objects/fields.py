@@ -110,9 +110,9 @@ class ClusterType(fields.Enum):
 
 class QuotaResourceName(fields.Enum):
     ALL = (
-        CLUSTER,
+        CLUSTER, NODE,
     ) = (
-        'Cluster',
+        'Cluster', 'Node',
     )
 
     def __init__(self):
@@ -19,7 +19,8 @@ from magnum.objects import base
 @base.MagnumObjectRegistry.register
 class MagnumService(base.MagnumPersistentObject, base.MagnumObject):
     # Version 1.0: Initial version
-    VERSION = '1.0'
+    # Version 1.1: Added use_replica to list
+    VERSION = '1.1'
 
     dbapi = dbapi.get_instance()
 
@@ -70,7 +71,7 @@ class MagnumService(base.MagnumPersistentObject, base.MagnumObject):
     @classmethod
     @base.remotable
     def list(cls, context, limit=None, marker=None,
-             sort_key=None, sort_dir=None):
+             sort_key=None, sort_dir=None, use_replica=False):
         """Return a list of MagnumService objects.
 
         :param context: Security context.
@@ -78,12 +79,14 @@ class MagnumService(base.MagnumPersistentObject, base.MagnumObject):
         :param marker: pagination marker for large data sets.
         :param sort_key: column to sort results by.
         :param sort_dir: direction to sort. "asc" or "desc".
+        :param use_replica: whether the query may be served by the database
+                            replica.
         :returns: a list of :class:`MagnumService` object.
 
         """
         db_magnum_services = cls.dbapi.get_magnum_service_list(
             limit=limit, marker=marker, sort_key=sort_key,
-            sort_dir=sort_dir)
+            sort_dir=sort_dir, use_replica=use_replica)
         return MagnumService._from_db_object_list(db_magnum_services, cls,
                                                   context)
 
@@ -28,8 +28,11 @@ class NodeGroup(base.MagnumPersistentObject, base.MagnumObject,
     # Version 1.0: Initial version
     # Version 1.1: min_node_count defaults to 0
     # Version 1.2: Added node_labels and node_taints
+    # Version 1.3: Added list_for_clusters method
+    # Version 1.4: Added use_replica to list and list_for_clusters
+    # Version 1.5: Added generation field
 
-    VERSION = '1.2'
+    VERSION = '1.5'
 
     dbapi = dbapi.get_instance()
 
@@ -55,6 +58,7 @@ class NodeGroup(base.MagnumPersistentObject, base.MagnumObject,
         'version': fields.StringField(nullable=True),
         'node_labels': fields.DictOfStringsField(nullable=True),
         'node_taints': m_fields.ListOfDictsField(nullable=True),
+        'generation': fields.IntegerField(nullable=True),
     }
 
     @staticmethod
@@ -145,7 +149,7 @@ class NodeGroup(base.MagnumPersistentObject, base.MagnumObject,
     @classmethod
     @base.remotable
     def list(cls, context, cluster_id, limit=None, marker=None,
-             sort_key=None, sort_dir=None, filters=None):
+             sort_key=None, sort_dir=None, filters=None, use_replica=False):
         """Return a list of NodeGroup objects.
 
         :param context: Security context.
@@ -157,12 +161,29 @@ class NodeGroup(base.MagnumPersistentObject, base.MagnumObject,
         :param filters: filter dict, can includes 'name', 'node_count',
                         'stack_id', 'node_addresses',
                         'status'(should be a status list).
+        :param use_replica: whether the query may be served by the database
+                            replica.
         :returns: a list of :class:`NodeGroup` objects.
 
         """
         db_nodegroups = cls.dbapi.list_cluster_nodegroups(
             context, cluster_id, limit=limit, marker=marker, sort_key=sort_key,
-            sort_dir=sort_dir, filters=filters)
+            sort_dir=sort_dir, filters=filters, use_replica=use_replica)
+        return NodeGroup._from_db_object_list(db_nodegroups, cls, context)
+
+    @classmethod
+    @base.remotable
+    def list_for_clusters(cls, context, cluster_ids, use_replica=False):
+        """Return the NodeGroup objects of several clusters.
+
+        :param context: Security context.
+        :param cluster_ids: The uuids of the clusters.
+        :param use_replica: whether the query may be served by the database
+                            replica.
+        :returns: a list of :class:`NodeGroup` objects.
+        """
+        db_nodegroups = cls.dbapi.list_nodegroups_for_clusters(
+            context, cluster_ids, use_replica=use_replica)
         return NodeGroup._from_db_object_list(db_nodegroups, cls, context)
 
     @base.remotable
@@ -192,9 +213,17 @@ class NodeGroup(base.MagnumPersistentObject, base.MagnumObject,
         of self.what_changed().
 
         :param context: Security context.
+        :raises: ConcurrentUpdate if the nodegroup was modified since it
+                 was loaded, refresh() it and apply the changes again.
         """
         updates = self.obj_get_changes()
-        self.dbapi.update_nodegroup(self.cluster_id, self.uuid, updates)
+        updates.pop('generation', None)
+        generation = None
+        if updates and self.obj_attr_is_set('generation'):
+            generation = self.generation
+        db_nodegroup = self.dbapi.update_nodegroup(
+            self.cluster_id, self.uuid, updates, generation=generation)
+        self.generation = db_nodegroup['generation']
 
         self.obj_reset_changes()
 
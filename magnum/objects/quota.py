@@ -10,17 +10,28 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+
+from oslo_utils import timeutils
 from oslo_versionedobjects import fields
 
+from magnum.common import exception
+import magnum.conf
 from magnum.db import api as dbapi
 from magnum.objects import base
+from magnum.objects import fields as m_fields
+
+CONF = magnum.conf.CONF
 
 
 @base.MagnumObjectRegistry.register
 class Quota(base.MagnumPersistentObject, base.MagnumObject,
             base.MagnumObjectDictCompat):
     # Version 1.0: Initial version
-    VERSION = '1.0'
+    # Version 1.1: Added reserve and release_reservation methods
+    # Version 1.2: reserve returns the id of the reservation, which is
+    #              what release_reservation takes
+    VERSION = '1.2'
 
     dbapi = dbapi.get_instance()
 
@@ -145,3 +156,60 @@ class Quota(base.MagnumPersistentObject, base.MagnumObject,
         """
         db_quota = cls.dbapi.update_quota(project_id, quota)
         return Quota._from_db_object(cls(context), db_quota)
+
+    @classmethod
+    def _get_limit(cls, project_id, resource, default):
+        try:
+            limit = cls.dbapi.get_quota_by_project_id_resource(
+                project_id, resource).hard_limit
+        except exception.QuotaNotFound:
+            limit = default
+        return None if limit < 0 else limit
+
+    @classmethod
+    @base.remotable
+    def reserve(cls, context, project_id, resource_id, clusters=0, nodes=0):
+        """Reserve quota for clusters and nodes about to be created.
+
+        The reservation is checked against the quotas of the project, or
+        the configured defaults, and counted in its usage until it is
+        released with release_reservation or expires.
+
+        :param context: Security context.
+        :param project_id: the project the quota is reserved for.
+        :param resource_id: the uuid of the cluster the operation is for.
+        :param clusters: the number of clusters to reserve.
+        :param nodes: the number of nodes to reserve.
+        :returns: the id of the reservation.
+        :raises: QuotaExceeded
+        """
+        cluster_limit = node_limit = None
+        if clusters > 0:
+            cluster_limit = cls._get_limit(
+                project_id, m_fields.QuotaResourceName.CLUSTER,
+                CONF.quotas.max_clusters_per_project)
+        if nodes > 0:
+            node_limit = cls._get_limit(
+                project_id, m_fields.QuotaResourceName.NODE,
+                CONF.quotas.max_nodes_per_project)
+        expires_at = timeutils.utcnow() + datetime.timedelta(
+            seconds=CONF.quotas.reservation_expire)
+        reservation = cls.dbapi.reserve_quota(
+            project_id, str(resource_id), expires_at, clusters=clusters,
+            nodes=nodes, cluster_limit=cluster_limit, node_limit=node_limit)
+        return reservation.id
+
+    @classmethod
+    @base.remotable
+    def release_reservation(cls, context, reservation_id):
+        """Release the quota reserved for an operation on a cluster.
+
+        Once the operation has created its clusters and nodes, or has
+        failed, they are counted in the usage of the project, so the
+        reservation is released either way.
+
+        :param context: Security context.
+        :param reservation_id: the id returned by reserve.
+        :returns: whether a reservation was released.
+        """
+        return cls.dbapi.release_quota_reservation(reservation_id)
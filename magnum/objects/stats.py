@@ -23,8 +23,10 @@ from magnum.objects import base
 @base.MagnumObjectRegistry.register
 class Stats(base.MagnumObject, base.MagnumObjectDictCompat):
     # Version 1.0: Initial version
+    # Version 1.1: Added use_replica to get_cluster_stats
+    # Version 1.2: Added reconcile method
 
-    VERSION = '1.0'
+    VERSION = '1.2'
 
     dbapi = dbapi.get_instance()
 
@@ -35,11 +37,24 @@ class Stats(base.MagnumObject, base.MagnumObjectDictCompat):
 
     @classmethod
     @base.remotable
-    def get_cluster_stats(cls, context, project_id=None):
+    def get_cluster_stats(cls, context, project_id=None, use_replica=False):
         """Return cluster stats for the given project.
 
         :param context: The security context
         :param project_id: project id
+        :param use_replica: whether the query may be served by the database
+                            replica.
         """
-        clusters, nodes = cls.dbapi.get_cluster_stats(context, project_id)
+        clusters, nodes = cls.dbapi.get_cluster_stats(
+            context, project_id, use_replica=use_replica)
         return cls(clusters=clusters, nodes=nodes)
+
+    @classmethod
+    @base.remotable
+    def reconcile(cls, context):
+        """Recount the clusters and nodes of every project.
+
+        :param context: The security context
+        :returns: the number of projects whose counts were corrected.
+        """
+        return cls.dbapi.reconcile_project_stats()
@@ -13,28 +13,57 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import functools
+import random
+import threading
+import time
 
+import futurist
 from oslo_log import log
 from oslo_service import loopingcall
 from oslo_service import periodic_task
+from oslo_utils import timeutils
 
 from pycadf import cadftaxonomy as taxonomy
 
 from magnum.common import context
+from magnum.common import exception
+from magnum.common import hash_ring
 from magnum.common import profiler
 from magnum.common import rpc
 from magnum.conductor.handlers.common import cert_manager
+from magnum.conductor import k8s_api
 from magnum.conductor import monitors
 from magnum.conductor import utils as conductor_utils
 import magnum.conf
 from magnum.drivers.common import driver
+from magnum.drivers.common import k8s_node_watch
 from magnum import objects
 
 
 CONF = magnum.conf.CONF
 LOG = log.getLogger(__name__)
 
+# How often, in seconds, the health sync task looks for clusters that are
+# due for a poll. Each cluster is then polled on its own schedule.
+HEALTH_POLLING_TICK = 10
+
+# CADF action of the notifications sent when the health of a cluster changes
+HEALTH_UPDATE_ACTION = taxonomy.ACTION_UPDATE + '.health'
+
+
+def _health_polling_tick():
+    interval = CONF.kubernetes.health_polling_interval
+    if interval < 0:
+        return interval
+    return min(interval, HEALTH_POLLING_TICK)
+
+
+def _driver_name(cdriver):
+    cls = type(cdriver)
+    return '%s.%s' % (cls.__module__, cls.__qualname__)
+
 
 def set_context(func):
     @functools.wraps(func)
@@ -46,6 +75,212 @@ def set_context(func):
     return handler
 
 
+class ClusterJobExecutor(object):
+    """Run per-cluster periodic jobs on a bounded pool of workers.
+
+    At most one job per cluster is in flight at any time: a cluster whose
+    previous job has not finished yet is skipped instead of queueing
+    another job behind it.
+    """
+
+    def __init__(self, name, max_workers):
+        self.name = name
+        self._executor = futurist.ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._queued = 0
+        self._skipped = 0
+        self._last_latency = 0.0
+
+    def submit(self, key, func):
+        """Schedule func for the cluster identified by key.
+
+        :returns: True if the job was scheduled, False if a job for the
+                  same cluster is still in flight.
+        """
+        with self._lock:
+            if key in self._in_flight:
+                self._skipped += 1
+                return False
+            self._in_flight.add(key)
+            self._queued += 1
+        try:
+            self._executor.submit(self._run, key, func)
+        except Exception:
+            self._done(key, queued=True)
+            raise
+        return True
+
+    def _run(self, key, func):
+        with self._lock:
+            self._queued -= 1
+        watch = timeutils.StopWatch()
+        watch.start()
+        try:
+            func()
+        except loopingcall.LoopingCallDone:
+            pass
+        except Exception as e:
+            LOG.warning("%(name)s job for cluster %(cluster)s failed: %(e)s",
+                        {'name': self.name, 'cluster': key, 'e': e},
+                        exc_info=True)
+        finally:
+            self._last_latency = watch.elapsed()
+            LOG.debug("%(name)s job for cluster %(cluster)s took %(t).3fs",
+                      {'name': self.name, 'cluster': key,
+                       't': self._last_latency})
+            self._done(key)
+
+    def _done(self, key, queued=False):
+        with self._lock:
+            self._in_flight.discard(key)
+            if queued:
+                self._queued -= 1
+
+    def is_in_flight(self, key):
+        with self._lock:
+            return key in self._in_flight
+
+    @property
+    def queue_depth(self):
+        """Number of jobs waiting for a free worker."""
+        with self._lock:
+            return self._queued
+
+    def statistics(self):
+        stats = self._executor.statistics
+        with self._lock:
+            return {
+                'in_flight': len(self._in_flight),
+                'queue_depth': self._queued,
+                'skipped': self._skipped,
+                'executed': stats.executed,
+                'failures': stats.failures,
+                'average_latency': (stats.average_runtime
+                                    if stats.executed else 0.0),
+                'last_latency': self._last_latency,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+class ClusterHealthScheduler(object):
+    """Decide when the health of each cluster should be polled next.
+
+    Clusters that keep reporting HEALTHY back off exponentially from
+    [kubernetes]health_polling_interval up to
+    [kubernetes]health_polling_max_interval. UNHEALTHY and UNKNOWN
+    clusters, and clusters whose status or health just changed, are polled
+    every [kubernetes]health_polling_unhealthy_interval. Every interval is
+    jittered so that polls do not all happen on the same tick.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # cluster uuid -> [next poll, interval, status, health status]
+        self._schedule = {}
+
+    @staticmethod
+    def _fast_interval():
+        return min(CONF.kubernetes.health_polling_unhealthy_interval,
+                   max(CONF.kubernetes.health_polling_interval, 1))
+
+    def _initial_interval(self, cluster):
+        if (cluster.health_status ==
+                objects.fields.ClusterHealthStatus.HEALTHY):
+            return max(CONF.kubernetes.health_polling_interval, 1)
+        return self._fast_interval()
+
+    @staticmethod
+    def _jitter(interval):
+        spread = interval * CONF.kubernetes.health_polling_jitter
+        return interval + random.uniform(-spread, spread)
+
+    def is_due(self, cluster, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._schedule.get(cluster.uuid)
+            if entry is None:
+                # first time we see this cluster, spread the initial polls
+                # of all clusters over one interval
+                interval = self._initial_interval(cluster)
+                entry = [now + random.uniform(0, interval), interval,
+                         cluster.status, cluster.health_status]
+                self._schedule[cluster.uuid] = entry
+            elif cluster.status != entry[2]:
+                # the cluster status changed under us, poll it right away
+                entry[0] = now
+                entry[1] = self._fast_interval()
+                entry[2] = cluster.status
+            return now >= entry[0]
+
+    def record(self, cluster, now=None):
+        """Schedule the next poll of a cluster that was just polled."""
+        now = time.monotonic() if now is None else now
+        healthy = objects.fields.ClusterHealthStatus.HEALTHY
+        with self._lock:
+            entry = self._schedule.get(cluster.uuid)
+            if entry is None:
+                entry = [now, self._initial_interval(cluster),
+                         cluster.status, None]
+                self._schedule[cluster.uuid] = entry
+            changed = (cluster.status != entry[2] or
+                       cluster.health_status != entry[3])
+            if cluster.health_status != healthy:
+                interval = self._fast_interval()
+            elif changed:
+                interval = max(CONF.kubernetes.health_polling_interval, 1)
+            else:
+                interval = max(
+                    min(entry[1] * 2,
+                        CONF.kubernetes.health_polling_max_interval),
+                    CONF.kubernetes.health_polling_interval, 1)
+            entry[:] = [now + self._jitter(interval), interval,
+                        cluster.status, cluster.health_status]
+
+    def interval(self, cluster_uuid):
+        with self._lock:
+            entry = self._schedule.get(cluster_uuid)
+            return entry[1] if entry else None
+
+    def prune(self, cluster_uuids):
+        """Forget clusters that are no longer polled by this conductor."""
+        with self._lock:
+            for uuid in set(self._schedule) - set(cluster_uuids):
+                del self._schedule[uuid]
+
+
+def purge_clusters(ctx, clusters):
+    """Remove deleted clusters along with their nodegroups and certificates.
+
+    The cached clients of the clusters are dropped, then the clusters, their
+    nodegroups and, when stored in the magnum database, their certificates
+    are deleted in a single transaction.
+    """
+    if not clusters:
+        return
+    cluster_uuids = [cluster.uuid for cluster in clusters]
+    # Clean up certificates, if they still exist.
+    cert_refs = cert_manager.delete_certificates_from_clusters(clusters,
+                                                               context=ctx)
+    cert_manager.invalidate_client_ssl_contexts(cluster_uuids)
+    k8s_api.evict_sessions(cluster_uuids)
+    for cluster_uuid in cluster_uuids:
+        k8s_node_watch.stop_watcher(cluster_uuid)
+    objects.Cluster.destroy_clusters(ctx, cluster_uuids, cert_refs=cert_refs)
+
+
+def _reload_cluster(cluster):
+    """Reload the cluster from the primary after a concurrent update.
+
+    Drops the changes the driver made to the stale copy, so that the next
+    save only writes what the driver sets again.
+    """
+    cluster.refresh()
+    cluster.obj_reset_changes()
+
+
 class ClusterUpdateJob(object):
 
     status_to_event = {
@@ -59,17 +294,38 @@ class ClusterUpdateJob(object):
         objects.fields.ClusterStatus.ROLLBACK_FAILED: taxonomy.ACTION_UPDATE
     }
 
-    def __init__(self, ctx, cluster):
+    def __init__(self, ctx, cluster, cdriver=None):
         self.ctx = ctx
         self.cluster = cluster
+        self.cdriver = cdriver
 
     def update_status(self):
         LOG.debug("Updating status for cluster %s", self.cluster.uuid)
         # get the driver for the cluster
-        cdriver = driver.Driver.get_driver_for_cluster(self.ctx, self.cluster)
+        if self.cdriver is None:
+            self.cdriver = driver.Driver.get_driver_for_cluster(
+                self.ctx, self.cluster)
         # ask the driver to sync status
-        cdriver.update_cluster_status(self.ctx, self.cluster)
+        try:
+            self.cdriver.update_cluster_status(self.ctx, self.cluster)
+        except exception.ConcurrentUpdate:
+            # somebody else saved the cluster since it was read, sync
+            # again from its current state
+            LOG.debug("Cluster %s was updated concurrently, retrying the "
+                      "status sync", self.cluster.uuid)
+            _reload_cluster(self.cluster)
+            self.cdriver.update_cluster_status(self.ctx, self.cluster)
+        self.process_status()
+        # end the "loop"
+        raise loopingcall.LoopingCallDone()
 
+    def process_status(self, deleted=None):
+        """Act on the status the driver reported for the cluster.
+
+        :param deleted: list the cluster is added to when it is deleted, for
+                        the caller to purge it along with other clusters.
+                        By default the cluster is purged right away.
+        """
         LOG.debug("Status for cluster %s updated to %s (%s)",
                   self.cluster.uuid, self.cluster.status,
                   self.cluster.status_reason)
@@ -84,22 +340,133 @@ class ClusterUpdateJob(object):
                 taxonomy.OUTCOME_FAILURE, self.cluster)
         # if we're done with it, delete it
         if self.cluster.status == objects.fields.ClusterStatus.DELETE_COMPLETE:
-            # Clean up certificates, if they still exist.
-            cert_manager.delete_certificates_from_cluster(self.cluster,
-                                                          context=self.ctx)
-            # delete all the nodegroups that belong to this cluster
-            for ng in objects.NodeGroup.list(self.ctx, self.cluster.uuid):
-                ng.destroy()
-            self.cluster.destroy()
+            if deleted is None:
+                purge_clusters(self.ctx, [self.cluster])
+            else:
+                deleted.append(self.cluster)
+
+
+class ClusterBatchUpdateJob(object):
+    """Sync the status of all the clusters of one driver in one call.
+
+    Used for drivers that implement Driver.update_clusters_status.
+    """
+
+    def __init__(self, ctx, cdriver, clusters):
+        self.ctx = ctx
+        self.cdriver = cdriver
+        self.clusters = clusters
+
+    def update_status(self):
+        LOG.debug("Updating status for %(count)d clusters of driver "
+                  "%(driver)s", {'count': len(self.clusters),
+                                 'driver': type(self.cdriver).__name__})
+        try:
+            self.cdriver.update_clusters_status(self.ctx, self.clusters)
+        except exception.ConcurrentUpdate as e:
+            # the clusters saved before the conflict are current, reloading
+            # them costs a query each but conflicts are rare
+            LOG.debug("%s, retrying the status sync of the batch", e)
+            for cluster in self.clusters:
+                _reload_cluster(cluster)
+            self.cdriver.update_clusters_status(self.ctx, self.clusters)
+        deleted = []
+        for cluster in self.clusters:
+            try:
+                ClusterUpdateJob(self.ctx, cluster,
+                                 self.cdriver).process_status(deleted)
+            except Exception as e:
+                LOG.warning("Failed to process the status of cluster "
+                            "%(cluster)s: %(e)s",
+                            {'cluster': cluster.uuid, 'e': e}, exc_info=True)
+        try:
+            purge_clusters(self.ctx, deleted)
+        except Exception as e:
+            LOG.warning("Failed to delete %(count)d clusters: %(e)s",
+                        {'count': len(deleted), 'e': e}, exc_info=True)
         # end the "loop"
         raise loopingcall.LoopingCallDone()
 
 
+class ClusterHealthWriter(object):
+    """Write-behind buffer for the health status of clusters.
+
+    Health polls that do not change the health of a cluster are dropped.
+    The remaining ones are kept, the latest one per cluster, until flush()
+    writes all of them to the database in a single bulk update.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict()
+        self._dropped = 0
+        self._written = 0
+
+    def add(self, cluster, health_status, health_status_reason):
+        """Record the result of a health poll of the cluster.
+
+        :returns: True if the health of the cluster changed and will be
+                  written on the next flush, False otherwise.
+        """
+        previous = (cluster.health_status, cluster.health_status_reason)
+        cluster.health_status = health_status
+        cluster.health_status_reason = health_status_reason
+        cluster.obj_reset_changes(['health_status', 'health_status_reason'])
+        with self._lock:
+            if (cluster.health_status, cluster.health_status_reason) == (
+                    previous):
+                # back to what the database holds, forget older changes
+                self._pending.pop(cluster.uuid, None)
+                self._dropped += 1
+                return False
+            self._pending[cluster.uuid] = cluster
+            return True
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, ctx):
+        """Write the buffered health changes and notify about them.
+
+        :returns: the number of clusters written.
+        """
+        with self._lock:
+            pending, self._pending = (self._pending,
+                                      collections.OrderedDict())
+        if not pending:
+            return 0
+        updates = {uuid: (cluster.health_status,
+                          cluster.health_status_reason)
+                   for uuid, cluster in pending.items()}
+        try:
+            objects.Cluster.update_health_status(ctx, updates)
+        except Exception:
+            # keep the changes for the next flush, unless newer ones came
+            with self._lock:
+                for uuid, cluster in pending.items():
+                    self._pending.setdefault(uuid, cluster)
+            raise
+        with self._lock:
+            self._written += len(pending)
+            LOG.debug("Wrote the health status of %(count)d clusters, "
+                      "%(written)d written and %(dropped)d unchanged so "
+                      "far", {'count': len(pending),
+                              'written': self._written,
+                              'dropped': self._dropped})
+        for cluster in pending.values():
+            conductor_utils.notify_about_cluster_operation(
+                ctx, HEALTH_UPDATE_ACTION, taxonomy.OUTCOME_SUCCESS, cluster)
+        return len(pending)
+
+
 class ClusterHealthUpdateJob(object):
 
-    def __init__(self, ctx, cluster):
+    def __init__(self, ctx, cluster, writer=None):
         self.ctx = ctx
         self.cluster = cluster
+        self.writer = writer
 
     def _update_health_status(self):
         monitor = monitors.create_monitor(self.ctx, self.cluster)
@@ -119,6 +486,11 @@ class ClusterHealthUpdateJob(object):
             return
 
         if monitor.data.get('health_status'):
+            if self.writer is not None:
+                self.writer.add(self.cluster,
+                                monitor.data.get('health_status'),
+                                monitor.data.get('health_status_reason'))
+                return
             self.cluster.health_status = monitor.data.get('health_status')
             self.cluster.health_status_reason = monitor.data.get(
                 'health_status_reason')
@@ -155,6 +527,64 @@ class MagnumPeriodicTasks(periodic_task.PeriodicTasks):
     def __init__(self, conf):
         super(MagnumPeriodicTasks, self).__init__(conf)
         self.notifier = rpc.get_notifier()
+        workers = conf.conductor.periodic_sync_workers
+        self.status_executor = ClusterJobExecutor('sync_cluster_status',
+                                                  workers)
+        self.health_executor = ClusterJobExecutor(
+            'sync_cluster_health_status', workers)
+        self.health_scheduler = ClusterHealthScheduler()
+        self.health_writer = ClusterHealthWriter()
+        self.ring_manager = None
+        if conf.conductor.periodic_shard_clusters:
+            self.ring_manager = hash_ring.HashRingManager(conf.host)
+
+    def _local_clusters(self, ctx, clusters):
+        """Return the clusters this conductor is responsible for polling."""
+        if self.ring_manager is None:
+            return clusters
+        return [cluster for cluster in clusters
+                if self.ring_manager.is_local(ctx, cluster.uuid)]
+
+    @staticmethod
+    def _group_by_driver(ctx, clusters):
+        """Group clusters by the driver that manages them.
+
+        The driver is looked up once per cluster template rather than once
+        per cluster.
+
+        :returns: list of (driver, clusters) tuples
+        """
+        drivers = {}
+        groups = collections.OrderedDict()
+        for cluster in clusters:
+            template_id = cluster.cluster_template_id
+            if template_id not in drivers:
+                try:
+                    drivers[template_id] = (
+                        driver.Driver.get_driver_for_cluster(ctx, cluster))
+                except Exception as e:
+                    LOG.warning("Cannot load the driver of cluster "
+                                "%(cluster)s: %(e)s",
+                                {'cluster': cluster.uuid, 'e': e})
+                    drivers[template_id] = None
+            cdriver = drivers[template_id]
+            if cdriver is None:
+                continue
+            groups.setdefault(_driver_name(cdriver),
+                              (cdriver, []))[1].append(cluster)
+        return list(groups.values())
+
+    @staticmethod
+    def _batches_status_updates(cdriver):
+        """Whether the driver overrides Driver.update_clusters_status."""
+        batched = getattr(type(cdriver), 'update_clusters_status', None)
+        return (batched is not None and
+                batched is not driver.Driver.update_clusters_status)
+
+    @staticmethod
+    def _log_executor_stats(executor):
+        LOG.debug("%(name)s executor: %(stats)s",
+                  {'name': executor.name, 'stats': executor.statistics()})
 
     @periodic_task.periodic_task(spacing=10, run_immediately=True)
     @set_context
@@ -168,23 +598,45 @@ class MagnumPeriodicTasks(periodic_task.PeriodicTasks):
                       objects.fields.ClusterStatus.DELETE_IN_PROGRESS,
                       objects.fields.ClusterStatus.ROLLBACK_IN_PROGRESS]
             filters = {'status': status}
-            clusters = objects.Cluster.list(ctx, filters=filters)
+            # The drivers save these rows, so read them from the primary:
+            # a lagging replica would hand them a stale generation.
+            clusters = self._local_clusters(
+                ctx, objects.Cluster.list(ctx, filters=filters))
             if not clusters:
                 return
 
             # synchronize with underlying orchestration
-            for cluster in clusters:
-                job = ClusterUpdateJob(ctx, cluster)
-                lc = loopingcall.FixedIntervalLoopingCall(f=job.update_status)
-                lc.start(1, stop_on_exception=True)
+            for cdriver, driver_clusters in self._group_by_driver(
+                    ctx, clusters):
+                if self._batches_status_updates(cdriver):
+                    name = _driver_name(cdriver)
+                    job = ClusterBatchUpdateJob(ctx, cdriver, driver_clusters)
+                    if not self.status_executor.submit('driver:' + name,
+                                                       job.update_status):
+                        LOG.debug("Status sync for driver %s still in "
+                                  "progress, skipping", name)
+                    continue
+                for cluster in driver_clusters:
+                    job = ClusterUpdateJob(ctx, cluster, cdriver)
+                    if not self.status_executor.submit(cluster.uuid,
+                                                       job.update_status):
+                        LOG.debug("Status sync for cluster %s still in "
+                                  "progress, skipping", cluster.uuid)
+            self._log_executor_stats(self.status_executor)
 
         except Exception as e:
             LOG.warning(
                 "Ignore error [%s] when syncing up cluster status.",
                 e, exc_info=True)
 
+    def _run_health_job(self, job):
+        try:
+            job.update_health_status()
+        finally:
+            self.health_scheduler.record(job.cluster)
+
     @periodic_task.periodic_task(
-        spacing=CONF.kubernetes.health_polling_interval,
+        spacing=_health_polling_tick(),
         run_immediately=True)
     @set_context
     def sync_cluster_health_status(self, ctx):
@@ -202,22 +654,61 @@ class MagnumPeriodicTasks(periodic_task.PeriodicTasks):
                       objects.fields.ClusterStatus.DELETE_FAILED,
                       objects.fields.ClusterStatus.ROLLBACK_IN_PROGRESS]
             filters = {'status': status}
-            clusters = objects.Cluster.list(ctx, filters=filters)
+            clusters = self._local_clusters(
+                ctx, objects.Cluster.list(ctx, filters=filters,
+                                          use_replica=True))
+            self.health_scheduler.prune(c.uuid for c in clusters)
+            clusters = [c for c in clusters
+                        if self.health_scheduler.is_due(c)]
             if not clusters:
                 return
 
             # synchronize using native COE API
             for cluster in clusters:
-                job = ClusterHealthUpdateJob(ctx, cluster)
-                lc = loopingcall.FixedIntervalLoopingCall(
-                    f=job.update_health_status)
-                lc.start(1, stop_on_exception=True)
+                job = ClusterHealthUpdateJob(ctx, cluster,
+                                             self.health_writer)
+                if not self.health_executor.submit(
+                        cluster.uuid,
+                        functools.partial(self._run_health_job, job)):
+                    LOG.debug("Health sync for cluster %s still in "
+                              "progress, skipping", cluster.uuid)
+            self._log_executor_stats(self.health_executor)
 
         except Exception as e:
             LOG.warning(
                 "Ignore error [%s] when syncing up cluster status.",
                 e, exc_info=True)
 
+    @periodic_task.periodic_task(
+        spacing=CONF.kubernetes.health_status_flush_interval,
+        run_immediately=True)
+    @set_context
+    def flush_cluster_health_status(self, ctx):
+        try:
+            self.health_writer.flush(ctx)
+        except Exception as e:
+            LOG.warning(
+                "Ignore error [%s] when writing cluster health status.",
+                e, exc_info=True)
+
+    @periodic_task.periodic_task(
+        spacing=CONF.conductor.stats_reconcile_interval)
+    @set_context
+    def reconcile_project_stats(self, ctx):
+        # one conductor is enough
+        if (self.ring_manager is not None and
+                not self.ring_manager.is_local(ctx, 'project_stats')):
+            return
+        try:
+            fixed = objects.Stats.reconcile(ctx)
+            if fixed:
+                LOG.info("Corrected the cluster and node counts of "
+                         "%d projects.", fixed)
+        except Exception as e:
+            LOG.warning(
+                "Ignore error [%s] when reconciling project stats.",
+                e, exc_info=True)
+
 
 def setup(conf, tg):
     pt = MagnumPeriodicTasks(conf)
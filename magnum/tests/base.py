@@ -27,7 +27,10 @@ import testscenarios
 
 from magnum.common import context as magnum_context
 from magnum.common import keystone as magnum_keystone
+from magnum.conductor.handlers.common import cert_manager
+from magnum.conductor import k8s_api
 from magnum.objects import base as objects_base
+from magnum.objects import cluster_template
 from magnum.tests import conf_fixture
 from magnum.tests import fake_notifier
 from magnum.tests import output_fixture
@@ -118,6 +121,9 @@ class TestCase(base.BaseTestCase):
             pecan.set_config({}, overwrite=True)
 
         self.addCleanup(reset_pecan)
+        self.addCleanup(k8s_api.clear_session_cache)
+        self.addCleanup(cert_manager.clear_client_ssl_context_cache)
+        self.addCleanup(cluster_template.clear_cache)
 
     def start_global(self, name):
         self.global_mocks[name].start()
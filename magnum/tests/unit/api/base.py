@@ -242,6 +242,17 @@ class FunctionalTest(base.DbTestCase):
         print('GOT:%s' % response)
         return response
 
+    def get_conditional(self, path, etag=None, headers=None,
+                        path_prefix=PATH_PREFIX):
+        """Sends a GET request, with If-None-Match if etag is given.
+
+        :returns: the response, whose ETag header is the one to send next.
+        """
+        headers = dict(headers or {"X-Roles": "reader"})
+        if etag:
+            headers['If-None-Match'] = etag
+        return self.app.get(path_prefix + path, headers=headers)
+
     def validate_link(self, link, bookmark=False):
         """Checks if the given link can get correct data."""
         # removes the scheme and net location parts of the link
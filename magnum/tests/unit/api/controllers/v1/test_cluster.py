@@ -17,6 +17,8 @@ from oslo_config import cfg
 from oslo_serialization import jsonutils
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
+import sqlalchemy as sa
+from sqlalchemy import engine as sa_engine
 from wsme import types as wtypes
 
 from magnum.api import attr_validator
@@ -26,6 +28,7 @@ from magnum.conductor import api as rpcapi
 import magnum.conf
 from magnum.drivers.common import driver
 from magnum import objects
+from magnum.objects import fields
 from magnum.tests import base
 from magnum.tests.unit.api import base as api_base
 from magnum.tests.unit.api import utils as apiutils
@@ -92,6 +95,141 @@ class TestListCluster(api_base.FunctionalTest):
         self.assertEqual(cluster.uuid, response['uuid'])
         self._verify_attrs(self._expand_cluster_attrs, response)
 
+    def test_get_one_not_modified(self):
+        cluster = obj_utils.create_test_cluster(self.context)
+        path = '/clusters/%s' % cluster.uuid
+        etag = self.get_conditional(path).headers['ETag']
+
+        response = self.get_conditional(path, etag)
+        self.assertEqual(304, response.status_int)
+        self.assertEqual(b'', response.body)
+        self.assertEqual(etag, response.headers['ETag'])
+
+    def test_get_one_modified(self):
+        cluster = obj_utils.create_test_cluster(self.context)
+        path = '/clusters/%s' % cluster.uuid
+        etag = self.get_conditional(path).headers['ETag']
+
+        cluster.status_reason = 'new reason'
+        cluster.save()
+        response = self.get_conditional(path, etag)
+        self.assertEqual(200, response.status_int)
+        self.assertEqual('new reason', response.json['status_reason'])
+        self.assertNotEqual(etag, response.headers['ETag'])
+
+    def test_get_one_nodegroup_modified(self):
+        cluster = obj_utils.create_test_cluster(self.context,
+                                                status='CREATE_FAILED',
+                                                master_status='CREATE_FAILED',
+                                                master_reason='fake_reason')
+        path = '/clusters/%s' % cluster.uuid
+        etag = self.get_conditional(path).headers['ETag']
+
+        master = cluster.default_ng_master
+        master.status_reason = 'new reason'
+        master.save()
+        response = self.get_conditional(path, etag)
+        self.assertEqual(200, response.status_int)
+        self.assertEqual({master.name: 'new reason'},
+                         response.json['faults'])
+
+    def test_get_one_etag_depends_on_version(self):
+        cluster = obj_utils.create_test_cluster(self.context)
+        path = '/clusters/%s' % cluster.uuid
+        etag = self.get_conditional(path).headers['ETag']
+
+        response = self.get_conditional(
+            path, etag, headers={'X-Roles': 'reader',
+                                 'OpenStack-API-Version':
+                                 'container-infra latest'})
+        self.assertEqual(200, response.status_int)
+        self.assertNotEqual(etag, response.headers['ETag'])
+
+    def test_get_all_not_modified(self):
+        obj_utils.create_test_cluster(self.context)
+        etag = self.get_conditional('/clusters').headers['ETag']
+        response = self.get_conditional('/clusters', etag)
+        self.assertEqual(304, response.status_int)
+
+        obj_utils.create_test_cluster(self.context, id=2,
+                                      uuid=uuidutils.generate_uuid(),
+                                      name='cluster2')
+        response = self.get_conditional('/clusters', etag)
+        self.assertEqual(200, response.status_int)
+        self.assertEqual(2, len(response.json['clusters']))
+
+    def test_get_one_health_modified(self):
+        cluster = obj_utils.create_test_cluster(self.context)
+        path = '/clusters/%s' % cluster.uuid
+        etag = self.get_conditional(path).headers['ETag']
+
+        # the health sync does not bump the generation of the cluster
+        objects.Cluster.update_health_status(
+            self.context, {cluster.uuid: ('UNHEALTHY', {'api': 'down'})})
+        response = self.get_conditional(path, etag)
+        self.assertEqual(200, response.status_int)
+        self.assertEqual('UNHEALTHY', response.json['health_status'])
+
+    def _get_counting_nodegroup_queries(self, path, etag=None):
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            if 'FROM nodegroup' in statement:
+                statements.append(statement)
+
+        sa.event.listen(sa_engine.Engine, 'before_cursor_execute', count)
+        try:
+            response = self.get_conditional(path, etag)
+        finally:
+            sa.event.remove(sa_engine.Engine, 'before_cursor_execute', count)
+        return response, len(statements)
+
+    def test_get_one_loads_nodegroups_once(self):
+        cluster = obj_utils.create_test_cluster(self.context,
+                                                status='CREATE_FAILED',
+                                                master_status='CREATE_FAILED',
+                                                master_reason='fake_reason')
+        path = '/clusters/%s' % cluster.uuid
+
+        response, queries = self._get_counting_nodegroup_queries(path)
+        self.assertEqual(200, response.status_int)
+        self.assertEqual({cluster.default_ng_master.name: 'fake_reason'},
+                         response.json['faults'])
+        self.assertEqual(1, queries)
+
+        response, queries = self._get_counting_nodegroup_queries(
+            path, response.headers['ETag'])
+        self.assertEqual(304, response.status_int)
+        self.assertEqual(1, queries)
+
+    def test_get_all_loads_nodegroups_once(self):
+        for id_ in range(3):
+            obj_utils.create_test_cluster(self.context, id=id_,
+                                          uuid=uuidutils.generate_uuid(),
+                                          name='cluster%d' % id_)
+
+        for path in ('/clusters', '/clusters/detail'):
+            response, queries = self._get_counting_nodegroup_queries(path)
+            self.assertEqual(200, response.status_int)
+            self.assertEqual(3, len(response.json['clusters']))
+            self.assertEqual(1, queries)
+
+            response, queries = self._get_counting_nodegroup_queries(
+                path, response.headers['ETag'])
+            self.assertEqual(304, response.status_int)
+            self.assertEqual(1, queries)
+
+    def test_get_all_nodegroup_modified(self):
+        cluster = obj_utils.create_test_cluster(self.context)
+        etag = self.get_conditional('/clusters').headers['ETag']
+
+        worker = cluster.default_ng_worker
+        worker.node_count = 5
+        worker.save()
+        response = self.get_conditional('/clusters', etag)
+        self.assertEqual(200, response.status_int)
+        self.assertEqual(5, response.json['clusters'][0]['node_count'])
+
     def test_get_one_failed_cluster(self):
         cluster = obj_utils.create_test_cluster(self.context,
                                                 status='CREATE_FAILED',
@@ -209,6 +347,31 @@ class TestListCluster(api_base.FunctionalTest):
         self._verify_attrs(self._expand_cluster_attrs,
                            response['clusters'][0])
 
+    def _count_detail_queries(self):
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        sa.event.listen(sa_engine.Engine, 'before_cursor_execute', count)
+        try:
+            response = self.get_json('/clusters/detail?limit=1000')
+        finally:
+            sa.event.remove(sa_engine.Engine, 'before_cursor_execute', count)
+        for cluster in response['clusters']:
+            self.assertEqual(3, cluster['node_count'])
+            self.assertEqual(3, cluster['master_count'])
+        return len(response['clusters']), len(statements)
+
+    def test_detail_query_count_independent_of_page_size(self):
+        for id_ in range(20):
+            obj_utils.create_test_cluster(self.context, id=id_,
+                                          uuid=uuidutils.generate_uuid())
+            if id_ == 0:
+                clusters, queries = self._count_detail_queries()
+                self.assertEqual(1, clusters)
+        self.assertEqual((20, queries), self._count_detail_queries())
+
     def test_detail_with_pagination_marker(self):
         cluster_list = []
         for id_ in range(4):
@@ -277,6 +440,91 @@ class TestListCluster(api_base.FunctionalTest):
         self.assertIn(next_marker, response['next'])
 
 
+class TestListClusterFilters(api_base.FunctionalTest):
+    """Test the filters of the cluster listings of microversion 1.15."""
+
+    _headers = {'OpenStack-API-Version': 'container-infra 1.15',
+                'X-Roles': 'reader'}
+
+    def setUp(self):
+        super(TestListClusterFilters, self).setUp()
+        self.failed = obj_utils.create_test_cluster(
+            self.context, id=1, uuid=uuidutils.generate_uuid(),
+            name='failed', status=fields.ClusterStatus.UPDATE_FAILED,
+            node_count=2, labels={'env': 'prod', 'team': 'a'})
+        self.complete = obj_utils.create_test_cluster(
+            self.context, id=2, uuid=uuidutils.generate_uuid(),
+            name='complete', status=fields.ClusterStatus.CREATE_COMPLETE,
+            node_count=3, labels={'env': 'prod', 'team': 'b'})
+        self.dev = obj_utils.create_test_cluster(
+            self.context, id=3, uuid=uuidutils.generate_uuid(),
+            name='dev', status=fields.ClusterStatus.CREATE_FAILED,
+            node_count=3, labels={'env': 'dev'})
+
+    def _list(self, query, path='/clusters'):
+        response = self.get_json('%s?%s' % (path, query),
+                                 headers=self._headers)
+        return [c['uuid'] for c in response['clusters']]
+
+    def test_filter_by_status(self):
+        self.assertEqual([self.failed.uuid],
+                         self._list('status=UPDATE_FAILED'))
+        self.assertEqual([self.failed.uuid, self.dev.uuid],
+                         self._list('status=UPDATE_FAILED,CREATE_FAILED'))
+
+    def test_filter_by_invalid_status(self):
+        response = self.get_json('/clusters?status=BROKEN',
+                                 headers=self._headers, expect_errors=True)
+        self.assertEqual(400, response.status_int)
+
+    def test_filter_by_name_and_node_count(self):
+        self.assertEqual([self.dev.uuid], self._list('name=dev'))
+        self.assertEqual([self.complete.uuid, self.dev.uuid],
+                         self._list('node_count=3'))
+        self.assertEqual([], self._list('node_count=3&name=failed'))
+
+    def test_filter_by_cluster_template_and_project(self):
+        self.assertEqual(
+            [self.failed.uuid, self.complete.uuid, self.dev.uuid],
+            self._list('cluster_template_id=%s&project_id=%s' % (
+                self.failed.cluster_template_id, self.context.project_id)))
+        self.assertEqual([], self._list('project_id=other_project'))
+
+    def test_filter_by_labels(self):
+        self.assertEqual([self.failed.uuid, self.complete.uuid],
+                         self._list('labels=env%3Dprod'))
+        self.assertEqual([self.complete.uuid],
+                         self._list('labels=env%3Dprod,team%3Db',
+                                    path='/clusters/detail'))
+
+    def test_filter_by_invalid_labels(self):
+        for selector in ('env', 'env%3Dprod,', 'e%22nv%3Dprod'):
+            response = self.get_json('/clusters?labels=%s' % selector,
+                                     headers=self._headers,
+                                     expect_errors=True)
+            self.assertEqual(400, response.status_int)
+
+    def test_next_link_keeps_filters(self):
+        response = self.get_json('/clusters?limit=1&labels=env%3Dprod',
+                                 headers=self._headers)
+        self.assertEqual([self.failed.uuid],
+                         [c['uuid'] for c in response['clusters']])
+        self.assertIn('labels=env%3Dprod', response['next'])
+
+        next_page = response['next'].split('/v1', 1)[1]
+        response = self.get_json(next_page, headers=self._headers)
+        self.assertEqual([self.complete.uuid],
+                         [c['uuid'] for c in response['clusters']])
+
+    def test_filters_need_microversion(self):
+        response = self.get_json(
+            '/clusters?status=UPDATE_FAILED',
+            headers={'OpenStack-API-Version': 'container-infra 1.14',
+                     'X-Roles': 'reader'},
+            expect_errors=True)
+        self.assertEqual(400, response.status_int)
+
+
 class TestClusterMicroversion1_13(api_base.FunctionalTest):
     """Test cluster_id field introduced in microversion 1.13."""
 
@@ -349,7 +597,8 @@ class TestPatch(api_base.FunctionalTest):
         self.addCleanup(p.stop)
 
     def _sim_rpc_cluster_update(self, cluster, node_count, health_status,
-                                health_status_reason, rollback=False):
+                                health_status_reason, rollback=False,
+                                reservation_id=None):
         cluster.status = 'UPDATE_IN_PROGRESS'
         cluster.health_status = health_status
         cluster.health_status_reason = health_status_reason
@@ -382,6 +631,20 @@ class TestPatch(api_base.FunctionalTest):
         self.assertEqual(self.cluster_obj.cluster_template_id,
                          response['cluster_template_id'])
 
+    def test_replace_node_count_releases_quota_if_cast_fails(self):
+        self.mock_cluster_update.side_effect = RuntimeError('rabbit is gone')
+
+        response = self.patch_json('/clusters/%s' % self.cluster_obj.uuid,
+                                   [{'path': '/node_count',
+                                     'value': 4,
+                                     'op': 'replace'}],
+                                   expect_errors=True)
+        self.assertEqual(500, response.status_code)
+        self.assertIsNotNone(
+            self.mock_cluster_update.call_args[1]['reservation_id'])
+        self.assertEqual(
+            (0, 0), db_utils.get_reserved_quota(self.cluster_obj.project_id))
+
     @mock.patch('oslo_utils.timeutils.utcnow')
     def test_replace_health_status_ok(self, mock_utcnow):
         new_health_status = 'HEALTHY'
@@ -549,7 +812,8 @@ class TestPatch(api_base.FunctionalTest):
 
         self.mock_cluster_update.assert_called_once_with(
             mock.ANY, node_count, self.cluster_obj.health_status,
-            self.cluster_obj.health_status_reason, True)
+            self.cluster_obj.health_status_reason, True,
+            reservation_id=mock.ANY)
         self.assertEqual(202, response.status_code)
 
     def test_update_cluster_with_rollback_disabled(self):
@@ -564,7 +828,8 @@ class TestPatch(api_base.FunctionalTest):
 
         self.mock_cluster_update.assert_called_once_with(
             mock.ANY, node_count, self.cluster_obj.health_status,
-            self.cluster_obj.health_status_reason, False)
+            self.cluster_obj.health_status_reason, False,
+            reservation_id=mock.ANY)
         self.assertEqual(202, response.status_code)
 
     def test_update_cluster_with_zero_node_count_fail(self):
@@ -592,7 +857,8 @@ class TestPatch(api_base.FunctionalTest):
 
         self.mock_cluster_update.assert_called_once_with(
             mock.ANY, node_count, self.cluster_obj.health_status,
-            self.cluster_obj.health_status_reason, False)
+            self.cluster_obj.health_status_reason, False,
+            reservation_id=mock.ANY)
         self.assertEqual(202, response.status_code)
 
     def test_remove_ok(self):
@@ -671,7 +937,7 @@ class TestPost(api_base.FunctionalTest):
         self.addCleanup(p.stop)
 
     def _simulate_cluster_create(self, cluster, master_count, node_count,
-                                 create_timeout):
+                                 create_timeout, reservation_id=None):
         cluster.create()
         return cluster
 
@@ -724,11 +990,37 @@ class TestPost(api_base.FunctionalTest):
         self.assertEqual(403, response.status_int)
         self.assertTrue(response.json['errors'])
 
+    def test_create_cluster_node_limit_reached(self):
+        CONF.set_override('max_nodes_per_project', 5, group='quotas')
+        bdict = apiutils.cluster_post_data(master_count=1, node_count=5)
+
+        response = self.post_json('/clusters', bdict, expect_errors=True)
+        self.assertEqual(403, response.status_int)
+        self.assertIn('maximum nodes per project, 5',
+                      response.json['errors'][0]['detail'])
+        self.assertFalse(self.mock_cluster_create.called)
+
+        bdict = apiutils.cluster_post_data(master_count=1, node_count=4)
+        response = self.post_json('/clusters', bdict)
+        self.assertEqual(202, response.status_int)
+
+    def test_create_cluster_releases_quota_if_cast_fails(self):
+        self.mock_cluster_create.side_effect = RuntimeError('rabbit is gone')
+        bdict = apiutils.cluster_post_data()
+
+        response = self.post_json('/clusters', bdict, expect_errors=True)
+        self.assertEqual(500, response.status_int)
+        self.assertIsNotNone(
+            self.mock_cluster_create.call_args[1]['reservation_id'])
+        self.assertEqual(
+            (0, 0), db_utils.get_reserved_quota(self.context.project_id))
+
     def test_create_cluster_set_project_id_and_user_id(self):
         bdict = apiutils.cluster_post_data()
 
         def _simulate_rpc_cluster_create(cluster, master_count, node_count,
-                                         create_timeout):
+                                         create_timeout,
+                                         reservation_id=None):
             self.assertEqual(self.context.project_id, cluster.project_id)
             self.assertEqual(self.context.user_id, cluster.user_id)
             cluster.create()
@@ -917,7 +1209,8 @@ class TestPost(api_base.FunctionalTest):
 
     def test_create_cluster_with_no_timeout(self):
         def _simulate_rpc_cluster_create(cluster, master_count, node_count,
-                                         create_timeout):
+                                         create_timeout,
+                                         reservation_id=None):
             self.assertEqual(60, create_timeout)
             cluster.create()
             return cluster
@@ -18,6 +18,7 @@ from magnum.common import context as magnum_context
 from magnum.conductor import api as rpcapi
 import magnum.conf
 from magnum.tests.unit.api import base as api_base
+from magnum.tests.unit.db import utils as db_utils
 from magnum.tests.unit.objects import utils as obj_utils
 
 CONF = magnum.conf.CONF
@@ -35,7 +36,8 @@ class TestClusterResize(api_base.FunctionalTest):
         self.addCleanup(p.stop)
 
     def _sim_rpc_cluster_resize(self, cluster, node_count, nodes_to_remove,
-                                nodegroup, rollback=False):
+                                nodegroup, rollback=False,
+                                reservation_id=None):
         nodegroup.node_count = node_count
         nodegroup.save()
         return cluster
@@ -56,6 +58,21 @@ class TestClusterResize(api_base.FunctionalTest):
         self.assertEqual(self.cluster_obj.cluster_template_id,
                          response['cluster_template_id'])
 
+    def test_resize_releases_quota_if_cast_fails(self):
+        self.mock_cluster_resize.side_effect = RuntimeError('rabbit is gone')
+        response = self.post_json('/clusters/%s/actions/resize' %
+                                  self.cluster_obj.uuid,
+                                  {"node_count": 6},
+                                  headers={"Openstack-Api-Version":
+                                           "container-infra 1.7",
+                                           "X-Roles": "member"},
+                                  expect_errors=True)
+        self.assertEqual(500, response.status_code)
+        self.assertIsNotNone(
+            self.mock_cluster_resize.call_args[1]['reservation_id'])
+        self.assertEqual(
+            (0, 0), db_utils.get_reserved_quota(self.cluster_obj.project_id))
+
     def test_resize_with_nodegroup(self):
         new_node_count = 6
         nodegroup = self.cluster_obj.default_ng_worker
@@ -87,6 +87,57 @@ class TestListClusterTemplate(api_base.FunctionalTest):
         self.assertEqual(cluster_template.uuid, response['uuid'])
         self._verify_attrs(self._cluster_template_attrs, response)
 
+    def test_get_one_not_modified(self):
+        cluster_template = obj_utils.create_test_cluster_template(self.context)
+        path = '/clustertemplates/%s' % cluster_template.uuid
+        etag = self.get_conditional(path).headers['ETag']
+
+        response = self.get_conditional(path, etag)
+        self.assertEqual(304, response.status_int)
+        self.assertEqual(b'', response.body)
+
+        cluster_template.name = 'new-name'
+        cluster_template.save()
+        response = self.get_conditional(path, etag)
+        self.assertEqual(200, response.status_int)
+        self.assertEqual('new-name', response.json['name'])
+
+    def test_get_all_not_modified(self):
+        cluster_template = obj_utils.create_test_cluster_template(self.context)
+        etag = self.get_conditional('/clustertemplates').headers['ETag']
+        response = self.get_conditional('/clustertemplates', etag)
+        self.assertEqual(304, response.status_int)
+
+        # another page is another representation
+        response = self.get_conditional('/clustertemplates?limit=1', etag)
+        self.assertEqual(200, response.status_int)
+
+        cluster_template.public = True
+        cluster_template.save()
+        response = self.get_conditional('/clustertemplates', etag)
+        self.assertEqual(200, response.status_int)
+
+    def test_get_all_public_of_other_projects(self):
+        own = obj_utils.create_test_cluster_template(
+            self.context, id=1, uuid=uuidutils.generate_uuid())
+        public = obj_utils.create_test_cluster_template(
+            self.context, id=2, uuid=uuidutils.generate_uuid(),
+            project_id='other_project', user_id='other_user', public=True)
+        obj_utils.create_test_cluster_template(
+            self.context, id=3, uuid=uuidutils.generate_uuid(),
+            project_id='other_project', user_id='other_user',
+            public=True, hidden=True)
+        for path in ('/clustertemplates', '/clustertemplates/detail'):
+            response = self.get_json(path)
+            self.assertEqual([own.uuid, public.uuid],
+                             [ct['uuid'] for ct in
+                              response['clustertemplates']])
+
+        public.name = 'renamed'
+        public.save()
+        response = self.get_json('/clustertemplates/detail')
+        self.assertEqual('renamed', response['clustertemplates'][1]['name'])
+
     def test_get_one_by_name(self):
         cluster_template = obj_utils.create_test_cluster_template(self.context)
         response = self.get_json('/clustertemplates/%s' %
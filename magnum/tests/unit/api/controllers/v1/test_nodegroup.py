@@ -106,6 +106,37 @@ class TestListNodegroups(NodeGroupControllerTest):
         expected = [ng.uuid for ng in self.cluster.nodegroups]
         self._test_list_nodegroups(self.cluster_uuid, expected=expected)
 
+    def get_conditional(self, *args, **kwargs):
+        kwargs['headers'] = dict(self.headers, **{'X-Roles': 'reader'})
+        return super(TestListNodegroups, self).get_conditional(*args,
+                                                               **kwargs)
+
+    def test_get_all_not_modified(self):
+        path = '/clusters/%s/nodegroups' % self.cluster_uuid
+        etag = self.get_conditional(path).headers['ETag']
+        response = self.get_conditional(path, etag)
+        self.assertEqual(304, response.status_int)
+
+        worker = self.cluster.default_ng_worker
+        worker.node_count = 5
+        worker.save()
+        response = self.get_conditional(path, etag)
+        self.assertEqual(200, response.status_int)
+
+    def test_get_one_not_modified(self):
+        worker = self.cluster.default_ng_worker
+        path = '/clusters/%s/nodegroups/%s' % (self.cluster_uuid, worker.uuid)
+        etag = self.get_conditional(path).headers['ETag']
+        response = self.get_conditional(path, etag)
+        self.assertEqual(304, response.status_int)
+        self.assertEqual(b'', response.body)
+
+        worker.max_node_count = 10
+        worker.save()
+        response = self.get_conditional(path, etag)
+        self.assertEqual(200, response.status_int)
+        self.assertEqual(10, response.json['max_node_count'])
+
     def test_get_all_by_name(self):
         expected = [ng.uuid for ng in self.cluster.nodegroups]
         self._test_list_nodegroups(self.cluster.name, expected=expected)
@@ -289,7 +320,8 @@ class TestPost(NodeGroupControllerTest):
         self.mock_valid_flavor_disk = p.start()
         self.addCleanup(p.stop)
 
-    def _simulate_nodegroup_create(self, cluster, nodegroup):
+    def _simulate_nodegroup_create(self, cluster, nodegroup,
+                                   reservation_id=None):
         nodegroup.create()
         return nodegroup
 
@@ -302,6 +334,17 @@ class TestPost(NodeGroupControllerTest):
         self.assertTrue(uuidutils.is_uuid_like(response.json['uuid']))
         self.assertFalse(response.json['is_default'])
 
+    def test_create_nodegroup_releases_quota_if_cast_fails(self):
+        self.mock_ng_create.side_effect = RuntimeError('rabbit is gone')
+        ng_dict = apiutils.nodegroup_post_data()
+
+        response = self.post_json(self.url, ng_dict, expect_errors=True)
+        self.assertEqual(500, response.status_int)
+        self.assertIsNotNone(
+            self.mock_ng_create.call_args[1]['reservation_id'])
+        self.assertEqual(
+            (0, 0), db_utils.get_reserved_quota(self.cluster.project_id))
+
     def test_create_nodegroup_without_node_count(self):
         ng_dict = apiutils.nodegroup_post_data()
         del ng_dict['node_count']
@@ -14,6 +14,7 @@
 
 from unittest import mock
 
+import fixtures
 from oslo_concurrency import processutils
 
 from magnum.cmd import api
@@ -25,44 +26,61 @@ from magnum.tests import base
 @mock.patch('magnum.objects.base.MagnumObject')
 class TestMagnumAPI(base.TestCase):
 
-    @mock.patch('werkzeug.serving.run_simple')
+    def setUp(self):
+        super(TestMagnumAPI, self).setUp()
+        self.mock_preload = self.useFixture(fixtures.MockPatch(
+            'magnum.common.service.preload')).mock
+
+    def _assert_served(self, mock_server, mock_launch, app, workers,
+                       ssl_context=None):
+        mock_server.assert_called_once_with(
+            'magnum-api', app, base.CONF.api.host, base.CONF.api.port,
+            base.CONF.api.threads,
+            client_socket_timeout=base.CONF.api.client_socket_timeout,
+            keepalive_timeout=base.CONF.api.keepalive_timeout,
+            backlog=base.CONF.api.backlog, ssl_context=ssl_context)
+        self.mock_preload.assert_called_once_with(load_policy=True)
+        mock_launch.assert_called_once_with(
+            base.CONF, mock_server.return_value, workers=workers)
+        mock_launch.return_value.wait.assert_called_once_with()
+
+    @mock.patch('oslo_service.service.launch')
+    @mock.patch.object(api.wsgi_service, 'WSGIService')
     @mock.patch.object(api, 'api_app')
     @mock.patch('magnum.common.service.prepare_service')
-    def test_api_http(self, mock_prep, mock_app, mock_run, mock_base):
+    def test_api_http(self, mock_prep, mock_app, mock_server, mock_launch,
+                      mock_base):
         api.main()
 
         app = mock_app.load_app.return_value
         mock_prep.assert_called_once_with(mock.ANY)
         mock_app.load_app.assert_called_once_with()
         workers = processutils.get_worker_count()
-        mock_run.assert_called_once_with(base.CONF.api.host,
-                                         base.CONF.api.port,
-                                         app, processes=workers,
-                                         ssl_context=None)
+        self._assert_served(mock_server, mock_launch, app, workers)
 
-    @mock.patch('werkzeug.serving.run_simple')
+    @mock.patch('oslo_service.service.launch')
+    @mock.patch.object(api.wsgi_service, 'WSGIService')
     @mock.patch.object(api, 'api_app')
     @mock.patch('magnum.common.service.prepare_service')
     def test_api_http_config_workers(self, mock_prep, mock_app,
-                                     mock_run, mock_base):
+                                     mock_server, mock_launch, mock_base):
         fake_workers = 8
-        self.config(workers=fake_workers, group='api')
+        self.config(workers=fake_workers, threads=4, group='api')
         api.main()
 
         app = mock_app.load_app.return_value
         mock_prep.assert_called_once_with(mock.ANY)
         mock_app.load_app.assert_called_once_with()
-        mock_run.assert_called_once_with(base.CONF.api.host,
-                                         base.CONF.api.port,
-                                         app, processes=fake_workers,
-                                         ssl_context=None)
+        self._assert_served(mock_server, mock_launch, app, fake_workers)
+        self.assertEqual(4, mock_server.call_args[0][4])
 
     @mock.patch('os.path.exists')
-    @mock.patch('werkzeug.serving.run_simple')
+    @mock.patch('oslo_service.service.launch')
+    @mock.patch.object(api.wsgi_service, 'WSGIService')
     @mock.patch.object(api, 'api_app')
     @mock.patch('magnum.common.service.prepare_service')
-    def test_api_https_no_cert(self, mock_prep, mock_app, mock_run,
-                               mock_exist, mock_base):
+    def test_api_https_no_cert(self, mock_prep, mock_app, mock_server,
+                               mock_launch, mock_exist, mock_base):
         self.config(enabled_ssl=True,
                     ssl_cert_file='tmp_crt',
                     group='api')
@@ -71,15 +89,17 @@ class TestMagnumAPI(base.TestCase):
         self.assertRaises(RuntimeError, api.main)
         mock_prep.assert_called_once_with(mock.ANY)
         mock_app.load_app.assert_called_once_with()
-        mock_run.assert_not_called()
+        mock_server.assert_not_called()
+        mock_launch.assert_not_called()
         mock_exist.assert_called_once_with('tmp_crt')
 
     @mock.patch('os.path.exists')
-    @mock.patch('werkzeug.serving.run_simple')
+    @mock.patch('oslo_service.service.launch')
+    @mock.patch.object(api.wsgi_service, 'WSGIService')
     @mock.patch.object(api, 'api_app')
     @mock.patch('magnum.common.service.prepare_service')
-    def test_api_https_no_key(self, mock_prep, mock_app, mock_run,
-                              mock_exist, mock_base):
+    def test_api_https_no_key(self, mock_prep, mock_app, mock_server,
+                              mock_launch, mock_exist, mock_base):
         self.config(enabled_ssl=True,
                     ssl_cert_file='tmp_crt',
                     ssl_key_file='tmp_key',
@@ -89,15 +109,17 @@ class TestMagnumAPI(base.TestCase):
         self.assertRaises(RuntimeError, api.main)
         mock_prep.assert_called_once_with(mock.ANY)
         mock_app.load_app.assert_called_once_with()
-        mock_run.assert_not_called()
+        mock_server.assert_not_called()
+        mock_launch.assert_not_called()
         mock_exist.assert_has_calls([mock.call('tmp_crt'),
                                      mock.call('tmp_key')])
 
     @mock.patch('os.path.exists')
-    @mock.patch('werkzeug.serving.run_simple')
+    @mock.patch('oslo_service.service.launch')
+    @mock.patch.object(api.wsgi_service, 'WSGIService')
     @mock.patch.object(api, 'api_app')
     @mock.patch('magnum.common.service.prepare_service')
-    def test_api_https(self, mock_prep, mock_app, mock_run,
+    def test_api_https(self, mock_prep, mock_app, mock_server, mock_launch,
                        mock_exist, mock_base):
         self.config(enabled_ssl=True,
                     ssl_cert_file='tmp_crt',
@@ -113,7 +135,5 @@ class TestMagnumAPI(base.TestCase):
         mock_exist.assert_has_calls([mock.call('tmp_crt'),
                                      mock.call('tmp_key')])
         workers = processutils.get_worker_count()
-        mock_run.assert_called_once_with(base.CONF.api.host,
-                                         base.CONF.api.port, app,
-                                         processes=workers,
-                                         ssl_context=('tmp_crt', 'tmp_key'))
+        self._assert_served(mock_server, mock_launch, app, workers,
+                            ssl_context=('tmp_crt', 'tmp_key'))
@@ -14,6 +14,7 @@
 
 from unittest import mock
 
+import fixtures
 from oslo_concurrency import processutils
 
 from magnum.cmd import conductor
@@ -22,6 +23,11 @@ from magnum.tests import base
 
 class TestMagnumConductor(base.TestCase):
 
+    def setUp(self):
+        super(TestMagnumConductor, self).setUp()
+        self.mock_preload = self.useFixture(fixtures.MockPatch(
+            'magnum.common.service.preload')).mock
+
     @mock.patch('oslo_service.service.launch')
     @mock.patch.object(conductor, 'rpc_service')
     @mock.patch('magnum.common.service.prepare_service')
@@ -37,6 +43,7 @@ class TestMagnumConductor(base.TestCase):
         workers = processutils.get_worker_count()
         mock_launch.assert_called_once_with(base.CONF, server,
                                             workers=workers)
+        self.mock_preload.assert_called_once_with()
         launcher.wait.assert_called_once_with()
 
     @mock.patch('oslo_service.service.launch')
@@ -55,4 +62,5 @@ class TestMagnumConductor(base.TestCase):
             mock.ANY, mock.ANY, binary='magnum-conductor')
         mock_launch.assert_called_once_with(base.CONF, server,
                                             workers=fake_workers)
+        self.mock_preload.assert_called_once_with()
         launcher.wait.assert_called_once_with()
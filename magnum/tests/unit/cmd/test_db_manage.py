@@ -13,9 +13,14 @@
 #    limitations under the License.
 
 import io
+import os
 from unittest import mock
 
+import fixtures
+from oslo_serialization import jsonutils
+
 from magnum.cmd import db_manage
+from magnum.db.sqlalchemy import models
 from magnum.tests import base
 
 
@@ -60,3 +65,71 @@ class TestMagnumDbManage(base.TestCase):
         mock_revision.assert_called_once_with(
             message='foo bar',
             autogenerate=base.CONF.command.autogenerate)
+
+    @mock.patch('time.sleep')
+    @mock.patch('magnum.db.api.get_instance')
+    @mock.patch('sys.argv', ['magnum-db-manage', 'purge', '--batch-size',
+                             '2', '--max-rate', '1'])
+    def test_db_manage_purge(self, mock_get_instance, mock_sleep):
+        def rows(table, count):
+            return [models.MagnumService(id=i) if table == 'magnum_service'
+                    else models.X509KeyPair(id=i) for i in range(count)]
+
+        dbapi = mock_get_instance.return_value
+        dbapi.purge_x509keypairs.side_effect = [rows('x509keypair', 2),
+                                                rows('x509keypair', 1)]
+        dbapi.purge_magnum_services.return_value = []
+        with mock.patch('sys.stdout', new=io.StringIO()) as fakeOutput:
+            db_manage.main()
+            self.assertEqual('Purged 3 rows from x509keypair\n',
+                             fakeOutput.getvalue())
+        self.assertEqual(2, dbapi.purge_x509keypairs.call_count)
+        older_than, limit = dbapi.purge_x509keypairs.call_args[0]
+        self.assertEqual(2, limit)
+        dbapi.purge_magnum_services.assert_called_once_with(older_than, 2,
+                                                            archive=None)
+        dbapi.purge_failed_clusters.assert_not_called()
+        # one pause between the two batches of key pairs
+        self.assertEqual(1, mock_sleep.call_count)
+
+    @mock.patch('os.fsync')
+    @mock.patch('magnum.db.api.get_instance')
+    def test_db_manage_purge_archive(self, mock_get_instance, mock_fsync):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'archive.json')
+        rows = [models.Cluster(id=1, uuid='cluster-uuid'),
+                models.NodeGroup(id=2, uuid='nodegroup-uuid')]
+
+        def purge_failed_clusters(older_than, limit, archive=None):
+            archive(rows)
+            # the rows are on disk before they are deleted
+            mock_fsync.assert_called_once_with(mock.ANY)
+            with open(path) as f:
+                self.assertEqual(2, len(f.readlines()))
+            return rows
+
+        dbapi = mock_get_instance.return_value
+        dbapi.purge_failed_clusters.side_effect = purge_failed_clusters
+        dbapi.purge_x509keypairs.return_value = []
+        dbapi.purge_magnum_services.return_value = []
+        with mock.patch('sys.argv', ['magnum-db-manage', 'purge',
+                                     '--failed-clusters',
+                                     '--archive', path]):
+            with mock.patch('sys.stdout', new=io.StringIO()):
+                db_manage.main()
+
+        dbapi.purge_failed_clusters.assert_called_once_with(
+            mock.ANY, 1000, archive=mock.ANY)
+        with open(path) as f:
+            lines = [jsonutils.loads(line) for line in f]
+        self.assertEqual(['cluster', 'nodegroup'],
+                         [line['table'] for line in lines])
+        self.assertEqual('nodegroup-uuid', lines[1]['row']['uuid'])
+        self.assertEqual(0o600, os.stat(path).st_mode & 0o777)
+
+    @mock.patch('magnum.db.api.get_instance')
+    @mock.patch('sys.argv', ['magnum-db-manage', 'purge', '--batch-size',
+                             '0'])
+    def test_db_manage_purge_invalid_batch_size(self, mock_get_instance):
+        self.assertRaises(SystemExit, db_manage.main)
+        mock_get_instance.assert_not_called()
@@ -0,0 +1,95 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+from oslo_utils import uuidutils
+
+from magnum.common import hash_ring
+from magnum import objects
+from magnum.tests import base
+
+
+class HashRingTestCase(base.TestCase):
+
+    def setUp(self):
+        super(HashRingTestCase, self).setUp()
+        self.keys = [uuidutils.generate_uuid() for _ in range(1000)]
+
+    def test_empty_ring(self):
+        ring = hash_ring.HashRing([])
+        self.assertIsNone(ring.get_host('foo'))
+
+    def test_single_host_owns_everything(self):
+        ring = hash_ring.HashRing(['host1'])
+        self.assertEqual({'host1'}, {ring.get_host(k) for k in self.keys})
+
+    def test_distribution(self):
+        hosts = ['host1', 'host2', 'host3']
+        ring = hash_ring.HashRing(hosts)
+        counts = dict.fromkeys(hosts, 0)
+        for key in self.keys:
+            counts[ring.get_host(key)] += 1
+        for host in hosts:
+            # a perfect split is ~333 keys per host
+            self.assertGreater(counts[host], 200)
+
+    def test_removing_host_only_moves_its_keys(self):
+        ring = hash_ring.HashRing(['host1', 'host2', 'host3'])
+        smaller = hash_ring.HashRing(['host1', 'host2'])
+        for key in self.keys:
+            before = ring.get_host(key)
+            if before != 'host3':
+                self.assertEqual(before, smaller.get_host(key))
+
+
+class HashRingManagerTestCase(base.TestCase):
+
+    def _service(self, host, binary='magnum-conductor', up=True):
+        srv = mock.MagicMock(spec=objects.MagnumService)
+        srv.host = host
+        srv.binary = binary
+        srv.up = up
+        return srv
+
+    @mock.patch('magnum.api.servicegroup.ServiceGroup.service_is_up',
+                new=lambda self, srv: srv.up)
+    @mock.patch.object(objects.MagnumService, 'list')
+    def test_get_ring_live_conductors(self, mock_list):
+        mock_list.return_value = [
+            self._service('host1'),
+            self._service('host2', up=False),
+            self._service('host3', binary='magnum-api'),
+            self._service('host4'),
+        ]
+        manager = hash_ring.HashRingManager('host1')
+
+        ring = manager.get_ring(mock.sentinel.ctx)
+
+        self.assertEqual({'host1', 'host4'}, ring.hosts)
+
+    @mock.patch.object(objects.MagnumService, 'list', return_value=[])
+    def test_get_ring_includes_local_host(self, mock_list):
+        manager = hash_ring.HashRingManager('host1')
+        self.assertTrue(manager.is_local(mock.sentinel.ctx, 'any-key'))
+
+    @mock.patch.object(objects.MagnumService, 'list', return_value=[])
+    def test_get_ring_cached(self, mock_list):
+        self.config(hash_ring_reset_interval=60, group='conductor')
+        manager = hash_ring.HashRingManager('host1')
+        ring = manager.get_ring(mock.sentinel.ctx)
+        self.assertIs(ring, manager.get_ring(mock.sentinel.ctx))
+        self.assertEqual(1, mock_list.call_count)
+
+        manager.reset()
+        manager.get_ring(mock.sentinel.ctx)
+        self.assertEqual(2, mock_list.call_count)
@@ -52,3 +52,23 @@ class TestMagnumService(base.BaseTestCase):
         mock_setup.assert_called_once_with(base.CONF, 'magnum')
         mock_reg.assert_called_once_with(base.CONF)
         mock_set.assert_called_once_with()
+
+    @mock.patch('gc.freeze')
+    @mock.patch('magnum.common.policy.init')
+    @mock.patch('magnum.drivers.common.driver.Driver.get_drivers')
+    def test_preload(self, mock_drivers, mock_policy, mock_freeze):
+        service.preload()
+
+        mock_drivers.assert_called_once_with()
+        mock_policy.assert_not_called()
+        mock_freeze.assert_called_once_with()
+
+    @mock.patch('gc.freeze')
+    @mock.patch('magnum.common.policy.init')
+    @mock.patch('magnum.drivers.common.driver.Driver.get_drivers')
+    def test_preload_policy(self, mock_drivers, mock_policy, mock_freeze):
+        service.preload(load_policy=True)
+
+        mock_drivers.assert_called_once_with()
+        mock_policy.return_value.load_rules.assert_called_once_with()
+        mock_freeze.assert_called_once_with()
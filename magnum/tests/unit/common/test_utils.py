@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import decimal
 import errno
 import os
 import os.path
@@ -43,6 +44,37 @@ class UtilsTestCase(base.TestCase):
         self.assertRaises(exception.UnsupportedK8sQuantityFormat,
                           utils.get_k8s_quantity, '1E1E')
 
+    def test_parse_k8s_quantity(self):
+        self.assertEqual(decimal.Decimal(1024000),
+                         utils.parse_k8s_quantity('1000Ki'))
+        self.assertEqual(decimal.Decimal('0.001'),
+                         utils.parse_k8s_quantity('1E-3'))
+        self.assertEqual(decimal.Decimal('0.5'),
+                         utils.parse_k8s_quantity('0.0005k'))
+        self.assertEqual(decimal.Decimal('0.5'),
+                         utils.parse_k8s_quantity('500m'))
+        self.assertEqual(decimal.Decimal('0.00025'),
+                         utils.parse_k8s_quantity('250u'))
+        self.assertEqual(decimal.Decimal('0.1'),
+                         utils.parse_k8s_quantity('100000000n'))
+        self.assertEqual(decimal.Decimal(1300000),
+                         utils.parse_k8s_quantity('1.3E+6'))
+        self.assertEqual(decimal.Decimal(2) * 10 ** 15,
+                         utils.parse_k8s_quantity('2P'))
+        self.assertEqual(decimal.Decimal(10) ** 18,
+                         utils.parse_k8s_quantity('1E'))
+        self.assertEqual(decimal.Decimal(-2),
+                         utils.parse_k8s_quantity('-2'))
+        self.assertEqual(decimal.Decimal(3) * 2 ** 30,
+                         utils.parse_k8s_quantity('3Gi'))
+        # exact, where the float based get_k8s_quantity is not
+        self.assertEqual(decimal.Decimal('0.3'),
+                         utils.parse_k8s_quantity('100m') +
+                         utils.parse_k8s_quantity('200m'))
+        for quantity in ('1E1E', '', 'Mi', '1Kb', '1.2.3', '1e'):
+            self.assertRaises(exception.UnsupportedK8sQuantityFormat,
+                              utils.parse_k8s_quantity, quantity)
+
     def test_get_openstasck_ca(self):
         # openstack_ca_file is empty
         self.assertEqual('', utils.get_openstack_ca())
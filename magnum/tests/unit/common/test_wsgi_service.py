@@ -0,0 +1,175 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from http import client
+import socket
+import threading
+import time
+
+from magnum.common import wsgi_service
+from magnum.tests import base
+
+
+class TestWSGIService(base.TestCase):
+
+    def setUp(self):
+        super(TestWSGIService, self).setUp()
+        self.threads = set()
+
+        def app(environ, start_response):
+            self.threads.add(threading.get_ident())
+            body = environ['PATH_INFO'].encode()
+            if environ['QUERY_STRING'] == 'stream':
+                # no Content-Length, the end of the response is the end of
+                # the connection
+                start_response('200 OK', [])
+                return [body[:1], body[1:]]
+            start_response('200 OK', [('Content-Length', str(len(body)))])
+            return [body]
+
+        self.server = wsgi_service.WSGIService('test', app, '127.0.0.1', 0,
+                                               threads=2, keepalive_timeout=5)
+        self.server.start()
+        self.addCleanup(self.server.wait)
+        self.addCleanup(self.server.stop)
+
+    def _get(self, conn, path, method='GET', body=None):
+        conn.request(method, path, body=body)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+
+    def test_keep_alive(self):
+        conn = client.HTTPConnection('127.0.0.1', self.server.port)
+        self.addCleanup(conn.close)
+        self.assertEqual((200, b'/one'), self._get(conn, '/one'))
+        sock = conn.sock
+        self.assertEqual((200, b'/two'), self._get(conn, '/two'))
+        # the second request went through the same connection
+        self.assertIs(sock, conn.sock)
+        self.assertEqual(1, len(self.threads))
+
+    def test_keep_alive_unread_body(self):
+        conn = client.HTTPConnection('127.0.0.1', self.server.port)
+        self.addCleanup(conn.close)
+        # the application does not read the bodies
+        self.assertEqual((200, b'/one'),
+                         self._get(conn, '/one', 'POST', b'x' * 100000))
+        self.assertEqual((200, b'/two'),
+                         self._get(conn, '/two', 'POST', b'{}'))
+        self.assertEqual(1, len(self.threads))
+
+    def test_close_without_content_length(self):
+        conn = client.HTTPConnection('127.0.0.1', self.server.port)
+        self.addCleanup(conn.close)
+        conn.request('GET', '/streamed?stream')
+        resp = conn.getresponse()
+        self.assertEqual(b'/streamed', resp.read())
+        self.assertTrue(resp.will_close)
+
+    def test_concurrent_connections(self):
+        conns = [client.HTTPConnection('127.0.0.1', self.server.port)
+                 for _ in range(2)]
+        for conn in conns:
+            self.addCleanup(conn.close)
+            self.assertEqual((200, b'/'), self._get(conn, '/'))
+        # each open connection is served by its own thread of the pool
+        self.assertEqual(2, len(self.threads))
+
+    def test_client_socket_timeout(self):
+        self.server.stop()
+        self.server.wait()
+        server = wsgi_service.WSGIService(
+            'test', self.server.app, '127.0.0.1', 0, threads=1,
+            client_socket_timeout=1)
+        server.start()
+        self.addCleanup(server.wait)
+        self.addCleanup(server.stop)
+
+        idle = client.HTTPConnection('127.0.0.1', server.port)
+        self.addCleanup(idle.close)
+        self.assertEqual((200, b'/'), self._get(idle, '/'))
+        # the idle connection is closed, freeing the only thread
+        conn = client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+        self.addCleanup(conn.close)
+        self.assertEqual((200, b'/other'), self._get(conn, '/other'))
+
+    def test_restart(self):
+        conn = client.HTTPConnection('127.0.0.1', self.server.port)
+        self.assertEqual((200, b'/one'), self._get(conn, '/one'))
+        conn.close()
+
+        # what the launcher does on SIGHUP
+        self.server.stop()
+        self.server.wait()
+        self.server.reset()
+        self.server.start()
+
+        conn = client.HTTPConnection('127.0.0.1', self.server.port,
+                                     timeout=10)
+        self.addCleanup(conn.close)
+        self.assertEqual((200, b'/two'), self._get(conn, '/two'))
+
+    def test_keepalive_timeout(self):
+        self.server.stop()
+        self.server.wait()
+        server = wsgi_service.WSGIService(
+            'test', self.server.app, '127.0.0.1', 0, threads=1,
+            keepalive_timeout=1)
+        server.start()
+        self.addCleanup(server.wait)
+        self.addCleanup(server.stop)
+
+        idle = client.HTTPConnection('127.0.0.1', server.port)
+        self.addCleanup(idle.close)
+        self.assertEqual((200, b'/'), self._get(idle, '/'))
+        # the idle keep-alive connection is closed, freeing the only thread
+        conn = client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+        self.addCleanup(conn.close)
+        self.assertEqual((200, b'/other'), self._get(conn, '/other'))
+
+    def test_no_keepalive(self):
+        self.server.keepalive_timeout = 0
+        self.server.stop()
+        self.server.wait()
+        self.server.reset()
+        self.server.start()
+
+        conn = client.HTTPConnection('127.0.0.1', self.server.port)
+        self.addCleanup(conn.close)
+        self.assertEqual((200, b'/'), self._get(conn, '/'))
+        # closed by the server after the response
+        conn.sock.settimeout(5)
+        self.assertEqual(b'', conn.sock.recv(1))
+
+    def test_accept_only_with_free_thread(self):
+        self.server.stop()
+        self.server.wait()
+        server = wsgi_service.WSGIService(
+            'test', self.server.app, '127.0.0.1', 0, threads=1,
+            keepalive_timeout=60)
+        server.start()
+        self.addCleanup(server.wait)
+        self.addCleanup(server.stop)
+
+        busy = client.HTTPConnection('127.0.0.1', server.port)
+        self.addCleanup(busy.close)
+        self.assertEqual((200, b'/'), self._get(busy, '/'))
+
+        # the only thread holds the keep-alive connection, the next one is
+        # left in the listen backlog, for another worker
+        waiting = socket.create_connection(('127.0.0.1', server.port))
+        self.addCleanup(waiting.close)
+        time.sleep(0.2)
+        with server._socket.dup() as sock:
+            sock.settimeout(5)
+            accepted, _ = sock.accept()
+            accepted.close()
@@ -14,13 +14,16 @@
 
 from unittest import mock
 
+from magnum.common.cert_manager import x509keypair_cert_manager
 from magnum.common import exception
+from magnum.common.x509 import operations as x509
 from magnum.conductor.handlers.common import cert_manager
 from magnum.tests import base
 from oslo_config import cfg
 
 import magnum.conf
 import os
+import ssl
 import stat
 import tempfile
 
@@ -438,14 +441,16 @@ class CertManagerTestCase(base.BaseTestCase):
         mock_cluster.uuid = "mock_cluster_uuid"
         mock_cluster.ca_cert_ref = expected_ca_cert_ref
         mock_cluster.magnum_cert_ref = expected_cert_ref
+        mock_cluster.etcd_ca_cert_ref = 'etcd_ca_cert_ref'
+        mock_cluster.front_proxy_ca_cert_ref = 'front_proxy_ca_cert_ref'
 
         cert_manager.delete_certificates_from_cluster(mock_cluster)
-        mock_delete_cert.assert_any_call(expected_ca_cert_ref,
-                                         resource_ref=mock_cluster.uuid,
-                                         context=None)
-        mock_delete_cert.assert_any_call(expected_cert_ref,
-                                         resource_ref=mock_cluster.uuid,
-                                         context=None)
+        for cert_ref in (expected_ca_cert_ref, expected_cert_ref,
+                         'etcd_ca_cert_ref', 'front_proxy_ca_cert_ref'):
+            mock_delete_cert.assert_any_call(cert_ref,
+                                             resource_ref=mock_cluster.uuid,
+                                             context=None)
+        self.assertEqual(4, mock_delete_cert.call_count)
 
     def test_delete_certificates_if_raise_error(self):
         mock_delete_cert = self.CertManager.delete_cert
@@ -470,10 +475,42 @@ class CertManagerTestCase(base.BaseTestCase):
         mock_cluster = mock.MagicMock()
         mock_cluster.ca_cert_ref = None
         mock_cluster.magnum_cert_ref = None
+        mock_cluster.etcd_ca_cert_ref = None
+        mock_cluster.front_proxy_ca_cert_ref = None
 
         cert_manager.delete_certificates_from_cluster(mock_cluster)
         self.assertFalse(mock_delete_cert.called)
 
+    def test_delete_certificates_from_clusters(self):
+        mock_delete_cert = self.CertManager.delete_cert
+        mock_cluster = mock.MagicMock()
+        mock_cluster.uuid = "mock_cluster_uuid"
+        mock_cluster.ca_cert_ref = 'ca_cert_ref'
+        mock_cluster.magnum_cert_ref = 'cert_ref'
+        mock_cluster.etcd_ca_cert_ref = None
+        mock_cluster.front_proxy_ca_cert_ref = None
+
+        self.assertEqual([], cert_manager.delete_certificates_from_clusters(
+            [mock_cluster]))
+        self.assertEqual(2, mock_delete_cert.call_count)
+
+    def test_delete_certificates_from_clusters_in_db(self):
+        self.cert_manager_backend.CertManager = (
+            x509keypair_cert_manager.CertManager)
+        mock_cluster = mock.MagicMock()
+        mock_cluster.ca_cert_ref = 'ca_cert_ref'
+        mock_cluster.magnum_cert_ref = None
+        mock_cluster.etcd_ca_cert_ref = 'etcd_ca_cert_ref'
+        mock_cluster.front_proxy_ca_cert_ref = None
+
+        with mock.patch.object(x509keypair_cert_manager.CertManager,
+                               'delete_cert') as mock_delete_cert:
+            self.assertEqual(
+                ['ca_cert_ref', 'etcd_ca_cert_ref'],
+                cert_manager.delete_certificates_from_clusters(
+                    [mock_cluster]))
+        self.assertFalse(mock_delete_cert.called)
+
     def test_delete_client_files(self):
         mock_cluster = mock.MagicMock()
         mock_cluster.uuid = "mock_cluster_uuid"
@@ -524,3 +561,89 @@ class CertManagerTestCase(base.BaseTestCase):
 
         self.assertEqual(True, os.path.isdir(mock_dir))
         self.assertEqual(False, os.path.isdir(cert_dir))
+
+
+class ClientSSLContextCacheTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(ClientSSLContextCacheTestCase, self).setUp()
+        self.addCleanup(cert_manager.clear_client_ssl_context_cache)
+
+        ca = x509.generate_ca_certificate('cluster')
+        client = x509.generate_client_certificate(
+            'cluster', 'admin', 'system:masters', ca['private_key'])
+        self.ca_cert = mock.MagicMock()
+        self.ca_cert.get_certificate.return_value = ca['certificate']
+        self.client_cert = mock.MagicMock()
+        self.client_cert.get_certificate.return_value = client['certificate']
+        self.client_cert.get_decrypted_private_key.return_value = (
+            client['private_key'])
+
+        p = mock.patch.object(cert_manager, 'get_cluster_ca_certificate',
+                              return_value=self.ca_cert)
+        self.mock_get_ca = p.start()
+        self.addCleanup(p.stop)
+        p = mock.patch.object(cert_manager, 'get_cluster_magnum_cert',
+                              return_value=self.client_cert)
+        self.mock_get_client = p.start()
+        self.addCleanup(p.stop)
+
+        self.cluster = mock.MagicMock(uuid='cluster-uuid',
+                                      ca_cert_ref='ca-ref',
+                                      magnum_cert_ref='client-ref')
+
+    def test_get_client_ssl_context_cached(self):
+        ctx1 = cert_manager.get_client_ssl_context(self.cluster)
+        ctx2 = cert_manager.get_client_ssl_context(self.cluster)
+
+        self.assertIsInstance(ctx1, ssl.SSLContext)
+        self.assertIs(ctx1, ctx2)
+        self.assertEqual(1, len(ctx1.get_ca_certs()))
+        self.mock_get_ca.assert_called_once_with(self.cluster, None)
+        self.mock_get_client.assert_called_once_with(self.cluster, None)
+        self.assertEqual({'hits': 1, 'misses': 1, 'size': 1},
+                         cert_manager.get_client_ssl_context_stats())
+
+    @mock.patch('os.memfd_create', create=True)
+    def test_get_client_ssl_context_without_memfd(self, mock_memfd):
+        # pretend the platform has no anonymous in-memory files
+        del os.memfd_create
+        ctx = cert_manager.get_client_ssl_context(self.cluster)
+        self.assertIsInstance(ctx, ssl.SSLContext)
+
+    def test_get_client_ssl_context_ref_changed(self):
+        ctx1 = cert_manager.get_client_ssl_context(self.cluster)
+        self.cluster.ca_cert_ref = 'new-ca-ref'
+        ctx2 = cert_manager.get_client_ssl_context(self.cluster)
+
+        self.assertIsNot(ctx1, ctx2)
+        self.assertEqual(2, self.mock_get_ca.call_count)
+
+    @mock.patch('oslo_utils.timeutils.utcnow_ts')
+    def test_get_client_ssl_context_expired(self, mock_now):
+        CONF.set_override('client_cert_cache_ttl', 10, group='cluster')
+        mock_now.return_value = 100
+        ctx1 = cert_manager.get_client_ssl_context(self.cluster)
+        mock_now.return_value = 111
+        ctx2 = cert_manager.get_client_ssl_context(self.cluster)
+
+        self.assertIsNot(ctx1, ctx2)
+        self.assertEqual(2, self.mock_get_ca.call_count)
+
+    def test_invalidate_client_ssl_context(self):
+        ctx1 = cert_manager.get_client_ssl_context(self.cluster)
+        cert_manager.invalidate_client_ssl_context(self.cluster.uuid)
+        ctx2 = cert_manager.get_client_ssl_context(self.cluster)
+
+        self.assertIsNot(ctx1, ctx2)
+
+    def test_get_client_ssl_context_lru(self):
+        CONF.set_override('client_cert_cache_size', 1, group='cluster')
+        cert_manager.get_client_ssl_context(self.cluster)
+        other = mock.MagicMock(uuid='other-uuid', ca_cert_ref='ca-ref',
+                               magnum_cert_ref='client-ref')
+        cert_manager.get_client_ssl_context(other)
+
+        self.assertEqual(1, cert_manager.get_client_ssl_context_stats()[
+            'size'])
+        cert_manager.get_client_ssl_context(self.cluster)
+        self.assertEqual(3, self.mock_get_ca.call_count)
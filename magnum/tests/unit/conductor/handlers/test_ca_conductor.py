@@ -15,6 +15,7 @@
 from unittest import mock
 
 from magnum.conductor.handlers import ca_conductor
+from magnum.objects import fields
 from magnum.tests import base
 
 
@@ -57,3 +58,29 @@ class TestSignConductor(base.TestCase):
         self.assertEqual(mock_cluster.user_id, actual_cert.user_id)
         self.assertEqual(mock_cluster.project_id, actual_cert.project_id)
         self.assertEqual('fake-pem', actual_cert.pem)
+
+    @mock.patch.object(ca_conductor, 'driver')
+    @mock.patch.object(ca_conductor, 'k8s_node_watch')
+    @mock.patch.object(ca_conductor, 'k8s_api')
+    @mock.patch.object(ca_conductor, 'cert_manager')
+    def test_rotate_ca_certificate(self, mock_cert_manager, mock_k8s_api,
+                                   mock_node_watch, mock_driver):
+        mock_cluster = mock.MagicMock()
+        mock_cluster.uuid = 'cluster-uuid'
+        mock_cluster.status = fields.ClusterStatus.CREATE_COMPLETE
+        cluster_driver = mock_driver.Driver.get_driver_for_cluster.return_value
+
+        self.ca_handler.rotate_ca_certificate(self.context, mock_cluster)
+
+        generate = mock_cert_manager.generate_certificates_to_cluster
+        generate.assert_called_once_with(mock_cluster, context=self.context)
+        # nothing keeps talking to the cluster with the old certificates
+        invalidate = mock_cert_manager.invalidate_client_ssl_context
+        invalidate.assert_called_once_with('cluster-uuid')
+        mock_k8s_api.evict_session.assert_called_once_with('cluster-uuid')
+        mock_node_watch.stop_watcher.assert_called_once_with('cluster-uuid')
+        cluster_driver.rotate_ca_certificate.assert_called_once_with(
+            self.context, mock_cluster)
+        self.assertEqual(fields.ClusterStatus.UPDATE_IN_PROGRESS,
+                         mock_cluster.status)
+        mock_cluster.save.assert_called_once_with()
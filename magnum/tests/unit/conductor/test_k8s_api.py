@@ -14,6 +14,11 @@
 
 from unittest import mock
 
+import fixtures
+from requests_mock.contrib import fixture
+
+from magnum.conductor.handlers.common import cert_manager
+from magnum.conductor import k8s_api
 from magnum.tests import base
 
 
@@ -51,3 +56,191 @@ class TestK8sAPI(base.TestCase):
             TestK8sAPI.content_dict[cert_ref]['decrypted_private_key'])
 
         return cert_obj
+
+
+class TestK8sAPISessionCache(base.TestCase):
+
+    def setUp(self):
+        super(TestK8sAPISessionCache, self).setUp()
+        self.requests_mock = self.useFixture(fixture.Fixture())
+        p = mock.patch.object(cert_manager, 'get_client_ssl_context')
+        self.mock_get_ssl_context = p.start()
+        self.addCleanup(p.stop)
+
+    def _cluster(self, uuid='uuid1', ca_cert_ref='ca-ref'):
+        cluster = mock.MagicMock(uuid=uuid, ca_cert_ref=ca_cert_ref,
+                                 magnum_cert_ref='client-ref')
+        cluster.api_address = 'https://%s:6443' % uuid
+        return cluster
+
+    def test_session_reused(self):
+        cluster = self._cluster()
+        self.requests_mock.register_uri(
+            'GET', f"{cluster.api_address}/healthz", text='ok')
+
+        api1 = k8s_api.KubernetesAPI(self.context, cluster)
+        api2 = k8s_api.KubernetesAPI(self.context, cluster)
+
+        self.assertIs(api1.session, api2.session)
+        self.assertEqual('ok', api2.get_healthz())
+        self.mock_get_ssl_context.assert_called_once_with(
+            cluster, self.context)
+
+    def test_session_ignores_environment(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'REQUESTS_CA_BUNDLE', '/etc/ssl/other-ca.pem'))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'HTTPS_PROXY', 'http://proxy.example.com:3128'))
+        cluster = self._cluster()
+        self.requests_mock.register_uri(
+            'GET', f"{cluster.api_address}/healthz", text='ok')
+
+        api = k8s_api.KubernetesAPI(self.context, cluster)
+
+        self.assertFalse(api.session.trust_env)
+        self.assertEqual('ok', api.get_healthz())
+        request = self.requests_mock.last_request
+        self.assertIs(True, request.verify)
+        self.assertEqual({}, request.proxies)
+
+    def test_session_renewed_on_ca_rotation(self):
+        api1 = k8s_api.KubernetesAPI(self.context, self._cluster())
+        api2 = k8s_api.KubernetesAPI(self.context,
+                                     self._cluster(ca_cert_ref='new-ref'))
+
+        self.assertIsNot(api1.session, api2.session)
+        self.assertEqual(1, len(k8s_api._SESSIONS))
+
+    def test_evict_session(self):
+        cluster = self._cluster()
+        api1 = k8s_api.KubernetesAPI(self.context, cluster)
+        k8s_api.evict_session(cluster.uuid)
+        api2 = k8s_api.KubernetesAPI(self.context, cluster)
+
+        self.assertIsNot(api1.session, api2.session)
+        self.assertEqual(2, self.mock_get_ssl_context.call_count)
+
+    def test_cache_size_bounded(self):
+        self.config(api_session_cache_size=2, group='kubernetes')
+        for uuid in ('uuid1', 'uuid2', 'uuid1', 'uuid3'):
+            k8s_api.KubernetesAPI(self.context, self._cluster(uuid=uuid))
+
+        self.assertEqual(['uuid1', 'uuid3'],
+                         [key[0] for key in k8s_api._SESSIONS])
+
+    def test_watch_node(self):
+        cluster = self._cluster()
+        self.requests_mock.register_uri(
+            'GET', f"{cluster.api_address}/api/v1/nodes",
+            text='{"type": "ADDED", "object": {}}\n\n'
+                 '{"type": "DELETED", "object": {}}\n')
+
+        api = k8s_api.KubernetesAPI(self.context, cluster)
+        events = list(api.watch_node('42', 60))
+
+        self.assertEqual(['ADDED', 'DELETED'], [e['type'] for e in events])
+        qs = self.requests_mock.last_request.qs
+        self.assertEqual(['true'], qs['watch'])
+        self.assertEqual(['42'], qs['resourceversion'])
+        self.assertEqual(['60'], qs['timeoutseconds'])
+
+    def test_iter_node_paginated(self):
+        cluster = self._cluster()
+        node = {'metadata': {'name': 'node-0', 'uid': 'x'},
+                'spec': {'podCIDR': '10.0.0.0/24'},
+                'status': {'capacity': {'cpu': '1'}, 'images': ['a', 'b']}}
+        self.requests_mock.register_uri(
+            'GET', f"{cluster.api_address}/api/v1/nodes",
+            [{'json': {'metadata': {'continue': 'abc'},
+                       'items': [node, node]}},
+             {'json': {'items': [node],
+                       'metadata': {'resourceVersion': '7'}}}])
+
+        api = k8s_api.KubernetesAPI(self.context, cluster)
+        metadata = {}
+        nodes = list(api.iter_node(limit=2, metadata=metadata))
+
+        self.assertEqual(
+            3 * [{'metadata': {'name': 'node-0'},
+                  'status': {'capacity': {'cpu': '1'}}}], nodes)
+        self.assertEqual('7', metadata['resourceVersion'])
+        first, second = self.requests_mock.request_history
+        self.assertEqual({'limit': ['2']}, first.qs)
+        self.assertEqual({'limit': ['2'], 'continue': ['abc']}, second.qs)
+
+    def test_iter_namespaced_pod(self):
+        self.config(api_list_page_size=10, group='kubernetes')
+        cluster = self._cluster()
+        pod = {'metadata': {'name': 'pod-0', 'namespace': 'default',
+                            'labels': {'a': 'b'}},
+               'spec': {'nodeName': 'node-0', 'volumes': [],
+                        'containers': [{'name': 'c', 'image': 'nginx',
+                                        'resources': {}}]}}
+        self.requests_mock.register_uri(
+            'GET', f"{cluster.api_address}/api/v1/namespaces/default/pods",
+            json={'items': [pod]})
+
+        api = k8s_api.KubernetesAPI(self.context, cluster)
+        pods = list(api.iter_namespaced_pod('default'))
+
+        self.assertEqual(
+            [{'metadata': {'name': 'pod-0', 'namespace': 'default'},
+              'spec': {'nodeName': 'node-0',
+                       'containers': [{'name': 'c', 'resources': {}}]}}],
+            pods)
+        self.assertEqual({'limit': ['10']},
+                         self.requests_mock.last_request.qs)
+
+    def test_iter_pod(self):
+        cluster = self._cluster()
+        pod = {'metadata': {'name': 'pod-0', 'namespace': 'kube-system'},
+               'spec': {'nodeName': 'node-0', 'containers': []},
+               'status': {'phase': 'Running', 'podIP': '10.0.0.1'}}
+        self.requests_mock.register_uri(
+            'GET', f"{cluster.api_address}/api/v1/pods",
+            json={'items': [pod]})
+
+        api = k8s_api.KubernetesAPI(self.context, cluster)
+        pods = list(api.iter_pod(resource_version='0'))
+
+        self.assertEqual(
+            [{'metadata': {'name': 'pod-0', 'namespace': 'kube-system'},
+              'spec': {'nodeName': 'node-0', 'containers': []},
+              'status': {'phase': 'Running'}}],
+            pods)
+        self.assertEqual('/api/v1/pods', self.requests_mock.last_request.path)
+        # the watch cache ignores the page size
+        self.assertEqual({'resourceversion': ['0']},
+                         self.requests_mock.last_request.qs)
+
+
+class TestListDecoder(base.TestCase):
+
+    def _decode(self, body, chunk_size=1):
+        data = body.encode('utf-8')
+        chunks = [data[i:i + chunk_size]
+                  for i in range(0, len(data), chunk_size)]
+        decoder = k8s_api._ListDecoder(chunks)
+        return list(decoder.items()), decoder.members
+
+    def test_decode_items_and_members(self):
+        body = ('{"kind": "NodeList", "metadata": {"continue": "x"},\n'
+                ' "items": [{"name": "n\u00e9ud-0", "n": 12345},'
+                ' {"name": "nœud-1", "n": [1.5, true, null]}], "n": 1024}')
+        items, members = self._decode(body)
+        self.assertEqual([{'name': 'n\u00e9ud-0', 'n': 12345},
+                          {'name': 'n\u0153ud-1', 'n': [1.5, True, None]}],
+                         items)
+        self.assertEqual({'kind': 'NodeList',
+                          'metadata': {'continue': 'x'}, 'n': 1024},
+                         members)
+
+    def test_decode_empty(self):
+        self.assertEqual(([], {'items': None}),
+                         self._decode('{"items": null}'))
+        self.assertEqual(([], {}), self._decode('{"items": []}', 4))
+        self.assertEqual(([], {}), self._decode(' { } '))
+
+    def test_decode_truncated(self):
+        self.assertRaises(ValueError, self._decode,
+                          '{"items": [{"name": "a"}, {"na', 3)
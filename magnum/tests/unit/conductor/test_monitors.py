@@ -13,13 +13,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import tempfile
 from unittest import mock
 
 from requests_mock.contrib import fixture
 
 from magnum.common import exception
+from magnum.conductor.handlers.common import cert_manager
 from magnum.drivers.common import k8s_monitor
+from magnum.drivers.common import k8s_node_watch
 from magnum import objects
 from magnum.objects import fields as m_fields
 from magnum.tests import base
@@ -59,14 +60,8 @@ class MonitorsTestCase(base.TestCase):
         ]
         self.k8s_monitor = k8s_monitor.K8sMonitor(self.context, self.cluster)
 
-    @mock.patch('magnum.conductor.k8s_api.create_client_files')
-    def test_k8s_monitor_pull_data_success(self, mock_create_client_files):
-        mock_create_client_files.return_value = (
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile()
-        )
-
+    @mock.patch.object(cert_manager, 'get_client_ssl_context')
+    def test_k8s_monitor_pull_data_success(self, mock_get_ssl_context):
         self.requests_mock.register_uri(
             'GET',
             f"{self.cluster.api_address}/api/v1/nodes",
@@ -88,17 +83,39 @@ class MonitorsTestCase(base.TestCase):
                 'items': [
                     {
                         'spec': {
+                            'nodeName': 'node-0',
                             'containers': [
                                 {
                                     'resources': {
                                         'limits': {
                                             'memory': '100Mi',
                                             'cpu': '500m'
+                                        },
+                                        'requests': {
+                                            'memory': '64Mi',
+                                            'cpu': '250m'
                                         }
                                     }
                                 }
                             ]
-                        }
+                        },
+                        'status': {'phase': 'Running'}
+                    },
+                    {
+                        'spec': {
+                            'nodeName': 'node-0',
+                            'containers': [
+                                {
+                                    'resources': {
+                                        'limits': {
+                                            'memory': '1Gi',
+                                            'cpu': '1'
+                                        }
+                                    }
+                                }
+                            ]
+                        },
+                        'status': {'phase': 'Succeeded'}
                     }
                 ]
             }
@@ -108,7 +125,54 @@ class MonitorsTestCase(base.TestCase):
         self.assertEqual(self.k8s_monitor.data['nodes'],
                          [{'Memory': 2048000.0, 'Cpu': 1}])
         self.assertEqual(self.k8s_monitor.data['pods'],
-                         [{'Memory': 104857600.0, 'Cpu': 0.5}])
+                         [{'Node': 'node-0',
+                           'Memory': 104857600.0, 'Cpu': 0.5,
+                           'MemoryRequests': 67108864.0,
+                           'CpuRequests': 0.25}])
+        for request in self.requests_mock.request_history:
+            self.assertEqual({'limit': ['500']}, request.qs)
+
+    @mock.patch.object(cert_manager, 'get_client_ssl_context')
+    def test_k8s_monitor_pull_data_all_namespaces(self, mock_get_ssl_context):
+        self.config(monitor_all_namespaces=True,
+                    api_list_from_watch_cache=True, group='kubernetes')
+        self.requests_mock.register_uri(
+            'GET',
+            f"{self.cluster.api_address}/api/v1/nodes",
+            json={'items': []},
+        )
+        self.requests_mock.register_uri(
+            'GET',
+            f"{self.cluster.api_address}/api/v1/pods",
+            json={
+                'items': [
+                    {
+                        'metadata': {'namespace': namespace},
+                        'spec': {
+                            'nodeName': node,
+                            'containers': [
+                                {'resources': {'limits': {'cpu': cpu}}},
+                                {'resources': {}}
+                            ]
+                        }
+                    }
+                    for namespace, node, cpu in (
+                        ('default', 'node-0', '500m'),
+                        ('kube-system', 'node-0', '1500m'),
+                        ('kube-system', 'node-1', '2'))
+                ]
+            }
+        )
+
+        self.k8s_monitor.pull_data()
+        self.assertEqual(
+            [{'Node': 'node-0', 'Memory': 0.0, 'Cpu': 2.0,
+              'MemoryRequests': 0.0, 'CpuRequests': 0.0},
+             {'Node': 'node-1', 'Memory': 0.0, 'Cpu': 2.0,
+              'MemoryRequests': 0.0, 'CpuRequests': 0.0}],
+            self.k8s_monitor.data['pods'])
+        for request in self.requests_mock.request_history:
+            self.assertEqual({'resourceversion': ['0']}, request.qs)
 
     def test_k8s_monitor_get_metric_names(self):
         k8s_metric_spec = 'magnum.drivers.common.k8s_monitor.K8sMonitor.'\
@@ -178,14 +242,8 @@ class MonitorsTestCase(base.TestCase):
         cpu_util = self.k8s_monitor.compute_cpu_util()
         self.assertEqual(0, cpu_util)
 
-    @mock.patch('magnum.conductor.k8s_api.create_client_files')
-    def test_k8s_monitor_health_healthy(self, mock_create_client_files):
-        mock_create_client_files.return_value = (
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile()
-        )
-
+    @mock.patch.object(cert_manager, 'get_client_ssl_context')
+    def test_k8s_monitor_health_healthy(self, mock_get_ssl_context):
         self.requests_mock.register_uri(
             'GET',
             f"{self.cluster.api_address}/api/v1/nodes",
@@ -220,14 +278,8 @@ class MonitorsTestCase(base.TestCase):
         self.assertEqual(self.k8s_monitor.data['health_status_reason'],
                          {'api': 'ok', 'k8s-cluster-node-0.Ready': True})
 
-    @mock.patch('magnum.conductor.k8s_api.create_client_files')
-    def test_k8s_monitor_health_unhealthy_api(self, mock_create_client_files):
-        mock_create_client_files.return_value = (
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile()
-        )
-
+    @mock.patch.object(cert_manager, 'get_client_ssl_context')
+    def test_k8s_monitor_health_unhealthy_api(self, mock_get_ssl_context):
         self.requests_mock.register_uri(
             'GET',
             f"{self.cluster.api_address}/api/v1/nodes",
@@ -262,14 +314,8 @@ class MonitorsTestCase(base.TestCase):
         self.assertEqual(self.k8s_monitor.data['health_status_reason'],
                          {'api': 'failed'})
 
-    @mock.patch('magnum.conductor.k8s_api.create_client_files')
-    def test_k8s_monitor_health_unhealthy_node(self, mock_create_client_files):
-        mock_create_client_files.return_value = (
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile()
-        )
-
+    @mock.patch.object(cert_manager, 'get_client_ssl_context')
+    def test_k8s_monitor_health_unhealthy_node(self, mock_get_ssl_context):
         self.requests_mock.register_uri(
             'GET',
             f"{self.cluster.api_address}/api/v1/nodes",
@@ -318,15 +364,9 @@ class MonitorsTestCase(base.TestCase):
                          {'api': 'ok', 'k8s-cluster-node-0.Ready': False,
                           'k8s-cluster-node-1.Ready': True})
 
-    @mock.patch('magnum.conductor.k8s_api.create_client_files')
+    @mock.patch.object(cert_manager, 'get_client_ssl_context')
     def test_k8s_monitor_health_unreachable_cluster(
-            self, mock_create_client_files):
-        mock_create_client_files.return_value = (
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile()
-        )
-
+            self, mock_get_ssl_context):
         self.requests_mock.register_uri(
             'GET',
             f"{self.cluster.api_address}/api/v1/nodes",
@@ -343,15 +383,9 @@ class MonitorsTestCase(base.TestCase):
         self.assertEqual(self.k8s_monitor.data['health_status'],
                          m_fields.ClusterHealthStatus.UNKNOWN)
 
-    @mock.patch('magnum.conductor.k8s_api.create_client_files')
+    @mock.patch.object(cert_manager, 'get_client_ssl_context')
     def test_k8s_monitor_health_unreachable_with_master_lb(
-            self, mock_create_client_files):
-        mock_create_client_files.return_value = (
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile()
-        )
-
+            self, mock_get_ssl_context):
         self.requests_mock.register_uri(
             'GET',
             f"{self.cluster.api_address}/api/v1/nodes",
@@ -371,6 +405,59 @@ class MonitorsTestCase(base.TestCase):
         self.assertEqual(self.k8s_monitor.data['health_status'],
                          m_fields.ClusterHealthStatus.UNKNOWN)
 
+    @mock.patch.object(k8s_node_watch, 'get_watcher')
+    @mock.patch.object(cert_manager, 'get_client_ssl_context')
+    def test_k8s_monitor_health_node_watch(self, mock_get_ssl_context,
+                                           mock_get_watcher):
+        self.config(health_node_watch=True, group='kubernetes')
+        mock_get_watcher.return_value.get_node_ready.return_value = {
+            'k8s-cluster-node-0': True, 'k8s-cluster-node-1': False}
+        self.requests_mock.register_uri(
+            'GET',
+            f"{self.cluster.api_address}/healthz",
+            text="ok",
+        )
+
+        self.k8s_monitor.poll_health_status()
+
+        mock_get_watcher.assert_called_once_with(self.context, self.cluster)
+        self.assertEqual(['/healthz'],
+                         [r.path for r in self.requests_mock.request_history])
+        self.assertEqual(m_fields.ClusterHealthStatus.UNHEALTHY,
+                         self.k8s_monitor.data['health_status'])
+        self.assertEqual({'api': 'ok', 'k8s-cluster-node-0.Ready': True,
+                          'k8s-cluster-node-1.Ready': False},
+                         self.k8s_monitor.data['health_status_reason'])
+
+    @mock.patch.object(k8s_node_watch, 'get_watcher')
+    @mock.patch.object(cert_manager, 'get_client_ssl_context')
+    def test_k8s_monitor_health_node_watch_not_synced(self,
+                                                      mock_get_ssl_context,
+                                                      mock_get_watcher):
+        self.config(health_node_watch=True, group='kubernetes')
+        mock_get_watcher.return_value.get_node_ready.return_value = None
+        self.requests_mock.register_uri(
+            'GET',
+            f"{self.cluster.api_address}/api/v1/nodes",
+            json={'items': [{
+                'metadata': {'name': 'k8s-cluster-node-0'},
+                'status': {'conditions': [{'type': 'Ready',
+                                           'status': 'True'}]},
+            }]},
+        )
+        self.requests_mock.register_uri(
+            'GET',
+            f"{self.cluster.api_address}/healthz",
+            text="ok",
+        )
+
+        self.k8s_monitor.poll_health_status()
+
+        self.assertEqual(m_fields.ClusterHealthStatus.HEALTHY,
+                         self.k8s_monitor.data['health_status'])
+        self.assertEqual({'api': 'ok', 'k8s-cluster-node-0.Ready': True},
+                         self.k8s_monitor.data['health_status_reason'])
+
     def test_is_magnum_auto_healer_running(self):
         cluster = self.k8s_monitor.cluster
         cluster.labels['auto_healing_enabled'] = True
@@ -391,3 +478,95 @@ class MonitorsTestCase(base.TestCase):
         cluster.labels = {}
         self.k8s_monitor._is_magnum_auto_healer_running()
         self.assertFalse(self.k8s_monitor._is_magnum_auto_healer_running())
+
+
+class NodeWatcherTestCase(base.TestCase):
+
+    def setUp(self):
+        super(NodeWatcherTestCase, self).setUp()
+        self.cluster = mock.MagicMock(uuid='cluster-uuid')
+        self.watcher = k8s_node_watch.NodeWatcher(self.context, self.cluster)
+        self.k8s_api = mock.MagicMock()
+
+        def iter_node(metadata):
+            metadata['resourceVersion'] = '10'
+            return iter([self._node('node-0', 'True'),
+                         self._node('node-1', 'False')])
+
+        self.k8s_api.iter_node.side_effect = iter_node
+        self.k8s_api.watch_node.return_value = iter([])
+
+    @staticmethod
+    def _node(name, ready, resource_version=None):
+        node = {
+            'metadata': {'name': name},
+            'status': {'conditions': [{'type': 'Ready', 'status': ready}]},
+        }
+        if resource_version:
+            node['metadata']['resourceVersion'] = resource_version
+        return node
+
+    def test_not_synced(self):
+        self.assertIsNone(self.watcher.get_node_ready())
+
+    def test_watch_once_lists_then_watches(self):
+        self.k8s_api.watch_node.return_value = iter([
+            {'type': 'MODIFIED',
+             'object': self._node('node-1', 'True', '11')},
+            {'type': 'ADDED', 'object': self._node('node-2', 'False', '12')},
+            {'type': 'DELETED',
+             'object': self._node('node-0', 'True', '13')},
+            {'type': 'BOOKMARK',
+             'object': {'metadata': {'resourceVersion': '14'}}},
+        ])
+
+        self.watcher.watch_once(self.k8s_api)
+
+        self.k8s_api.watch_node.assert_called_once_with(
+            '10', k8s_node_watch.WATCH_TIMEOUT)
+        self.assertEqual({'node-1': True, 'node-2': False},
+                         self.watcher.get_node_ready())
+        self.assertEqual('14', self.watcher._resource_version)
+
+        # the next watch resumes where the previous one stopped
+        self.watcher.watch_once(self.k8s_api)
+        self.assertEqual(1, self.k8s_api.iter_node.call_count)
+        self.k8s_api.watch_node.assert_called_with(
+            '14', k8s_node_watch.WATCH_TIMEOUT)
+
+    def test_watch_error_event(self):
+        self.k8s_api.watch_node.return_value = iter([
+            {'type': 'ERROR', 'object': {'code': 410, 'message': 'gone'}},
+        ])
+        self.assertRaises(RuntimeError, self.watcher.watch_once,
+                          self.k8s_api)
+
+    @mock.patch.object(k8s_node_watch.k8s, 'KubernetesAPI')
+    def test_run_reloads_cluster_after_failure(self, mock_k8s_api):
+        def connect(context, cluster):
+            if mock_k8s_api.call_count == 1:
+                raise RuntimeError('certificate verify failed')
+            self.watcher.stop()
+            return self.k8s_api
+
+        mock_k8s_api.side_effect = connect
+
+        with mock.patch.object(self.watcher._stopped, 'wait'):
+            self.watcher._run()
+
+        self.cluster.refresh.assert_called_once_with()
+        self.assertEqual(2, mock_k8s_api.call_count)
+
+    @mock.patch.object(k8s_node_watch.NodeWatcher, 'start')
+    def test_get_and_stop_watcher(self, mock_start):
+        watcher = k8s_node_watch.get_watcher(self.context, self.cluster)
+        self.assertIs(watcher,
+                      k8s_node_watch.get_watcher(self.context, self.cluster))
+        mock_start.assert_called_once_with()
+
+        k8s_node_watch.stop_watcher(self.cluster.uuid)
+        self.assertTrue(watcher.stopped)
+        self.assertIsNot(watcher,
+                         k8s_node_watch.get_watcher(self.context,
+                                                    self.cluster))
+        k8s_node_watch.stop_all_watchers()
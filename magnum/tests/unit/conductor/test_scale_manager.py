@@ -12,11 +12,11 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import tempfile
 from unittest import mock
 
 from requests_mock.contrib import fixture
 
+from magnum.conductor.handlers.common import cert_manager
 from magnum.drivers.common.k8s_scale_manager import K8sScaleManager
 from magnum.tests import base
 
@@ -28,18 +28,12 @@ class TestK8sScaleManager(base.TestCase):
         self.requests_mock = self.useFixture(fixture.Fixture())
 
     @mock.patch('magnum.objects.Cluster.get_by_uuid')
-    @mock.patch('magnum.conductor.k8s_api.create_client_files')
+    @mock.patch.object(cert_manager, 'get_client_ssl_context')
     def test_get_hosts_with_container(
-            self, mock_create_client_files, mock_get):
+            self, mock_get_ssl_context, mock_get):
         mock_cluster = mock.MagicMock()
         mock_cluster.api_address = "https://foobar.com:6443"
 
-        mock_create_client_files.return_value = (
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile(),
-            tempfile.NamedTemporaryFile()
-        )
-
         self.requests_mock.register_uri(
             'GET',
             f"{mock_cluster.api_address}/api/v1/namespaces/default/pods",
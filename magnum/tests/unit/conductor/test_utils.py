@@ -167,3 +167,30 @@ class TestConductorUtils(base.TestCase):
         result = utils._get_request_audit_info(context)
         self._assert_for_user_project_domain_resource(result, context,
                                                       mock_resource)
+
+    @patch('magnum.objects.Quota.release_reservation')
+    def test_release_quota_reservation(self, mock_release):
+        class Handler(object):
+            @utils.release_quota_reservation
+            def cluster_create(self, context, cluster, fail=False):
+                if fail:
+                    raise ValueError()
+                return cluster
+
+        cluster = objects.Cluster(uuid=self.get_fake_id())
+        self.assertEqual(cluster,
+                         Handler().cluster_create('context', cluster=cluster,
+                                                  reservation_id=42))
+        mock_release.assert_called_once_with('context', 42)
+
+        mock_release.reset_mock()
+        mock_release.side_effect = Exception('database is gone')
+        self.assertRaises(ValueError, Handler().cluster_create, 'context',
+                          cluster, fail=True, reservation_id=42)
+        mock_release.assert_called_once_with('context', 42)
+
+        # nothing was reserved for the operation
+        mock_release.reset_mock()
+        self.assertEqual(cluster,
+                         Handler().cluster_create('context', cluster))
+        self.assertFalse(mock_release.called)
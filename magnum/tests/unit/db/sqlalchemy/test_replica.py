@@ -0,0 +1,100 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the routing of reads to the database replica."""
+
+from unittest import mock
+
+from oslo_db.sqlalchemy import enginefacade
+
+import magnum.db.sqlalchemy.api as sa_api
+from magnum.tests.unit.db import base
+
+
+class ReplicaReadsTestCase(base.DbTestCase):
+
+    def setUp(self):
+        super(ReplicaReadsTestCase, self).setUp()
+        self.config(enable_replica_reads=True,
+                    slave_connection='sqlite://',
+                    group='database')
+        self.addCleanup(sa_api._REPLICA.reset)
+
+    @mock.patch.object(sa_api, '_replica_lag', return_value=0)
+    @mock.patch.object(sa_api.enginefacade, 'reader')
+    def test_read_from_replica(self, mock_reader, mock_lag):
+        sa_api._session_for_read(use_replica=True)
+        mock_reader.async_.using.assert_called_once_with(sa_api._CONTEXT)
+        mock_reader.using.assert_not_called()
+
+    @mock.patch.object(sa_api, '_replica_lag', return_value=0)
+    @mock.patch.object(sa_api.enginefacade, 'reader')
+    def test_read_from_primary(self, mock_reader, mock_lag):
+        sa_api._session_for_read()
+        mock_reader.using.assert_called_once_with(sa_api._CONTEXT)
+        mock_reader.async_.using.assert_not_called()
+        mock_lag.assert_not_called()
+
+    @mock.patch.object(sa_api, '_replica_lag', return_value=0)
+    @mock.patch.object(sa_api.enginefacade, 'reader')
+    def test_replica_reads_disabled(self, mock_reader, mock_lag):
+        self.config(enable_replica_reads=False, group='database')
+        sa_api._session_for_read(use_replica=True)
+        mock_reader.using.assert_called_once_with(sa_api._CONTEXT)
+        mock_lag.assert_not_called()
+
+    @mock.patch.object(sa_api, '_replica_lag', return_value=0)
+    @mock.patch.object(sa_api.enginefacade, 'reader')
+    def test_no_replica_configured(self, mock_reader, mock_lag):
+        self.config(slave_connection=None, group='database')
+        sa_api._session_for_read(use_replica=True)
+        mock_reader.using.assert_called_once_with(sa_api._CONTEXT)
+        mock_lag.assert_not_called()
+
+    @mock.patch.object(sa_api, '_replica_lag', return_value=60)
+    @mock.patch.object(sa_api.enginefacade, 'reader')
+    def test_replica_lagging(self, mock_reader, mock_lag):
+        sa_api._session_for_read(use_replica=True)
+        mock_reader.using.assert_called_once_with(sa_api._CONTEXT)
+        mock_reader.async_.using.assert_not_called()
+
+    @mock.patch.object(sa_api, '_replica_lag')
+    def test_lag_checked_once_per_interval(self, mock_lag):
+        mock_lag.side_effect = [5, 60]
+        self.assertTrue(sa_api._REPLICA.in_sync())
+        self.assertTrue(sa_api._REPLICA.in_sync())
+        self.assertEqual(1, mock_lag.call_count)
+
+        self.config(replica_lag_check_interval=1, group='database')
+        with mock.patch.object(sa_api.timeutils, 'utcnow_ts',
+                               return_value=2e9):
+            self.assertFalse(sa_api._REPLICA.in_sync())
+        self.assertEqual(2, mock_lag.call_count)
+
+    @mock.patch.object(sa_api, '_replica_lag')
+    def test_lag_unknown(self, mock_lag):
+        mock_lag.return_value = None
+        self.assertFalse(sa_api._REPLICA.in_sync())
+
+        sa_api._REPLICA.reset()
+        mock_lag.side_effect = Exception('access denied')
+        self.assertFalse(sa_api._REPLICA.in_sync())
+
+    def test_replica_lag_not_measurable(self):
+        self.assertEqual(
+            0, sa_api._replica_lag(enginefacade.reader.get_engine()))
+
+    def test_list_from_replica(self):
+        with mock.patch.object(sa_api, '_session_for_read',
+                               wraps=sa_api._session_for_read) as mock_read:
+            self.dbapi.get_cluster_list(self.context, use_replica=True)
+        mock_read.assert_called_once_with(use_replica=True)
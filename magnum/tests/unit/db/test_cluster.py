@@ -14,10 +14,19 @@
 #    under the License.
 
 """Tests for manipulating Clusters via the DB API"""
+import collections
+import datetime
+from unittest import mock
+
+import fixtures
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
+import sqlalchemy as sa
 
 from magnum.common import context
 from magnum.common import exception
+from magnum.db.sqlalchemy import api as sqlalchemy_api
+from magnum.db.sqlalchemy import models
 from magnum.objects.fields import ClusterStatus as cluster_status
 from magnum.tests.unit.db import base
 from magnum.tests.unit.db import utils
@@ -107,6 +116,45 @@ class DbClusterTestCase(base.DbTestCase):
         ret = self.dbapi.get_cluster_stats(self.context, 'proj2')
         self.assertEqual(ret, (1, 6))
 
+    def test_cluster_stats_follow_changes(self):
+        uuid = uuidutils.generate_uuid()
+        utils.create_test_cluster(uuid=uuid, project_id='proj1')
+        utils.create_nodegroups_for_cluster(cluster_id=uuid,
+                                            project_id='proj1')
+        self.assertEqual((1, 6),
+                         self.dbapi.get_cluster_stats(self.context, 'proj1'))
+
+        worker = self.dbapi.list_cluster_nodegroups(
+            context.make_admin_context(), uuid,
+            filters={'role': 'worker'})[0]
+        self.dbapi.update_nodegroup(uuid, worker.id, {'node_count': 10})
+        self.assertEqual((1, 13),
+                         self.dbapi.get_cluster_stats(self.context, 'proj1'))
+
+        self.dbapi.destroy_nodegroup(uuid, worker.id)
+        self.dbapi.destroy_cluster(uuid)
+        self.assertEqual((0, 3),
+                         self.dbapi.get_cluster_stats(self.context, 'proj1'))
+        self.assertEqual((0, 0),
+                         self.dbapi.get_cluster_stats(self.context, 'proj2'))
+
+    def test_reconcile_project_stats(self):
+        uuid = uuidutils.generate_uuid()
+        utils.create_test_cluster(uuid=uuid, project_id='proj1')
+        utils.create_nodegroups_for_cluster(cluster_id=uuid,
+                                            project_id='proj1')
+        self.assertEqual(0, self.dbapi.reconcile_project_stats())
+
+        with sqlalchemy_api._session_for_write() as session:
+            session.query(models.ProjectStats).delete()
+            session.add(models.ProjectStats(project_id='gone', clusters=2))
+        self.assertEqual((2, 0), self.dbapi.get_cluster_stats(self.context))
+
+        self.assertEqual(2, self.dbapi.reconcile_project_stats())
+        self.assertEqual((1, 6), self.dbapi.get_cluster_stats(self.context))
+        self.assertEqual((0, 0),
+                         self.dbapi.get_cluster_stats(self.context, 'gone'))
+
     def test_get_cluster_list(self):
         uuids = []
         for i in range(1, 6):
@@ -130,6 +178,49 @@ class DbClusterTestCase(base.DbTestCase):
                           self.context,
                           sort_key='foo')
 
+    def test_get_cluster_list_sorted_by_node_count(self):
+        uuids = []
+        for node_count in (4, 1, 3):
+            cluster = utils.create_test_cluster(uuid=uuidutils.generate_uuid(),
+                                                name='c%d' % node_count)
+            utils.create_nodegroups_for_cluster(cluster_id=cluster.uuid,
+                                                node_count=node_count)
+            uuids.append((node_count, cluster.uuid))
+        res = self.dbapi.get_cluster_list(self.context,
+                                          sort_key='node_count')
+        self.assertEqual([uuid for _, uuid in sorted(uuids)],
+                         [r.uuid for r in res])
+
+    def test_cluster_node_counts_follow_nodegroups(self):
+        # nodegroups created before the cluster are counted on creation
+        cluster_uuid = uuidutils.generate_uuid()
+        utils.create_nodegroups_for_cluster(cluster_id=cluster_uuid,
+                                            node_count=2, master_count=1)
+        cluster = utils.create_test_cluster(uuid=cluster_uuid)
+        self.assertEqual((2, 1), (cluster.node_count, cluster.master_count))
+
+        extra = utils.create_test_nodegroup(
+            id=42, uuid=uuidutils.generate_uuid(), name='extra',
+            cluster_id=cluster_uuid, role='worker', node_count=5)
+
+        def counts():
+            res = self.dbapi.get_cluster_by_uuid(self.context, cluster_uuid)
+            return res.node_count, res.master_count
+
+        self.assertEqual((7, 1), counts())
+        self.dbapi.update_nodegroup(cluster_uuid, extra.id,
+                                    {'node_count': 3})
+        self.assertEqual((5, 1), counts())
+        self.dbapi.update_nodegroup(cluster_uuid, extra.id,
+                                    {'role': 'master'})
+        self.assertEqual((2, 4), counts())
+        self.dbapi.destroy_nodegroup(cluster_uuid, extra.id)
+        self.assertEqual((2, 1), counts())
+        worker = self.dbapi.list_cluster_nodegroups(
+            self.context, cluster_uuid, filters={'role': 'worker'})[0]
+        self.dbapi.destroy_nodegroup(cluster_uuid, worker.id)
+        self.assertEqual((0, 1), counts())
+
     def test_get_cluster_list_with_filters(self):
         ct1 = utils.get_test_cluster_template(id=1,
                                               uuid=uuidutils.generate_uuid())
@@ -206,6 +297,31 @@ class DbClusterTestCase(base.DbTestCase):
                                           filters=filters)
         self.assertEqual([cluster1.id, cluster3.id], [r.id for r in res])
 
+    def test_get_cluster_list_with_labels_filter(self):
+        cluster1 = utils.create_test_cluster(
+            uuid=uuidutils.generate_uuid(),
+            labels={'env': 'prod', 'kube_tag': 'v1.30.1'})
+        cluster2 = utils.create_test_cluster(
+            uuid=uuidutils.generate_uuid(),
+            labels={'env': 'prod', 'kube_tag': 'v1.29.4'})
+        utils.create_test_cluster(
+            uuid=uuidutils.generate_uuid(), labels={'env': 'dev'})
+        utils.create_test_cluster(uuid=uuidutils.generate_uuid(),
+                                  labels=None)
+
+        res = self.dbapi.get_cluster_list(
+            self.context, filters={'labels': {'env': 'prod'}})
+        self.assertEqual([cluster1.id, cluster2.id], [r.id for r in res])
+
+        res = self.dbapi.get_cluster_list(
+            self.context,
+            filters={'labels': {'env': 'prod', 'kube_tag': 'v1.29.4'}})
+        self.assertEqual([cluster2.id], [r.id for r in res])
+
+        res = self.dbapi.get_cluster_list(
+            self.context, filters={'labels': {'missing': 'prod'}})
+        self.assertEqual([], res)
+
     def test_get_cluster_list_by_admin_all_tenants(self):
         uuids = []
         for i in range(1, 6):
@@ -253,6 +369,107 @@ class DbClusterTestCase(base.DbTestCase):
         self.assertRaises(exception.ClusterNotFound,
                           self.dbapi.destroy_cluster, '999')
 
+    def test_destroy_clusters(self):
+        admin = context.make_admin_context(all_tenants=True)
+        uuids = [uuidutils.generate_uuid() for _ in range(3)]
+        for i, uuid in enumerate(uuids):
+            utils.create_test_cluster(id=i + 1, uuid=uuid,
+                                      name='cluster%d' % i)
+            utils.create_nodegroups_for_cluster(cluster_id=uuid)
+        kept = utils.create_test_x509keypair(
+            id=1, uuid=uuidutils.generate_uuid())
+        cert = utils.create_test_x509keypair(
+            id=2, uuid=uuidutils.generate_uuid())
+
+        self.assertEqual(2, self.dbapi.destroy_clusters(
+            uuids[:2], cert_refs=[cert.uuid]))
+
+        self.assertEqual([uuids[2]], [c.uuid for c in
+                                      self.dbapi.get_cluster_list(admin)])
+        self.assertEqual([], self.dbapi.list_nodegroups_for_clusters(
+            admin, uuids[:2]))
+        self.assertEqual(2, len(self.dbapi.list_cluster_nodegroups(
+            admin, uuids[2])))
+        self.assertEqual([kept.uuid], [k.uuid for k in
+                                       self.dbapi.get_x509keypair_list(admin)])
+        self.assertEqual((1, 6), self.dbapi.get_cluster_stats(admin))
+        self.assertEqual(0, self.dbapi.destroy_clusters([]))
+
+    def test_purge_failed_clusters(self):
+        now = timeutils.utcnow()
+        old = now - datetime.timedelta(days=60)
+        uuids = [uuidutils.generate_uuid() for _ in range(4)]
+        statuses = [cluster_status.CREATE_FAILED,
+                    cluster_status.DELETE_FAILED,
+                    cluster_status.UPDATE_FAILED,
+                    cluster_status.CREATE_FAILED]
+        for i, (uuid, status) in enumerate(zip(uuids, statuses)):
+            cert_ref = uuidutils.generate_uuid()
+            utils.create_test_x509keypair(uuid=cert_ref)
+            utils.create_nodegroups_for_cluster(cluster_id=uuid,
+                                                project_id='proj1')
+            utils.create_test_cluster(
+                uuid=uuid, name='cluster%d' % i, status=status,
+                ca_cert_ref=cert_ref, project_id='proj1',
+                created_at=now if i == 3 else old)
+
+        res = self.dbapi.purge_failed_clusters(
+            now - datetime.timedelta(days=30), 10)
+        tables = collections.Counter(ref.__tablename__ for ref in res)
+        self.assertEqual({'cluster': 2, 'nodegroup': 4, 'x509keypair': 2},
+                         tables)
+        self.assertEqual(sorted(uuids[:2]),
+                         sorted(ref.uuid for ref in res
+                                if ref.__tablename__ == 'cluster'))
+
+        admin = context.make_admin_context(all_tenants=True)
+        self.assertEqual(sorted(uuids[2:]), sorted(
+            ref.uuid for ref in self.dbapi.get_cluster_list(admin)))
+        self.assertEqual(2, len(self.dbapi.get_x509keypair_list(admin)))
+        self.assertEqual((2, 12),
+                         self.dbapi.get_cluster_stats(self.context, 'proj1'))
+
+    def test_purge_failed_clusters_archive(self):
+        old = timeutils.utcnow() - datetime.timedelta(days=60)
+        cert_ref = uuidutils.generate_uuid()
+        utils.create_test_x509keypair(uuid=cert_ref)
+        cluster = utils.create_test_cluster(
+            status=cluster_status.CREATE_FAILED, ca_cert_ref=cert_ref,
+            created_at=old)
+        archive = mock.Mock(side_effect=IOError('disk full'))
+
+        self.assertRaises(IOError, self.dbapi.purge_failed_clusters,
+                          timeutils.utcnow(), 10, archive=archive)
+        archived = archive.call_args[0][0]
+        self.assertEqual(['cluster', 'x509keypair'],
+                         [ref.__tablename__ for ref in archived])
+        # nothing is deleted when the rows could not be archived
+        self.assertEqual(cluster.uuid, self.dbapi.get_cluster_by_uuid(
+            self.context, cluster.uuid).uuid)
+        self.assertEqual(cert_ref, self.dbapi.get_x509keypair_by_uuid(
+            self.context, cert_ref).uuid)
+
+        archive.side_effect = None
+        res = self.dbapi.purge_failed_clusters(timeutils.utcnow(), 10,
+                                               archive=archive)
+        self.assertEqual(archive.call_args[0][0], res)
+        self.assertRaises(exception.ClusterNotFound,
+                          self.dbapi.get_cluster_by_uuid, self.context,
+                          cluster.uuid)
+
+    def test_purge_failed_clusters_external_certificates(self):
+        old = timeutils.utcnow() - datetime.timedelta(days=60)
+        # certificates stored in Barbican
+        cluster = utils.create_test_cluster(
+            status=cluster_status.CREATE_FAILED, created_at=old,
+            ca_cert_ref='https://barbican/v1/containers/ca',
+            magnum_cert_ref='https://barbican/v1/containers/magnum')
+
+        self.assertEqual(
+            [], self.dbapi.purge_failed_clusters(timeutils.utcnow(), 10))
+        self.assertEqual(cluster.uuid, self.dbapi.get_cluster_by_uuid(
+            self.context, cluster.uuid).uuid)
+
     def test_update_cluster(self):
         cluster = utils.create_test_cluster()
         old_status = cluster.status
@@ -261,11 +478,90 @@ class DbClusterTestCase(base.DbTestCase):
         res = self.dbapi.update_cluster(cluster.id, {'status': new_status})
         self.assertEqual(new_status, res.status)
 
+    def test_update_cluster_generation(self):
+        cluster = utils.create_test_cluster()
+        self.assertEqual(1, cluster.generation)
+        res = self.dbapi.update_cluster(cluster.uuid, {'status': 'A'},
+                                        generation=1)
+        self.assertEqual(2, res.generation)
+        res = self.dbapi.update_cluster(cluster.uuid, {'status': 'B'})
+        self.assertEqual(3, res.generation)
+
+        self.assertRaises(exception.ConcurrentUpdate,
+                          self.dbapi.update_cluster, cluster.uuid,
+                          {'status': 'C'}, generation=2)
+        res = self.dbapi.get_cluster_by_uuid(self.context, cluster.uuid)
+        self.assertEqual('B', res.status)
+
+    def test_update_cluster_counters_keep_generation(self):
+        cluster = utils.create_test_cluster()
+        self.dbapi.update_clusters_health_status(
+            {cluster.uuid: ('HEALTHY', {})})
+        utils.create_test_nodegroup(cluster_id=cluster.uuid, node_count=2)
+        res = self.dbapi.get_cluster_by_uuid(self.context, cluster.uuid)
+        self.assertEqual(1, res.generation)
+
+    def _race_update(self):
+        """Make a writer commit between the read and the write of ours."""
+        update = models.Cluster.update
+        raced = []
+
+        def racing_update(ref, values):
+            if not raced:
+                raced.append(ref.uuid)
+                table = models.Cluster.__table__
+                sa.orm.object_session(ref).execute(
+                    table.update().where(table.c.uuid == ref.uuid).values(
+                        generation=table.c.generation + 1))
+            update(ref, values)
+
+        return mock.patch.object(models.Cluster, 'update', autospec=True,
+                                 side_effect=racing_update)
+
+    def test_update_cluster_lost_race(self):
+        cluster = utils.create_test_cluster()
+        with self._race_update():
+            self.assertRaises(exception.ConcurrentUpdate,
+                              self.dbapi.update_cluster, cluster.uuid,
+                              {'status': 'A'}, generation=1)
+
+    def test_update_cluster_lost_race_retried(self):
+        cluster = utils.create_test_cluster()
+        with self._race_update() as mock_update:
+            res = self.dbapi.update_cluster(cluster.uuid, {'status': 'A'})
+        self.assertEqual(2, mock_update.call_count)
+        self.assertEqual('A', res.status)
+        self.assertEqual(2, res.generation)
+
     def test_update_cluster_not_found(self):
         cluster_uuid = uuidutils.generate_uuid()
         self.assertRaises(exception.ClusterNotFound, self.dbapi.update_cluster,
                           cluster_uuid, {'node_count': 5})
 
+    def test_update_clusters_health_status(self):
+        self.useFixture(fixtures.MockPatchObject(
+            sqlalchemy_api, 'HEALTH_STATUS_BATCH_SIZE', 2))
+        clusters = [utils.create_test_cluster(uuid=uuidutils.generate_uuid(),
+                                              name='cluster%d' % i,
+                                              health_status='HEALTHY')
+                    for i in range(3)]
+        updates = {
+            clusters[0].uuid: ('UNHEALTHY', {'node-0.Ready': 'False'}),
+            clusters[1].uuid: ('UNKNOWN', None),
+            uuidutils.generate_uuid(): ('HEALTHY', {}),
+        }
+
+        self.assertEqual(2, self.dbapi.update_clusters_health_status(updates))
+
+        res = [self.dbapi.get_cluster_by_uuid(self.context, cluster.uuid)
+               for cluster in clusters]
+        self.assertEqual('UNHEALTHY', res[0].health_status)
+        self.assertEqual({'node-0.Ready': 'False'},
+                         res[0].health_status_reason)
+        self.assertEqual('UNKNOWN', res[1].health_status)
+        self.assertEqual({}, res[1].health_status_reason)
+        self.assertEqual('HEALTHY', res[2].health_status)
+
     def test_update_cluster_uuid(self):
         cluster = utils.create_test_cluster()
         self.assertRaises(exception.InvalidParameterValue,
@@ -80,6 +80,72 @@ class DbClusterTemplateTestCase(base.DbTestCase):
             self.context, filters={'image_id': 'image2'})
         self.assertEqual([ct2['id']], [r.id for r in res])
 
+    def test_get_cluster_template_list_visibility(self):
+        own = utils.create_test_cluster_template(
+            id=1, uuid=uuidutils.generate_uuid())
+        utils.create_test_cluster_template(
+            id=2, uuid=uuidutils.generate_uuid(),
+            user_id='not_me', project_id='not_my_project')
+        public = utils.create_test_cluster_template(
+            id=3, uuid=uuidutils.generate_uuid(),
+            user_id='not_me', project_id='not_my_project', public=True)
+        hidden = utils.create_test_cluster_template(
+            id=4, uuid=uuidutils.generate_uuid(),
+            user_id='not_me', project_id='not_my_project',
+            public=True, hidden=True)
+
+        res = self.dbapi.get_cluster_template_list(self.context)
+        self.assertEqual([own['id'], public['id']], [r.id for r in res])
+
+        self.context.is_admin = True
+        res = self.dbapi.get_cluster_template_list(self.context)
+        self.assertEqual([own['id'], public['id'], hidden['id']],
+                         [r.id for r in res])
+
+        self.context.all_tenants = True
+        res = self.dbapi.get_cluster_template_list(self.context)
+        self.assertEqual([1, 2, 3, 4], [r.id for r in res])
+
+    def test_get_cluster_template_list_filters_public(self):
+        utils.create_test_cluster_template(
+            id=1, uuid=uuidutils.generate_uuid(), image_id='image1')
+        public = utils.create_test_cluster_template(
+            id=2, uuid=uuidutils.generate_uuid(), image_id='image2',
+            user_id='not_me', project_id='not_my_project', public=True)
+
+        res = self.dbapi.get_cluster_template_list(
+            self.context, filters={'image_id': 'image2'})
+        self.assertEqual([public['id']], [r.id for r in res])
+
+    def test_get_public_cluster_template_list(self):
+        utils.create_test_cluster_template(
+            id=1, uuid=uuidutils.generate_uuid())
+        own_public = utils.create_test_cluster_template(
+            id=2, uuid=uuidutils.generate_uuid(), public=True)
+        public = utils.create_test_cluster_template(
+            id=3, uuid=uuidutils.generate_uuid(),
+            user_id='not_me', project_id='not_my_project', public=True)
+        utils.create_test_cluster_template(
+            id=4, uuid=uuidutils.generate_uuid(),
+            user_id='not_me', project_id='not_my_project',
+            public=True, hidden=True)
+
+        res = self.dbapi.get_public_cluster_template_list()
+        self.assertEqual([own_public['id'], public['id']],
+                         [r.id for r in res])
+
+    def test_get_project_cluster_template_list(self):
+        own = utils.create_test_cluster_template(
+            id=1, uuid=uuidutils.generate_uuid())
+        own_hidden = utils.create_test_cluster_template(
+            id=2, uuid=uuidutils.generate_uuid(), public=True, hidden=True)
+        utils.create_test_cluster_template(
+            id=3, uuid=uuidutils.generate_uuid(),
+            user_id='not_me', project_id='not_my_project', public=True)
+
+        res = self.dbapi.get_project_cluster_template_list(self.context)
+        self.assertEqual([own['id'], own_hidden['id']], [r.id for r in res])
+
     def test_get_cluster_template_by_id(self):
         ct = utils.create_test_cluster_template()
         cluster_template = self.dbapi.get_cluster_template_by_id(
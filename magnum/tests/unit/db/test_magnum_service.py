@@ -12,6 +12,10 @@
 
 """Tests for manipulating MagnumService via the DB API"""
 
+import datetime
+
+from oslo_utils import timeutils
+
 from magnum.common import context  # NOQA
 from magnum.common import exception
 from magnum.tests.unit.db import base
@@ -99,3 +103,19 @@ class DbMagnumServiceTestCase(base.DbTestCase):
         res = res[0]
         for k, v in fake_ms_params.items():
             self.assertEqual(res[k], v)
+
+    def test_purge_magnum_services(self):
+        now = timeutils.utcnow()
+        old = now - datetime.timedelta(days=60)
+        utils.create_test_magnum_service(host='gone', created_at=old,
+                                         last_seen_up=old)
+        utils.create_test_magnum_service(host='up', created_at=old,
+                                         last_seen_up=now)
+        utils.create_test_magnum_service(host='new', created_at=now)
+
+        res = self.dbapi.purge_magnum_services(
+            now - datetime.timedelta(days=30), 10)
+        self.assertEqual(['gone'], [ref.host for ref in res])
+        self.assertEqual(
+            ['new', 'up'],
+            sorted(ref.host for ref in self.dbapi.get_magnum_service_list()))
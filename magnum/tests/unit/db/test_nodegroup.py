@@ -118,6 +118,21 @@ class DbNodeGroupTestCase(base.DbTestCase):
         for uuid in uuids_not_in_cluster:
             self.assertNotIn(uuid, res_uuids)
 
+    def test_list_nodegroups_for_clusters(self):
+        uuids_in_clusters = []
+        cluster_ids = [uuidutils.generate_uuid() for _ in range(2)]
+        for i, cluster_id in enumerate(cluster_ids + ['other_cluster']):
+            ng = utils.create_test_nodegroup(id=i + 1,
+                                             uuid=uuidutils.generate_uuid(),
+                                             cluster_id=cluster_id)
+            if cluster_id in cluster_ids:
+                uuids_in_clusters.append(ng.uuid)
+        res = self.dbapi.list_nodegroups_for_clusters(self.context,
+                                                      cluster_ids)
+        self.assertEqual(uuids_in_clusters, [r.uuid for r in res])
+        self.assertEqual(
+            [], self.dbapi.list_nodegroups_for_clusters(self.context, []))
+
     def test_get_cluster_list_sorted(self):
         uuids = []
         cluster = utils.create_test_cluster(uuid=uuidutils.generate_uuid())
@@ -221,6 +236,22 @@ class DbNodeGroupTestCase(base.DbTestCase):
                                           {'flavor_id': new_flavor})
         self.assertEqual(new_flavor, res.flavor_id)
 
+    def test_update_nodegroup_generation(self):
+        cluster = utils.create_test_cluster()
+        nodegroup = utils.create_test_nodegroup(cluster_id=cluster.uuid,
+                                                node_count=1)
+        node_count = self.dbapi.get_cluster_by_uuid(
+            self.context, cluster.uuid).node_count
+        res = self.dbapi.update_nodegroup(cluster.uuid, nodegroup.uuid,
+                                          {'node_count': 3}, generation=1)
+        self.assertEqual(2, res.generation)
+
+        self.assertRaises(exception.ConcurrentUpdate,
+                          self.dbapi.update_nodegroup, cluster.uuid,
+                          nodegroup.uuid, {'node_count': 5}, generation=1)
+        cluster = self.dbapi.get_cluster_by_uuid(self.context, cluster.uuid)
+        self.assertEqual(node_count + 2, cluster.node_count)
+
     def test_update_nodegroup_not_found(self):
         uuid = uuidutils.generate_uuid()
         self.assertRaises(exception.NodeGroupNotFound,
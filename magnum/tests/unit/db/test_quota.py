@@ -15,6 +15,10 @@
 
 """Tests for manipulating Quota via the DB API"""
 
+import datetime
+
+from oslo_utils import timeutils
+
 from magnum.common import exception
 from magnum.tests.unit.db import base
 from magnum.tests.unit.db import utils
@@ -170,3 +174,59 @@ class DbQuotaTestCase(base.DbTestCase):
                           self.dbapi.delete_quota,
                           project_id='123',
                           resource='bad-res')
+
+    def test_reserve_quota(self):
+        expires_at = timeutils.utcnow() + datetime.timedelta(hours=1)
+        self.dbapi.reserve_quota('proj1', 'c1', expires_at, clusters=1,
+                                 nodes=4, cluster_limit=2, node_limit=5)
+        self.assertEqual((1, 4), utils.get_reserved_quota('proj1'))
+
+        exc = self.assertRaises(exception.QuotaExceeded,
+                                self.dbapi.reserve_quota, 'proj1', 'c2',
+                                expires_at, clusters=1, nodes=2,
+                                cluster_limit=2, node_limit=5)
+        self.assertIn('nodes', str(exc))
+        self.dbapi.reserve_quota('proj1', 'c2', expires_at, clusters=1,
+                                 nodes=1, cluster_limit=2, node_limit=5)
+        exc = self.assertRaises(exception.QuotaExceeded,
+                                self.dbapi.reserve_quota, 'proj1', 'c3',
+                                expires_at, clusters=1, cluster_limit=2)
+        self.assertIn('clusters', str(exc))
+        # no limit
+        self.dbapi.reserve_quota('proj1', 'c3', expires_at, clusters=1,
+                                 nodes=10)
+        self.assertEqual((3, 15), utils.get_reserved_quota('proj1'))
+
+    def test_reserve_quota_counts_usage(self):
+        utils.create_test_cluster(project_id='proj1')
+        expires_at = timeutils.utcnow() + datetime.timedelta(hours=1)
+        self.assertRaises(exception.QuotaExceeded, self.dbapi.reserve_quota,
+                          'proj1', 'c1', expires_at, clusters=1,
+                          cluster_limit=1)
+        self.assertRaises(exception.QuotaExceeded, self.dbapi.reserve_quota,
+                          'proj2', 'c1', expires_at, nodes=2, node_limit=1)
+
+    def test_release_quota_reservation(self):
+        expires_at = timeutils.utcnow() + datetime.timedelta(hours=1)
+        first = self.dbapi.reserve_quota('proj1', 'c1', expires_at,
+                                         clusters=1, nodes=3)
+        second = self.dbapi.reserve_quota('proj1', 'c1', expires_at, nodes=2)
+
+        # the operations on the same cluster release their own reservation
+        self.assertTrue(self.dbapi.release_quota_reservation(second.id))
+        self.assertEqual((1, 3), utils.get_reserved_quota('proj1'))
+        self.assertFalse(self.dbapi.release_quota_reservation(second.id))
+        self.assertTrue(self.dbapi.release_quota_reservation(first.id))
+        self.assertEqual((0, 0), utils.get_reserved_quota('proj1'))
+
+    def test_reconcile_expires_reservations(self):
+        now = timeutils.utcnow()
+        expired = self.dbapi.reserve_quota(
+            'proj1', 'c1', now - datetime.timedelta(seconds=1),
+            clusters=1, nodes=3)
+        self.dbapi.reserve_quota('proj1', 'c2',
+                                 now + datetime.timedelta(hours=1), nodes=2)
+
+        self.assertEqual(1, self.dbapi.reconcile_project_stats())
+        self.assertEqual((0, 2), utils.get_reserved_quota('proj1'))
+        self.assertFalse(self.dbapi.release_quota_reservation(expired.id))
@@ -15,6 +15,9 @@
 
 """Tests for manipulating X509KeyPairs via the DB API"""
 
+import datetime
+
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
 from magnum.common import context
@@ -100,3 +103,26 @@ class DbX509KeyPairTestCase(base.DbTestCase):
         self.assertRaises(exception.X509KeyPairNotFound,
                           self.dbapi.destroy_x509keypair,
                           '12345678-9999-0000-aaaa-123456789012')
+
+    def test_purge_x509keypairs(self):
+        now = timeutils.utcnow()
+        old = now - datetime.timedelta(days=60)
+        uuids = [uuidutils.generate_uuid() for _ in range(5)]
+        for uuid in uuids[:4]:
+            utils.create_test_x509keypair(uuid=uuid, created_at=old)
+        # too recent, may belong to a cluster being created
+        utils.create_test_x509keypair(uuid=uuids[4], created_at=now)
+        utils.create_test_cluster(ca_cert_ref=uuids[0],
+                                  etcd_ca_cert_ref=uuids[1])
+
+        older_than = now - datetime.timedelta(days=30)
+        res = self.dbapi.purge_x509keypairs(older_than, 1)
+        self.assertEqual([uuids[2]], [ref.uuid for ref in res])
+        res = self.dbapi.purge_x509keypairs(older_than, 10)
+        self.assertEqual([uuids[3]], [ref.uuid for ref in res])
+        self.assertEqual([], self.dbapi.purge_x509keypairs(older_than, 10))
+
+        admin = context.make_admin_context(all_tenants=True)
+        self.assertEqual(
+            sorted([uuids[0], uuids[1], uuids[4]]),
+            sorted(ref.uuid for ref in self.dbapi.get_x509keypair_list(admin)))
@@ -17,6 +17,8 @@
 from oslo_utils import uuidutils
 
 from magnum.db import api as db_api
+from magnum.db.sqlalchemy import api as sqlalchemy_api
+from magnum.db.sqlalchemy import models
 
 
 def get_test_cluster_template(**kw):
@@ -105,7 +107,8 @@ def get_test_cluster(**kw):
         'floating_ip_enabled': kw.get('floating_ip_enabled', True),
         'master_lb_enabled': kw.get('master_lb_enabled', True),
         'etcd_ca_cert_ref': kw.get('etcd_ca_cert_ref', None),
-        'front_proxy_ca_cert_ref': kw.get('front_proxy_ca_cert_ref', None)
+        'front_proxy_ca_cert_ref': kw.get('front_proxy_ca_cert_ref', None),
+        'generation': kw.get('generation', 1),
     }
 
     if kw.pop('for_api_use', False):
@@ -164,6 +167,20 @@ def create_test_quota(**kw):
     return dbapi.create_quota(quota)
 
 
+def get_reserved_quota(project_id):
+    """Return the clusters and nodes reserved for a project.
+
+    :param project_id: the project the quota is reserved for.
+    :returns: a (reserved_clusters, reserved_nodes) tuple.
+    """
+    with sqlalchemy_api._session_for_read() as session:
+        row = session.query(models.ProjectStats).filter_by(
+            project_id=project_id).first()
+        if row is None:
+            return 0, 0
+        return row.reserved_clusters, row.reserved_nodes
+
+
 def get_test_x509keypair(**kw):
     return {
         'id': kw.get('id', 42),
@@ -306,6 +323,7 @@ def get_test_nodegroup(**kw):
         'stack_id': kw.get('stack_id', '047c6319-7abd-fake-a033-8c6af0173cd0'),
         'node_labels': kw.get('node_labels'),
         'node_taints': kw.get('node_taints'),
+        'generation': kw.get('generation', 1),
     }
 
 
@@ -59,3 +59,17 @@ class TestGetDefaultDriver(base.TestCase):
         mock_load.return_value = iter([])
         result = driver.Driver.get_default_driver()
         self.assertIsNone(result)
+
+
+class TestUpdateClustersStatus(base.TestCase):
+
+    @mock.patch.object(driver.Driver, 'update_cluster_status')
+    @mock.patch.multiple(driver.Driver, __abstractmethods__=set())
+    def test_update_clusters_status_falls_back(self, mock_update):
+        """Calls update_cluster_status once per cluster by default."""
+        cdriver = driver.Driver()
+        clusters = [mock.sentinel.cluster1, mock.sentinel.cluster2]
+        cdriver.update_clusters_status(mock.sentinel.context, clusters)
+        mock_update.assert_has_calls([
+            mock.call(mock.sentinel.context, mock.sentinel.cluster1),
+            mock.call(mock.sentinel.context, mock.sentinel.cluster2)])
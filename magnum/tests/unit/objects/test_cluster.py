@@ -108,7 +108,7 @@ class TestClusterObject(base.DbTestCase):
             clusters = objects.Cluster.list(self.context)
             mock_get_list.assert_called_once_with(
                 self.context, limit=None, marker=None, filters=None,
-                sort_dir=None, sort_key=None)
+                sort_dir=None, sort_key=None, use_replica=False)
             self.assertEqual(1, mock_get_list.call_count)
             self.assertThat(clusters, HasLength(1))
             self.assertIsInstance(clusters[0], objects.Cluster)
@@ -125,7 +125,8 @@ class TestClusterObject(base.DbTestCase):
             mock_get_list.assert_called_once_with(self.context, sort_key=None,
                                                   sort_dir=None,
                                                   filters=filters, limit=None,
-                                                  marker=None)
+                                                  marker=None,
+                                                  use_replica=False)
             self.assertEqual(1, mock_get_list.call_count)
             self.assertThat(clusters, HasLength(1))
             self.assertIsInstance(clusters[0], objects.Cluster)
@@ -166,9 +167,40 @@ class TestClusterObject(base.DbTestCase):
 
                 mock_get_cluster.assert_called_once_with(self.context, uuid)
                 mock_update_cluster.assert_called_once_with(
-                    uuid, {'status': 'DELETE_IN_PROGRESS'})
+                    uuid, {'status': 'DELETE_IN_PROGRESS'}, generation=1)
                 self.assertEqual(self.context, cluster._context)
 
+    def test_save_without_generation(self):
+        uuid = self.fake_cluster['uuid']
+        with mock.patch.object(self.dbapi, 'update_cluster',
+                               autospec=True) as mock_update_cluster:
+            mock_update_cluster.return_value = dict(self.fake_cluster,
+                                                    generation=5)
+            cluster = objects.Cluster(self.context, uuid=uuid)
+            cluster.obj_reset_changes()
+            cluster.status = 'DELETE_IN_PROGRESS'
+            cluster.save()
+
+            mock_update_cluster.assert_called_once_with(
+                uuid, {'status': 'DELETE_IN_PROGRESS'}, generation=None)
+            self.assertEqual(5, cluster.generation)
+            self.assertEqual({}, cluster.obj_get_changes())
+
+    def test_save_concurrent_update(self):
+        uuid = self.fake_cluster['uuid']
+        with mock.patch.object(self.dbapi, 'get_cluster_by_uuid',
+                               autospec=True) as mock_get_cluster:
+            mock_get_cluster.return_value = self.fake_cluster
+            with mock.patch.object(self.dbapi, 'update_cluster',
+                                   autospec=True) as mock_update_cluster:
+                mock_update_cluster.side_effect = exception.ConcurrentUpdate(
+                    resource='Cluster', id=uuid)
+                cluster = objects.Cluster.get_by_uuid(self.context, uuid)
+                cluster.status = 'DELETE_IN_PROGRESS'
+                self.assertRaises(exception.ConcurrentUpdate, cluster.save)
+                self.assertEqual({'status': 'DELETE_IN_PROGRESS'},
+                                 cluster.obj_get_changes())
+
     def test_refresh(self):
         uuid = self.fake_cluster['uuid']
         new_uuid = uuidutils.generate_uuid()
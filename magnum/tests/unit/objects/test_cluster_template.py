@@ -18,6 +18,7 @@ from unittest import mock
 from oslo_utils import uuidutils
 from testtools.matchers import HasLength
 
+from magnum.common import context
 from magnum.common import exception
 from magnum import objects
 from magnum.tests.unit.db import base
@@ -143,3 +144,157 @@ class TestClusterTemplateObject(base.DbTestCase):
             self.assertEqual(expected,
                              mock_get_cluster_template.call_args_list)
             self.assertEqual(self.context, cluster_template._context)
+
+    def test_get_by_uuid_cached_in_request(self):
+        uuid = self.fake_cluster_template['uuid']
+        with mock.patch.object(self.dbapi, 'get_cluster_template_by_uuid',
+                               autospec=True) as mock_get_cluster_template:
+            mock_get_cluster_template.return_value = self.fake_cluster_template
+            first = objects.ClusterTemplate.get_by_uuid(self.context, uuid)
+            second = objects.ClusterTemplate.get_by_uuid(self.context, uuid)
+            mock_get_cluster_template.assert_called_once_with(self.context,
+                                                              uuid)
+            self.assertIsNot(first, second)
+            self.assertEqual(first.as_dict(), second.as_dict())
+
+            # another request looks it up again
+            other = context.make_context(project_id=self.context.project_id)
+            objects.ClusterTemplate.get_by_uuid(other, uuid)
+            self.assertEqual(2, mock_get_cluster_template.call_count)
+
+    def test_get_by_uuid_cached_for_admin(self):
+        uuid = self.fake_cluster_template['uuid']
+        with mock.patch.object(self.dbapi, 'get_cluster_template_by_uuid',
+                               autospec=True) as mock_get_cluster_template:
+            mock_get_cluster_template.return_value = self.fake_cluster_template
+            admin = context.make_admin_context(all_tenants=True)
+            objects.ClusterTemplate.get_by_uuid(admin, uuid)
+            admin = context.make_admin_context(all_tenants=True)
+            cluster_template = objects.ClusterTemplate.get_by_uuid(admin, uuid)
+            mock_get_cluster_template.assert_called_once_with(mock.ANY, uuid)
+            self.assertEqual(admin, cluster_template._context)
+
+    def test_get_by_uuid_admin_cache_disabled(self):
+        self.config(cache_ttl=0, group='cluster_template')
+        uuid = self.fake_cluster_template['uuid']
+        with mock.patch.object(self.dbapi, 'get_cluster_template_by_uuid',
+                               autospec=True) as mock_get_cluster_template:
+            mock_get_cluster_template.return_value = self.fake_cluster_template
+            for _ in range(2):
+                admin = context.make_admin_context(all_tenants=True)
+                objects.ClusterTemplate.get_by_uuid(admin, uuid)
+            self.assertEqual(2, mock_get_cluster_template.call_count)
+
+    def test_save_evicts_cache(self):
+        uuid = self.fake_cluster_template['uuid']
+        with mock.patch.object(self.dbapi, 'get_cluster_template_by_uuid',
+                               autospec=True) as mock_get_cluster_template:
+            mock_get_cluster_template.return_value = self.fake_cluster_template
+            with mock.patch.object(self.dbapi, 'update_cluster_template',
+                                   autospec=True):
+                admin = context.make_admin_context(all_tenants=True)
+                cluster_template = objects.ClusterTemplate.get_by_uuid(
+                    admin, uuid)
+                cluster_template.image_id = 'test-image'
+                cluster_template.save()
+                objects.ClusterTemplate.get_by_uuid(admin, uuid)
+                admin = context.make_admin_context(all_tenants=True)
+                objects.ClusterTemplate.get_by_uuid(admin, uuid)
+            self.assertEqual(2, mock_get_cluster_template.call_count)
+
+    def _create_cluster_templates(self):
+        own = utils.create_test_cluster_template(
+            id=1, uuid=uuidutils.generate_uuid(), name='own')
+        public = utils.create_test_cluster_template(
+            id=2, uuid=uuidutils.generate_uuid(), name='public',
+            user_id='not_me', project_id='not_my_project', public=True)
+        utils.create_test_cluster_template(
+            id=3, uuid=uuidutils.generate_uuid(), name='hidden',
+            user_id='not_me', project_id='not_my_project',
+            public=True, hidden=True)
+        utils.create_test_cluster_template(
+            id=4, uuid=uuidutils.generate_uuid(), name='other',
+            user_id='not_me', project_id='not_my_project')
+        return own, public
+
+    def test_list_as_dicts(self):
+        own, public = self._create_cluster_templates()
+        expected = [objects.ClusterTemplate.get_by_uuid(
+            self.context, t['uuid']).as_dict() for t in (own, public)]
+        self.assertEqual(
+            expected, objects.ClusterTemplate.list_as_dicts(self.context))
+        self.assertEqual(
+            expected[::-1], objects.ClusterTemplate.list_as_dicts(
+                self.context, sort_key='id', sort_dir='desc'))
+
+    def test_list_as_dicts_paginated(self):
+        own, public = self._create_cluster_templates()
+        marker = objects.ClusterTemplate.get_by_uuid(self.context,
+                                                     own['uuid'])
+        res = objects.ClusterTemplate.list_as_dicts(
+            self.context, limit=1, marker=marker)
+        self.assertEqual([public['uuid']], [t['uuid'] for t in res])
+        res = objects.ClusterTemplate.list_as_dicts(
+            self.context, limit=1, sort_key='uuid', sort_dir='desc')
+        self.assertEqual([max(own['uuid'], public['uuid'])],
+                         [t['uuid'] for t in res])
+
+    def test_list_as_dicts_caches_public(self):
+        own, public = self._create_cluster_templates()
+        dbapi = self.dbapi
+        with mock.patch.object(
+                dbapi, 'get_public_cluster_template_list',
+                wraps=dbapi.get_public_cluster_template_list) as mock_list:
+            objects.ClusterTemplate.list_as_dicts(self.context)
+            other = context.make_context(project_id='not_my_project',
+                                         user_id='not_me')
+            res = objects.ClusterTemplate.list_as_dicts(other)
+        self.assertEqual(1, mock_list.call_count)
+        self.assertEqual(['public', 'hidden', 'other'],
+                         [t['name'] for t in res])
+
+    def test_list_as_dicts_own_public_not_duplicated(self):
+        utils.create_test_cluster_template(
+            id=1, uuid=uuidutils.generate_uuid(), public=True)
+        res = objects.ClusterTemplate.list_as_dicts(self.context)
+        self.assertEqual([1], [t['id'] for t in res])
+
+    def test_list_as_dicts_save_evicts_public(self):
+        own, public = self._create_cluster_templates()
+        objects.ClusterTemplate.list_as_dicts(self.context)
+        admin = context.make_admin_context(all_tenants=True)
+        cluster_template = objects.ClusterTemplate.get_by_uuid(
+            admin, public['uuid'])
+        cluster_template.name = 'renamed'
+        cluster_template.save()
+        res = objects.ClusterTemplate.list_as_dicts(self.context)
+        self.assertEqual(['own', 'renamed'], [t['name'] for t in res])
+
+        cluster_template.destroy()
+        res = objects.ClusterTemplate.list_as_dicts(self.context)
+        self.assertEqual(['own'], [t['name'] for t in res])
+
+    def test_list_as_dicts_create_evicts_public(self):
+        objects.ClusterTemplate.list_as_dicts(self.context)
+        cluster_template = objects.ClusterTemplate(
+            self.context, **utils.get_test_cluster_template(
+                project_id='not_my_project', public=True))
+        cluster_template.create()
+        res = objects.ClusterTemplate.list_as_dicts(self.context)
+        self.assertEqual([cluster_template.uuid], [t['uuid'] for t in res])
+
+    @mock.patch.object(objects.ClusterTemplate, '_list_public')
+    def test_list_as_dicts_not_cached(self, mock_list_public):
+        self._create_cluster_templates()
+        res = objects.ClusterTemplate.list_as_dicts(self.context,
+                                                    sort_key='name')
+        self.assertEqual(['own', 'public'], [t['name'] for t in res])
+
+        self.config(public_list_cache_ttl=0, group='cluster_template')
+        res = objects.ClusterTemplate.list_as_dicts(self.context)
+        self.assertEqual(['own', 'public'], [t['name'] for t in res])
+
+        admin = context.make_admin_context(all_tenants=True)
+        res = objects.ClusterTemplate.list_as_dicts(admin)
+        self.assertEqual(4, len(res))
+        mock_list_public.assert_not_called()
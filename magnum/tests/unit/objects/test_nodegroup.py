@@ -75,7 +75,8 @@ class TestNodeGroupObject(base.DbTestCase):
             self.assertEqual(1, mock_get_list.call_count)
             mock_get_list.assert_called_once_with(
                 self.context, cluster_id, limit=None, marker=None,
-                filters=None, sort_dir=None, sort_key=None)
+                filters=None, sort_dir=None, sort_key=None,
+                use_replica=False)
             self.assertThat(nodegroups, HasLength(1))
             self.assertIsInstance(nodegroups[0], objects.NodeGroup)
             self.assertEqual(self.context, nodegroups[0]._context)
@@ -91,7 +92,8 @@ class TestNodeGroupObject(base.DbTestCase):
             self.assertEqual(1, mock_get_list.call_count)
             mock_get_list.assert_called_once_with(
                 self.context, cluster_id, limit=None, marker=None,
-                filters=filters, sort_dir=None, sort_key=None)
+                filters=filters, sort_dir=None, sort_key=None,
+                use_replica=False)
             self.assertThat(nodegroups, HasLength(1))
             self.assertIsInstance(nodegroups[0], objects.NodeGroup)
             self.assertEqual(self.context, nodegroups[0]._context)
@@ -145,7 +147,7 @@ class TestNodeGroupObject(base.DbTestCase):
                     'node_count': 10,
                 }
                 mock_update_nodegroup.assert_called_once_with(
-                    cluster_id, uuid, expected_changes)
+                    cluster_id, uuid, expected_changes, generation=1)
                 self.assertEqual(self.context, nodegroup._context)
 
     def test_refresh(self):
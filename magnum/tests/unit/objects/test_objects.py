@@ -351,16 +351,16 @@ class TestObject(test_base.TestCase, _TestObject):
 # For more information on object version testing, read
 # https://docs.openstack.org/magnum/latest/contributor/objects.html
 object_data = {
-    'Cluster': '1.24-6bdcd5b0ff844347274717c51e01f942',
-    'ClusterTemplate': '1.21-2d23d472f415b5e7571603a8689898e3',
+    'Cluster': '1.28-d7d7d9aa31d231607f8bbeb38d763a84',
+    'ClusterTemplate': '1.22-41d6fe960191c0e198e80d7ab459981e',
     'Certificate': '1.2-64f24db0e10ad4cbd72aea21d2075a80',
     'MyObj': '1.0-34c4b1aadefd177b13f9a2f894cc23cd',
     'X509KeyPair': '1.2-d81950af36c59a71365e33ce539d24f9',
-    'MagnumService': '1.0-2d397ec59b0046bd5ec35cd3e06efeca',
-    'Stats': '1.0-73a1cd6e3c0294c932a66547faba216c',
-    'Quota': '1.0-94e100aebfa88f7d8428e007f2049c18',
+    'MagnumService': '1.1-a473f1fd5b835d0fb74fb924e791ad43',
+    'Stats': '1.2-50d3302b4a75a8607ce9ad809e2483e0',
+    'Quota': '1.2-5e390a098c416fe13c6e5fafa43b4c80',
     'Federation': '1.0-166da281432b083f0e4b851336e12e20',
-    'NodeGroup': '1.2-15f9bdcd57d11e41b10ac524c9682b1a'
+    'NodeGroup': '1.5-97e76ff4c7b3a35ee474a176d5d74ec5'
 }
 
 
@@ -12,8 +12,11 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import functools
 from unittest import mock
 
+import fixtures
+import futurist
 from oslo_utils import uuidutils
 
 from magnum.common import context
@@ -27,7 +30,7 @@ from magnum.objects.fields import ClusterStatus as cluster_status
 from magnum.service import periodic
 from magnum.tests import base
 from magnum.tests import fake_notifier
-from magnum.tests import fakes
+from magnum.tests.unit.db import base as db_base
 from magnum.tests.unit.db import utils
 
 
@@ -60,7 +63,8 @@ class PeriodicTestCase(base.TestCase):
         cluster_attrs = {'id': 1, 'stack_id': '11', 'uuid': uuid,
                          'status': cluster_status.CREATE_IN_PROGRESS,
                          'status_reason': 'no change',
-                         'keypair': 'keipair1', 'health_status': None}
+                         'keypair': 'keipair1', 'health_status': None,
+                         'health_status_reason': {}}
         cluster1 = utils.get_test_cluster(**cluster_attrs)
         ngs1 = utils.get_nodegroups_for_cluster()
         uuid = uuidutils.generate_uuid()
@@ -171,14 +175,22 @@ class PeriodicTestCase(base.TestCase):
         self.mock_driver.update_cluster_status.side_effect = (
             _mock_update_status)
 
-    @mock.patch('oslo_service.loopingcall.FixedIntervalLoopingCall',
-                new=fakes.FakeLoopingCall)
+        # run the per-cluster jobs inline so that the results can be
+        # checked as soon as the periodic task returns
+        p = mock.patch.object(
+            periodic.futurist, 'ThreadPoolExecutor',
+            side_effect=lambda max_workers: futurist.SynchronousExecutor())
+        p.start()
+        self.addCleanup(p.stop)
+        # no other conductor is alive, so this one owns every cluster
+        p = mock.patch.object(objects.MagnumService, 'list', return_value=[])
+        p.start()
+        self.addCleanup(p.stop)
+
     @mock.patch('magnum.drivers.common.driver.Driver.get_driver_for_cluster')
     @mock.patch('magnum.objects.Cluster.list')
-    @mock.patch.object(dbapi.Connection, 'destroy_nodegroup')
-    @mock.patch.object(dbapi.Connection, 'destroy_cluster')
+    @mock.patch.object(dbapi.Connection, 'destroy_clusters')
     def test_sync_cluster_status_changes(self, mock_db_destroy,
-                                         mock_ng_destroy,
                                          mock_cluster_list,
                                          mock_get_driver):
 
@@ -191,6 +203,8 @@ class PeriodicTestCase(base.TestCase):
                                mock_nodegroup_list):
             periodic.MagnumPeriodicTasks(CONF).sync_cluster_status(None)
 
+            mock_cluster_list.assert_called_once_with(
+                mock.ANY, filters=mock.ANY)
             self.assertEqual(cluster_status.CREATE_COMPLETE,
                              self.cluster1.status)
             self.assertEqual('fake_reason_11', self.cluster1.status_reason)
@@ -201,16 +215,14 @@ class PeriodicTestCase(base.TestCase):
             self.assertEqual(cluster_status.UPDATE_COMPLETE,
                              self.cluster3.status)
             self.assertEqual('fake_reason_33', self.cluster3.status_reason)
-            self.assertEqual(2, mock_ng_destroy.call_count)
-            mock_db_destroy.assert_called_once_with(self.cluster4.uuid)
+            mock_db_destroy.assert_called_once_with(
+                [self.cluster4.uuid], cert_refs=[])
             self.assertEqual(cluster_status.ROLLBACK_COMPLETE,
                              self.cluster5.status)
             self.assertEqual('fake_reason_55', self.cluster5.status_reason)
             notifications = fake_notifier.NOTIFICATIONS
             self.assertEqual(4, len(notifications))
 
-    @mock.patch('oslo_service.loopingcall.FixedIntervalLoopingCall',
-                new=fakes.FakeLoopingCall)
     @mock.patch('magnum.drivers.common.driver.Driver.get_driver_for_cluster')
     @mock.patch('magnum.objects.Cluster.list')
     def test_sync_cluster_status_not_changes(self, mock_cluster_list,
@@ -241,14 +253,10 @@ class PeriodicTestCase(base.TestCase):
         notifications = fake_notifier.NOTIFICATIONS
         self.assertEqual(0, len(notifications))
 
-    @mock.patch('oslo_service.loopingcall.FixedIntervalLoopingCall',
-                new=fakes.FakeLoopingCall)
     @mock.patch('magnum.drivers.common.driver.Driver.get_driver_for_cluster')
     @mock.patch('magnum.objects.Cluster.list')
-    @mock.patch.object(dbapi.Connection, 'destroy_cluster')
-    @mock.patch.object(dbapi.Connection, 'destroy_nodegroup')
-    def test_sync_cluster_status_stack_not_found(self, mock_ng_destroy,
-                                                 mock_db_destroy,
+    @mock.patch.object(dbapi.Connection, 'destroy_clusters')
+    def test_sync_cluster_status_stack_not_found(self, mock_db_destroy,
                                                  mock_cluster_list,
                                                  mock_get_driver):
         self.get_stacks.clear()
@@ -271,15 +279,14 @@ class PeriodicTestCase(base.TestCase):
                              self.cluster5.status)
             self.assertEqual('Stack 55 not found', self.cluster5.status_reason)
             mock_db_destroy.assert_has_calls([
-                mock.call(self.cluster2.uuid),
-                mock.call(self.cluster4.uuid)
-            ])
+                mock.call([self.cluster2.uuid], cert_refs=[]),
+                mock.call([self.cluster4.uuid], cert_refs=[])
+            ], any_order=True)
             self.assertEqual(2, mock_db_destroy.call_count)
             notifications = fake_notifier.NOTIFICATIONS
             self.assertEqual(5, len(notifications))
 
-    @mock.patch('oslo_service.loopingcall.FixedIntervalLoopingCall',
-                new=fakes.FakeLoopingCall)
+    @mock.patch('random.uniform', new=lambda a, b: a)
     @mock.patch('magnum.conductor.monitors.create_monitor')
     @mock.patch('magnum.objects.Cluster.list')
     @mock.patch('magnum.common.rpc.get_notifier')
@@ -298,10 +305,376 @@ class PeriodicTestCase(base.TestCase):
         monitor = mock.MagicMock(spec=k8s_monitor.K8sMonitor, name='test',
                                  data=health)
         mock_create_monitor.return_value = monitor
-        periodic.MagnumPeriodicTasks(CONF).sync_cluster_health_status(
-            self.context)
+        self.useFixture(fixtures.MockPatchObject(
+            dbapi.Connection, 'list_cluster_nodegroups',
+            mock_nodegroup_list))
+        tasks = periodic.MagnumPeriodicTasks(CONF)
+        tasks.sync_cluster_health_status(self.context)
 
         self.assertEqual(cluster_health_status.UNHEALTHY,
                          self.cluster4.health_status)
         self.assertEqual({'api': 'ok', 'node-0.Ready': 'False'},
                          self.cluster4.health_status_reason)
+        self.assertEqual(1, tasks.health_writer.pending)
+
+        with mock.patch.object(objects.Cluster,
+                               'update_health_status') as mock_update:
+            tasks.flush_cluster_health_status(self.context)
+        mock_update.assert_called_once_with(
+            self.context,
+            {self.cluster4.uuid: (cluster_health_status.UNHEALTHY,
+                                  {'api': 'ok', 'node-0.Ready': 'False'})})
+
+    @mock.patch.object(dbapi.Connection, 'list_cluster_nodegroups',
+                       mock_nodegroup_list)
+    @mock.patch.object(objects.Cluster, 'update_health_status')
+    def test_cluster_health_writer(self, mock_update_health):
+        writer = periodic.ClusterHealthWriter()
+        self.cluster1.health_status = cluster_health_status.HEALTHY
+        self.cluster1.health_status_reason = {'api': 'ok'}
+        self.cluster1.obj_reset_changes()
+        reason = {'api': 'ok', 'node-0.Ready': False}
+
+        self.assertFalse(writer.add(self.cluster1,
+                                    cluster_health_status.HEALTHY,
+                                    {'api': 'ok'}))
+        self.assertTrue(writer.add(self.cluster3,
+                                   cluster_health_status.UNHEALTHY, reason))
+        self.assertNotIn('health_status', self.cluster3.obj_what_changed())
+        self.assertEqual(1, writer.pending)
+
+        self.assertEqual(1, writer.flush(self.context))
+        mock_update_health.assert_called_once_with(
+            self.context,
+            {self.cluster3.uuid: (cluster_health_status.UNHEALTHY,
+                                  {'api': 'ok', 'node-0.Ready': 'False'})})
+        self.assertEqual(0, writer.pending)
+        self.assertEqual(1, len(fake_notifier.NOTIFICATIONS))
+        self.assertEqual('magnum.cluster.update.health',
+                         fake_notifier.NOTIFICATIONS[0].event_type)
+        self.assertEqual(0, writer.flush(self.context))
+        mock_update_health.assert_called_once()
+
+    @mock.patch.object(objects.Cluster, 'update_health_status')
+    def test_cluster_health_writer_flush_failure(self, mock_update_health):
+        mock_update_health.side_effect = ValueError('db down')
+        writer = periodic.ClusterHealthWriter()
+        writer.add(self.cluster3, cluster_health_status.UNHEALTHY, {})
+
+        self.assertRaises(ValueError, writer.flush, self.context)
+        self.assertEqual(1, writer.pending)
+        self.assertEqual(0, len(fake_notifier.NOTIFICATIONS))
+
+    @mock.patch.object(objects.Cluster, 'update_health_status')
+    def test_cluster_health_writer_change_reverted(self, mock_update_health):
+        writer = periodic.ClusterHealthWriter()
+        self.cluster3.health_status = cluster_health_status.HEALTHY
+        writer.add(self.cluster3, cluster_health_status.UNHEALTHY, {})
+        # the next poll comes back healthy before anything got written
+        cluster = objects.Cluster(
+            self.context, uuid=self.cluster3.uuid,
+            health_status=cluster_health_status.HEALTHY,
+            health_status_reason={})
+        writer.add(cluster, cluster_health_status.HEALTHY, {})
+
+        self.assertEqual(0, writer.flush(self.context))
+        self.assertFalse(mock_update_health.called)
+
+    def test_cluster_job_executor_skips_in_flight_cluster(self):
+        executor = periodic.ClusterJobExecutor('test', 2)
+        resubmitted = []
+
+        def job():
+            resubmitted.append(executor.submit('uuid1', job))
+            self.assertTrue(executor.is_in_flight('uuid1'))
+
+        self.assertTrue(executor.submit('uuid1', job))
+        self.assertEqual([False], resubmitted)
+        self.assertFalse(executor.is_in_flight('uuid1'))
+        stats = executor.statistics()
+        self.assertEqual(1, stats['executed'])
+        self.assertEqual(1, stats['skipped'])
+        self.assertEqual(0, stats['in_flight'])
+        self.assertEqual(0, stats['queue_depth'])
+
+    def test_cluster_job_executor_releases_failed_job(self):
+        executor = periodic.ClusterJobExecutor('test', 2)
+        job = mock.MagicMock(side_effect=ValueError('boom'))
+
+        self.assertTrue(executor.submit('uuid1', job))
+        self.assertFalse(executor.is_in_flight('uuid1'))
+        self.assertTrue(executor.submit('uuid1', job))
+        self.assertEqual(2, job.call_count)
+
+    @mock.patch.object(dbapi.Connection, 'list_cluster_nodegroups',
+                       mock_nodegroup_list)
+    @mock.patch('magnum.drivers.common.driver.Driver.get_driver_for_cluster')
+    @mock.patch('magnum.objects.Cluster.list')
+    def test_sync_cluster_status_skips_in_flight(self, mock_cluster_list,
+                                                 mock_get_driver):
+        mock_cluster_list.return_value = [self.cluster1, self.cluster3]
+        mock_get_driver.return_value = self.mock_driver
+        tasks = periodic.MagnumPeriodicTasks(CONF)
+        tasks.status_executor._in_flight.add(self.cluster1.uuid)
+
+        tasks.sync_cluster_status(None)
+
+        self.mock_driver.update_cluster_status.assert_called_once_with(
+            mock.ANY, self.cluster3)
+        self.assertEqual(cluster_status.CREATE_IN_PROGRESS,
+                         self.cluster1.status)
+        self.assertEqual(cluster_status.UPDATE_COMPLETE,
+                         self.cluster3.status)
+
+    @mock.patch.object(dbapi.Connection, 'list_cluster_nodegroups',
+                       mock_nodegroup_list)
+    @mock.patch('magnum.drivers.common.driver.Driver.get_driver_for_cluster')
+    @mock.patch('magnum.objects.Cluster.list')
+    def test_sync_cluster_status_only_local_clusters(self, mock_cluster_list,
+                                                     mock_get_driver):
+        mock_cluster_list.return_value = [self.cluster1, self.cluster3]
+        mock_get_driver.return_value = self.mock_driver
+        tasks = periodic.MagnumPeriodicTasks(CONF)
+        owners = {self.cluster1.uuid: 'other-host',
+                  self.cluster3.uuid: CONF.host}
+        ring = mock.MagicMock()
+        ring.get_host.side_effect = owners.get
+
+        with mock.patch.object(tasks.ring_manager, 'get_ring',
+                               return_value=ring):
+            tasks.sync_cluster_status(None)
+
+        self.mock_driver.update_cluster_status.assert_called_once_with(
+            mock.ANY, self.cluster3)
+
+    @mock.patch.object(dbapi.Connection, 'list_cluster_nodegroups',
+                       mock_nodegroup_list)
+    @mock.patch('magnum.drivers.common.driver.Driver.get_driver_for_cluster')
+    @mock.patch('magnum.objects.Cluster.list')
+    def test_sync_cluster_status_sharding_disabled(self, mock_cluster_list,
+                                                   mock_get_driver):
+        self.config(periodic_shard_clusters=False, group='conductor')
+        mock_cluster_list.return_value = [self.cluster1, self.cluster3]
+        mock_get_driver.return_value = self.mock_driver
+        tasks = periodic.MagnumPeriodicTasks(CONF)
+
+        tasks.sync_cluster_status(None)
+
+        self.assertIsNone(tasks.ring_manager)
+        self.assertEqual(
+            2, self.mock_driver.update_cluster_status.call_count)
+
+    @mock.patch.object(periodic.k8s_node_watch, 'stop_watcher')
+    @mock.patch.object(periodic.cert_manager,
+                       'delete_certificates_from_clusters')
+    @mock.patch.object(dbapi.Connection, 'destroy_clusters')
+    def test_purge_clusters(self, mock_db_destroy, mock_delete_certs,
+                            mock_stop_watcher):
+        mock_delete_certs.return_value = ['cert1', 'cert2']
+        clusters = [self.cluster2, self.cluster4]
+        uuids = [self.cluster2.uuid, self.cluster4.uuid]
+
+        periodic.purge_clusters(self.context, clusters)
+
+        mock_delete_certs.assert_called_once_with(clusters,
+                                                  context=self.context)
+        mock_db_destroy.assert_called_once_with(
+            uuids, cert_refs=['cert1', 'cert2'])
+        self.assertEqual(2, mock_stop_watcher.call_count)
+
+    @mock.patch.object(objects.Stats, 'reconcile')
+    def test_reconcile_project_stats(self, mock_reconcile):
+        tasks = periodic.MagnumPeriodicTasks(CONF)
+        ring = mock.MagicMock()
+
+        ring.get_host.return_value = 'other-host'
+        with mock.patch.object(tasks.ring_manager, 'get_ring',
+                               return_value=ring):
+            tasks.reconcile_project_stats(None)
+        self.assertFalse(mock_reconcile.called)
+
+        ring.get_host.return_value = CONF.host
+        with mock.patch.object(tasks.ring_manager, 'get_ring',
+                               return_value=ring):
+            tasks.reconcile_project_stats(None)
+        mock_reconcile.assert_called_once_with(mock.ANY)
+
+    @mock.patch.object(dbapi.Connection, 'list_cluster_nodegroups',
+                       mock_nodegroup_list)
+    @mock.patch.object(dbapi.Connection, 'destroy_clusters')
+    @mock.patch('magnum.drivers.common.driver.Driver.get_driver_for_cluster')
+    @mock.patch('magnum.objects.Cluster.list')
+    def test_sync_cluster_status_batched(self, mock_cluster_list,
+                                         mock_get_driver, mock_db_destroy):
+        batches = []
+        update_status = self.mock_driver.update_cluster_status.side_effect
+
+        class BatchedDriver(driver.Driver):
+            provides = []
+            create_cluster = update_cluster = delete_cluster = None
+            upgrade_cluster = resize_cluster = None
+            create_federation = update_federation = None
+            delete_federation = None
+            create_nodegroup = update_nodegroup = delete_nodegroup = None
+
+            def update_clusters_status(self, context, clusters):
+                batches.append(list(clusters))
+                for cluster in clusters:
+                    update_status(context, cluster)
+
+        mock_cluster_list.return_value = [self.cluster1, self.cluster3,
+                                          self.cluster4]
+        mock_get_driver.return_value = BatchedDriver()
+
+        periodic.MagnumPeriodicTasks(CONF).sync_cluster_status(None)
+
+        self.assertEqual([[self.cluster1, self.cluster3, self.cluster4]],
+                         batches)
+        mock_get_driver.assert_called_once_with(mock.ANY, self.cluster1)
+        self.assertEqual(cluster_status.CREATE_COMPLETE,
+                         self.cluster1.status)
+        self.assertEqual(cluster_status.UPDATE_COMPLETE,
+                         self.cluster3.status)
+        mock_db_destroy.assert_called_once_with([self.cluster4.uuid],
+                                                cert_refs=[])
+        self.assertEqual(3, len(fake_notifier.NOTIFICATIONS))
+
+    @mock.patch('magnum.drivers.common.driver.Driver.get_driver_for_cluster')
+    @mock.patch('magnum.objects.Cluster.list')
+    def test_sync_cluster_status_driver_not_found(self, mock_cluster_list,
+                                                  mock_get_driver):
+        mock_cluster_list.return_value = [self.cluster1, self.cluster3]
+        mock_get_driver.side_effect = ValueError('no driver')
+
+        periodic.MagnumPeriodicTasks(CONF).sync_cluster_status(None)
+
+        mock_get_driver.assert_called_once_with(mock.ANY, self.cluster1)
+        self.assertEqual(cluster_status.CREATE_IN_PROGRESS,
+                         self.cluster1.status)
+
+
+class ClusterHealthSchedulerTestCase(base.TestCase):
+
+    def setUp(self):
+        super(ClusterHealthSchedulerTestCase, self).setUp()
+        self.config(health_polling_interval=60,
+                    health_polling_max_interval=300,
+                    health_polling_unhealthy_interval=20,
+                    health_polling_jitter=0.0,
+                    group='kubernetes')
+        self.scheduler = periodic.ClusterHealthScheduler()
+        self.cluster = objects.Cluster(
+            uuid=uuidutils.generate_uuid(),
+            status=cluster_status.CREATE_COMPLETE,
+            health_status=cluster_health_status.HEALTHY)
+
+    @mock.patch('random.uniform')
+    def test_initial_poll_is_spread(self, mock_uniform):
+        mock_uniform.return_value = 30
+        self.assertFalse(self.scheduler.is_due(self.cluster, now=0))
+        mock_uniform.assert_called_once_with(0, 60)
+        self.assertFalse(self.scheduler.is_due(self.cluster, now=29))
+        self.assertTrue(self.scheduler.is_due(self.cluster, now=30))
+
+    def test_healthy_cluster_backs_off_up_to_max(self):
+        intervals = []
+        for now in range(0, 6000, 1000):
+            self.scheduler.record(self.cluster, now=now)
+            intervals.append(self.scheduler.interval(self.cluster.uuid))
+        self.assertEqual([60, 120, 240, 300, 300, 300], intervals)
+        self.assertFalse(self.scheduler.is_due(self.cluster, now=5299))
+        self.assertTrue(self.scheduler.is_due(self.cluster, now=5300))
+
+    def test_unhealthy_cluster_polled_often(self):
+        for now in (0, 1000):
+            self.scheduler.record(self.cluster, now=now)
+        self.cluster.health_status = cluster_health_status.UNHEALTHY
+        self.scheduler.record(self.cluster, now=2000)
+        self.assertEqual(20, self.scheduler.interval(self.cluster.uuid))
+        self.assertTrue(self.scheduler.is_due(self.cluster, now=2020))
+
+    def test_health_change_resets_backoff(self):
+        self.cluster.health_status = cluster_health_status.UNKNOWN
+        self.scheduler.record(self.cluster, now=0)
+        self.assertEqual(20, self.scheduler.interval(self.cluster.uuid))
+        self.cluster.health_status = cluster_health_status.HEALTHY
+        self.scheduler.record(self.cluster, now=20)
+        self.assertEqual(60, self.scheduler.interval(self.cluster.uuid))
+
+    def test_status_change_polls_immediately(self):
+        for now in (0, 1000, 2000):
+            self.scheduler.record(self.cluster, now=now)
+        self.cluster.status = cluster_status.UPDATE_IN_PROGRESS
+        self.assertTrue(self.scheduler.is_due(self.cluster, now=2001))
+        self.scheduler.record(self.cluster, now=2001)
+        self.assertEqual(60, self.scheduler.interval(self.cluster.uuid))
+
+    def test_jitter(self):
+        self.config(health_polling_jitter=0.5, group='kubernetes')
+        with mock.patch('random.uniform', return_value=-30) as mock_uniform:
+            self.scheduler.record(self.cluster, now=0)
+        mock_uniform.assert_called_once_with(-30.0, 30.0)
+        self.assertTrue(self.scheduler.is_due(self.cluster, now=30))
+
+    def test_prune(self):
+        self.scheduler.record(self.cluster, now=0)
+        self.scheduler.prune([])
+        self.assertIsNone(self.scheduler.interval(self.cluster.uuid))
+
+
+class ClusterUpdateJobTestCase(db_base.DbTestCase):
+
+    def setUp(self):
+        super(ClusterUpdateJobTestCase, self).setUp()
+        clusters = [utils.create_test_cluster(
+            uuid=uuidutils.generate_uuid(), name='cluster%d' % i,
+            status=cluster_status.CREATE_IN_PROGRESS) for i in range(2)]
+        self.clusters = [objects.Cluster.get_by_uuid(self.context, c.uuid)
+                         for c in clusters]
+        # another writer saves the first cluster after the sync read it
+        other = objects.Cluster.get_by_uuid(self.context, clusters[0].uuid)
+        other.status_reason = 'updated elsewhere'
+        other.save()
+
+        self.synced = []
+
+        def update_cluster_status(context, cluster):
+            self.synced.append(cluster.uuid)
+            cluster.status = cluster_status.CREATE_COMPLETE
+            cluster.status_reason = 'synced'
+            cluster.save()
+
+        self.mock_driver = mock.MagicMock()
+        self.mock_driver.update_cluster_status.side_effect = (
+            update_cluster_status)
+
+    def _assert_synced(self, cluster):
+        db_cluster = objects.Cluster.get_by_uuid(self.context, cluster.uuid)
+        self.assertEqual(cluster_status.CREATE_COMPLETE, db_cluster.status)
+        self.assertEqual('synced', db_cluster.status_reason)
+        self.assertEqual(db_cluster.generation, cluster.generation)
+
+    def test_update_status_stale_generation(self):
+        cluster = self.clusters[0]
+        job = periodic.ClusterUpdateJob(self.context, cluster,
+                                        self.mock_driver)
+
+        self.assertRaises(periodic.loopingcall.LoopingCallDone,
+                          job.update_status)
+
+        self.assertEqual([cluster.uuid, cluster.uuid], self.synced)
+        self._assert_synced(cluster)
+
+    def test_batch_update_status_stale_generation(self):
+        self.mock_driver.update_clusters_status.side_effect = (
+            functools.partial(driver.Driver.update_clusters_status,
+                              self.mock_driver))
+        job = periodic.ClusterBatchUpdateJob(self.context, self.mock_driver,
+                                             self.clusters)
+
+        self.assertRaises(periodic.loopingcall.LoopingCallDone,
+                          job.update_status)
+
+        self.assertEqual(2, self.mock_driver.update_clusters_status.call_count)
+        for cluster in self.clusters:
+            self._assert_synced(cluster)